@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+from paths import cache_dir
+
+DEFAULT_TTL = 600 # seconds a cached answer is served without asking the API again
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0 # served from the cache without any network use
+    misses: int = 0 # fetched in full from the network
+    revalidations: int = 0 # conditional request answered with 304 Not Modified
+    stale: int = 0 # network failed, an expired entry was served instead
+    requests: int = 0 # network round-trips made
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class MetadataCache:
+    """
+    An on-disk cache of JSON API answers keyed by URL.
+
+    Fresh entries (younger than ttl) are served directly. Expired entries are revalidated with
+    If-None-Match/If-Modified-Since, and are still served if the network can't be reached.
+    """
+
+    def __init__(self, directory: str|None = None, ttl: float = DEFAULT_TTL):
+        self.directory = directory or cache_dir("api")
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._memory: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key: str) -> dict|None:
+        """
+        It returns the cached entry of the key (from memory, then from disk) or None.
+
+        :param key: The key of the entry, usually the URL of the endpoint
+        :return: A dict with the keys "data", "etag", "last_modified" and "fetched_at".
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                return entry
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._memory[key] = entry
+            return entry
+
+    def put(self, key: str, data, etag: str|None = None, last_modified: str|None = None) -> dict:
+        """
+        It stores the data of the key in memory and atomically on disk.
+
+        :param key: The key of the entry
+        :param data: The JSON-serializable data to store
+        :param etag: The ETag header of the response, if any
+        :param last_modified: The Last-Modified header of the response, if any
+        :return: The stored entry.
+        """
+        entry = {"key": key, "data": data, "etag": etag, "last_modified": last_modified, "fetched_at": time.time()}
+        self._write(key, entry)
+        return entry
+
+    def touch(self, key: str, entry: dict) -> dict:
+        """
+        It marks an entry as fresh again, used when the API answered 304 Not Modified.
+        """
+        entry = dict(entry, fetched_at=time.time())
+        self._write(key, entry)
+        return entry
+
+    def _write(self, key: str, entry: dict):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._lock:
+            self._memory[key] = entry
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(entry, f)
+                os.replace(tmp_path, path)
+            except OSError:
+                pass # the cache is an optimization, an unwritable disk must not break the API calls
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self.stats, name, getattr(self.stats, name) + 1)
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry.get("fetched_at", 0) < self.ttl
+
+    def invalidate(self, key: str|None = None):
+        """
+        It removes the entry of the key, or every entry if no key is given.
+
+        :param key: The key to remove, defaults to None (everything)
+        """
+        with self._lock:
+            if key is not None:
+                self._memory.pop(key, None)
+                paths = [self._path(key)]
+            else:
+                self._memory.clear()
+                paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".json")]
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def fetch(self, url: str, get) -> object:
+        """
+        It returns the JSON answer of the url, using the cache when possible.
+
+        :param url: The URL of the endpoint
+        :param get: A callable get(url, headers) returning a requests-like response
+        :return: The decoded JSON data.
+
+        Responses other than 200/304 raise through response.raise_for_status(). Network errors are
+        only raised if nothing is cached.
+        """
+        entry = self.get(url)
+        if entry is not None and self.is_fresh(entry):
+            self._count("hits")
+            return entry["data"]
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            self._count("requests")
+            response = get(url, headers)
+        except OSError: # requests.RequestException is an OSError
+            if entry is None:
+                raise
+            self._count("stale")
+            return entry["data"]
+        if response.status_code == 304 and entry is not None:
+            self._count("revalidations")
+            return self.touch(url, entry)["data"]
+        response.raise_for_status()
+        data = response.json()
+        self._count("misses")
+        self.put(url, data, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return data
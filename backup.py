@@ -0,0 +1,340 @@
+"""
+Incremental, deduplicated backups of server folders.
+
+The files are stored once in a content-addressed store, by SHA-256. Region files (.mca: the
+region/, entities/ and poi/ folders of every dimension) are split into their chunks, so a backup
+only stores the chunks that changed since the previous one:
+
+backups/objects/ab/abcd...           a file, a chunk, a region header or a region recipe
+backups/manifests/lobby/20240102-030405.json
+
+A manifest lists the files of the server with their size, mtime and object. A region file is a
+recipe: the object of its 8 KiB header and those of its chunks, in the order of the header. The
+files whose size and mtime are the same as in the previous backup are not read again, and the
+others are hashed on a process pool.
+
+Restores can be limited to some paths (a dimension folder, a region file...). A restored region
+file has the same chunks at the same offsets as the original.
+"""
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from hashlib import sha256 as new_sha256
+
+SECTOR = 4096
+HEADER_SIZE = 2 * SECTOR # 1024 chunk locations then 1024 timestamps
+MANIFEST_DIR = "manifests"
+OBJECTS_DIR = "objects"
+EXCLUDED = ("logs", "crash-reports", "cache", "libraries", "versions") # at the root of the server
+EXCLUDED_FILES = ("session.lock",) # at any depth, Minecraft locks world/, world_nether/ and world_the_end/
+PRUNE_GRACE = 3600 # seconds during which a new object is kept by prune, a running backup may not have its manifest yet
+REGION_DIRS = ("region", "entities", "poi")
+
+
+class BackupError(Exception):
+    """
+    Raised when a backup can't be made, found or restored.
+    """
+
+
+@dataclass
+class BackupStats:
+    files: int = 0
+    skipped: int = 0 # unchanged since the previous backup, not read
+    hashed: int = 0
+    chunks: int = 0 # in the hashed region files
+    new_objects: int = 0
+    new_bytes: int = 0
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        return f"{self.files} files ({self.skipped} unchanged, {self.hashed} hashed, {self.chunks} chunks), {self.new_objects} new objects ({self.new_bytes / 1024 ** 2:.1f} MB) in {self.seconds:.2f}s"
+
+
+@dataclass
+class Manifest:
+    server: str
+    id: str
+    created: float
+    source: str
+    files: dict[str, dict] = field(default_factory=dict) # path: {"size", "mtime_ns", "kind", "sha256"}
+    stats: dict = field(default_factory=dict)
+
+
+def is_region_file(relative: str) -> bool:
+    parts = relative.split("/")
+    return relative.endswith(".mca") and len(parts) >= 2 and parts[-2] in REGION_DIRS
+
+
+def object_path(store: str, sha256: str) -> str:
+    return os.path.join(store, OBJECTS_DIR, sha256[:2], sha256)
+
+
+def put_object(store: str, data: bytes) -> tuple[str, int]:
+    """
+    It stores data unless it is already stored.
+
+    :return: Its SHA-256 and the number of bytes written (0 if it was already stored).
+    """
+    sha256 = new_sha256(data).hexdigest()
+    path = object_path(store, sha256)
+    if os.path.exists(path):
+        return sha256, 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return sha256, len(data)
+
+
+def get_object(store: str, sha256: str) -> bytes:
+    try:
+        with open(object_path(store, sha256), "rb") as f:
+            return f.read()
+    except OSError as e:
+        raise BackupError(f"Missing object {sha256} in {store}") from e
+
+
+def region_chunks(data: bytes) -> list[tuple[int, bytes]]:
+    """
+    It returns the (sector offset, data) of the chunks of a region file, in the order of its
+    header. The data of a chunk is its 4-byte length, its compression type and its payload.
+    """
+    chunks = []
+    for i in range(1024):
+        entry = int.from_bytes(data[i * 4:i * 4 + 4], "big")
+        offset, sectors = entry >> 8, entry & 0xff
+        if not offset or not sectors:
+            continue
+        start = offset * SECTOR
+        length = int.from_bytes(data[start:start + 4], "big")
+        if start + 4 + length > len(data) or length > sectors * SECTOR:
+            raise ValueError(f"Chunk {i} is outside of the file")
+        chunks.append((offset, data[start:start + 4 + length]))
+    return chunks
+
+
+def store_file(job: tuple[str, str, str]) -> tuple[str, dict, int, int, int]:
+    """
+    It stores a file, a region file as its chunks. Runs in the process pool.
+
+    :param job: The store, the path of the file and its path relative to the server
+    :return: The relative path, the manifest entry, the number of chunks, of new objects and of new bytes.
+    """
+    store, path, relative = job
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    entry = {"size": len(data), "mtime_ns": st.st_mtime_ns}
+    new_objects, new_bytes, chunk_count = 0, 0, 0
+    def put(blob: bytes) -> str:
+        nonlocal new_objects, new_bytes
+        sha256, written = put_object(store, blob)
+        new_objects += bool(written)
+        new_bytes += written
+        return sha256
+    chunks = None
+    if is_region_file(relative) and len(data) >= HEADER_SIZE:
+        try:
+            chunks = region_chunks(data)
+        except ValueError: # a corrupted region file is kept as a whole
+            chunks = None
+    if chunks is None:
+        entry.update(kind="file", sha256=put(data))
+    else:
+        recipe = {"size": len(data), "header": put(data[:HEADER_SIZE]), "chunks": [put(chunk) for _, chunk in chunks]}
+        entry.update(kind="region", sha256=put(json.dumps(recipe).encode()))
+        chunk_count = len(chunks)
+    return relative, entry, chunk_count, new_objects, new_bytes
+
+
+def rebuild_region(store: str, recipe: dict) -> bytes:
+    header = get_object(store, recipe["header"])
+    data = bytearray(recipe["size"])
+    data[:HEADER_SIZE] = header
+    chunks = iter(recipe["chunks"])
+    for i in range(1024):
+        entry = int.from_bytes(header[i * 4:i * 4 + 4], "big")
+        if entry >> 8 and entry & 0xff:
+            chunk = get_object(store, next(chunks))
+            start = (entry >> 8) * SECTOR
+            data[start:start + len(chunk)] = chunk
+    return bytes(data)
+
+
+class BackupStore:
+    """
+    A store of backups, shared by any number of servers, see the module docstring.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+
+    def manifest_dir(self, server: str) -> str:
+        return os.path.join(self.directory, MANIFEST_DIR, server)
+
+    def backups(self, server: str) -> list[str]:
+        """
+        It returns the ids of the backups of a server, oldest first.
+        """
+        try:
+            return sorted(name.removesuffix(".json.gz") for name in os.listdir(self.manifest_dir(server)) if name.endswith(".json.gz"))
+        except OSError:
+            return []
+
+    def manifest(self, server: str, backup_id: str|None = None) -> Manifest:
+        """
+        It returns a manifest of a server, the latest one by default.
+        """
+        backup_id = backup_id or (self.backups(server) or [None])[-1]
+        if backup_id is None:
+            raise BackupError(f"{server} has no backup in {self.directory}")
+        try:
+            with gzip.open(os.path.join(self.manifest_dir(server), backup_id + ".json.gz"), "rt", encoding="utf-8") as f:
+                return Manifest(**json.load(f))
+        except (OSError, ValueError) as e:
+            raise BackupError(f"No backup {backup_id} of {server}") from e
+
+    def scan(self, server_folder: str) -> dict[str, os.stat_result]:
+        """
+        It returns the files of a server to back up, by path relative to the server (with /).
+        """
+        files = {}
+        server_folder = os.path.abspath(server_folder)
+        for root, dirs, names in os.walk(server_folder):
+            relative = os.path.relpath(root, server_folder).replace(os.sep, "/")
+            relative = "" if relative == "." else relative + "/"
+            if not relative:
+                dirs[:] = [name for name in dirs if name not in EXCLUDED]
+                names = [name for name in names if name not in EXCLUDED and not name.endswith(".jar")]
+            names = [name for name in names if name not in EXCLUDED_FILES]
+            dirs[:] = [name for name in dirs if os.path.join(root, name) != self.directory]
+            for name in names:
+                path = os.path.join(root, name)
+                if not os.path.islink(path) and os.path.isfile(path):
+                    files[relative + name] = os.stat(path)
+        return files
+
+    def backup(self, server_folder: str, server: str|None = None, max_workers: int|None = None) -> tuple[Manifest, BackupStats]:
+        """
+        It backs a server folder up. The files that didn't change since the previous backup are
+        not read, the others are hashed and stored on a process pool.
+
+        :param server_folder: The folder of the server, better stopped or with save-off
+        :param server: The name of the server in the store, defaults to the name of its folder
+        :param max_workers: The size of the process pool, defaults to the number of CPUs
+        """
+        server = server or os.path.basename(os.path.abspath(server_folder))
+        try:
+            previous = self.manifest(server).files
+        except BackupError:
+            previous = {}
+        stats = BackupStats()
+        manifest = Manifest(server, time.strftime("%Y%m%d-%H%M%S"), time.time(), os.path.abspath(server_folder))
+        while manifest.id in self.backups(server):
+            time.sleep(0.5)
+            manifest.id = time.strftime("%Y%m%d-%H%M%S")
+        start = time.perf_counter()
+        jobs = []
+        for relative, st in sorted(self.scan(server_folder).items()):
+            stats.files += 1
+            old = previous.get(relative)
+            if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns and os.path.exists(object_path(self.directory, old["sha256"])):
+                manifest.files[relative] = old
+                stats.skipped += 1
+            else:
+                jobs.append((self.directory, os.path.join(server_folder, *relative.split("/")), relative))
+        if jobs:
+            os.makedirs(os.path.join(self.directory, OBJECTS_DIR), exist_ok=True)
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                for relative, entry, chunks, new_objects, new_bytes in executor.map(store_file, jobs, chunksize=max(1, len(jobs) // 64)):
+                    manifest.files[relative] = entry
+                    stats.hashed += 1
+                    stats.chunks += chunks
+                    stats.new_objects += new_objects
+                    stats.new_bytes += new_bytes
+        stats.seconds = time.perf_counter() - start
+        manifest.stats = asdict(stats)
+        os.makedirs(self.manifest_dir(server), exist_ok=True)
+        path = os.path.join(self.manifest_dir(server), manifest.id + ".json.gz")
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            json.dump(asdict(manifest), f)
+        os.replace(path + ".tmp", path)
+        return manifest, stats
+
+    def restore(self, manifest: Manifest, dest_folder: str, only: list[str]|None = None) -> int:
+        """
+        It restores the files of a backup into a server folder (stopped), replacing them.
+
+        :param manifest: The backup, see manifest
+        :param dest_folder: The folder of the server
+        :param only: Restore only these paths relative to the server, or the files under them
+        (e.g. "world_nether" or "world/region/r.0.0.mca"), defaults to everything
+        :return: The number of files restored.
+        """
+        prefixes = [path.replace(os.sep, "/").strip("/") for path in only or []]
+        selected = [relative for relative in manifest.files if not prefixes or any(relative == prefix or relative.startswith(prefix + "/") for prefix in prefixes)]
+        if prefixes and not selected:
+            raise BackupError(f"Nothing in backup {manifest.id} matches {', '.join(prefixes)}")
+        for relative in selected:
+            entry = manifest.files[relative]
+            data = get_object(self.directory, entry["sha256"])
+            if entry["kind"] == "region":
+                data = rebuild_region(self.directory, json.loads(data))
+            path = os.path.join(dest_folder, *relative.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".restore", "wb") as f:
+                f.write(data)
+            os.replace(path + ".restore", path)
+            os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"])) # so the next backup skips it
+        return len(selected)
+
+    def prune(self, server: str, keep: int) -> tuple[int, int]:
+        """
+        It deletes the oldest backups of a server, keeping keep of them, then the objects no
+        backup of any server uses anymore.
+
+        It shouldn't run during a backup to the same store: the objects written in the last
+        PRUNE_GRACE seconds and the files being written (.tmp) are kept, but an old unused object
+        that the running backup finds already stored would be deleted.
+
+        :return: The number of backups and of objects deleted.
+        """
+        backups = self.backups(server)
+        deleted = backups[:max(0, len(backups) - keep)]
+        for backup_id in deleted:
+            os.remove(os.path.join(self.manifest_dir(server), backup_id + ".json.gz"))
+        try:
+            servers = os.listdir(os.path.join(self.directory, MANIFEST_DIR))
+        except FileNotFoundError: # no backup yet
+            return len(deleted), 0
+        used = set()
+        for name in servers:
+            for backup_id in self.backups(name):
+                for entry in self.manifest(name, backup_id).files.values():
+                    used.add(entry["sha256"])
+                    if entry["kind"] == "region":
+                        recipe = json.loads(get_object(self.directory, entry["sha256"]))
+                        used.add(recipe["header"])
+                        used.update(recipe["chunks"])
+        removed, recent = 0, time.time() - PRUNE_GRACE
+        for root, _, names in os.walk(os.path.join(self.directory, OBJECTS_DIR)):
+            for name in names:
+                path = os.path.join(root, name)
+                if name not in used and not name.endswith(".tmp") and os.path.getmtime(path) < recent:
+                    os.remove(path)
+                    removed += 1
+        return len(deleted), removed
+
+
+def default_store(server_folder: str) -> str:
+    """
+    It returns the default store of a server: backups/ next to its folder, shared by the servers
+    of the same folder.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(server_folder)), "backups")
+
@@ -0,0 +1,170 @@
+"""
+A local stand-in of the PaperMC v2 API, for the benchmarks: same endpoints and answers, with a
+configurable latency, bandwidth and jar size. The requests are counted by operation.
+
+Usage:
+python benchmarks/paper_standin.py [--port 8081] [--latency 0.05] [--bandwidth 20] [--jar-size 40]
+then MSM_PAPER_API=http://127.0.0.1:8081/v2/projects/paper/
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "/v2/projects/paper/"
+
+ROUTE = re.compile(r"^/v2/projects/paper/(?:versions/([^/]+)/(?:builds/(\d+)/(?:downloads/([^/]+))?)?)?$")
+
+CHUNK_SIZE = 64 * 1024
+
+
+class PaperStandIn(ThreadingHTTPServer):
+    """
+    The HTTP server of the stand-in, see the module docstring.
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, bandwidth: float|None = None, jar_size: int = 40 * 1024 ** 2, versions: list[str]|None = None, builds: int = 50):
+        """
+        :param latency: Seconds added before every answer
+        :param bandwidth: Bytes per second of every download, None for no limit
+        :param jar_size: The size of the jars, in bytes
+        :param versions: The versions of the API, oldest first
+        :param builds: How many builds each version has
+        """
+        super().__init__((host, port), StandInHandler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.versions = versions or ["1.18.2", "1.19.4", "1.20.4", "1.20.6", "1.21.1"]
+        self.builds = list(range(100, 100 + builds))
+        self.jar = random.Random(jar_size).randbytes(jar_size) # the same bytes for every run
+        self.sha256 = hashlib.sha256(self.jar).hexdigest()
+        self.etag = f'"{self.sha256[:16]}"'
+        self.counts: dict[str, int] = {}
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}{PREFIX}"
+
+    def count(self, operation: str, sent: int = 0):
+        with self._lock:
+            self.counts[operation] = self.counts.get(operation, 0) + 1
+            self.bytes_sent += sent
+
+    def reset(self) -> dict:
+        """
+        It returns the request counts and the bytes sent so far, and resets them.
+        """
+        with self._lock:
+            result = {"requests": dict(self.counts), "total_requests": sum(self.counts.values()), "bytes_sent": self.bytes_sent}
+            self.counts, self.bytes_sent = {}, 0
+        return result
+
+    def start(self) -> "PaperStandIn":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: PaperStandIn
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head: bool = False):
+        time.sleep(self.server.latency)
+        match = ROUTE.match(self.path.split("?")[0])
+        if not match:
+            return self.send_json(404, {"error": "Not found"}, "unknown")
+        version, build, download = match.groups()
+        if version and version not in self.server.versions or build and int(build) not in self.server.builds:
+            return self.send_json(404, {"error": "Not found"}, "not_found")
+        if download:
+            return self.send_jar(head)
+        if build:
+            return self.send_json(200, {"project_id": "paper", "version": version, "build": int(build), "channel": "default", "downloads": {"application": {"name": f"paper-{version}-{build}.jar", "sha256": self.server.sha256}}}, "build")
+        if version:
+            return self.send_json(200, {"project_id": "paper", "version": version, "builds": self.server.builds}, "builds")
+        return self.send_json(200, {"project_id": "paper", "versions": self.server.versions}, "versions")
+
+    def send_json(self, status: int, data: dict, operation: str):
+        body = json.dumps(data).encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            self.server.count(operation + "_304")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.server.count(operation, len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 200:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_jar(self, head: bool):
+        jar = self.server.jar
+        start, end, status = 0, len(jar) - 1, 200
+        range_header = self.headers.get("Range")
+        if range_header and (self.headers.get("If-Range") in (None, self.server.etag)):
+            first, _, last = range_header.removeprefix("bytes=").partition("-")
+            start, end = int(first), int(last) if last else len(jar) - 1
+            if start >= len(jar):
+                self.server.count("download_416")
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(jar)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+        self.server.count("download_head" if head else "download_range" if status == 206 else "download", 0 if head else end - start + 1)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/java-archive")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", self.server.etag)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(jar)}")
+        self.end_headers()
+        if head:
+            return
+        view = memoryview(jar)[start:end + 1]
+        for offset in range(0, len(view), CHUNK_SIZE):
+            chunk = view[offset:offset + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            if self.server.bandwidth:
+                time.sleep(len(chunk) / self.server.bandwidth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A local stand-in of the PaperMC v2 API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added before every answer.")
+    parser.add_argument("--bandwidth", type=float, help="MB/s of every download, no limit by default.")
+    parser.add_argument("--jar-size", type=float, default=40, help="The size of the jars, in MB.")
+    args = parser.parse_args()
+    server = PaperStandIn(args.host, args.port, args.latency, args.bandwidth * 1024 ** 2 if args.bandwidth else None, int(args.jar_size * 1024 ** 2))
+    print(f"PaperMC stand-in on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
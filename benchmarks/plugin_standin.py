@@ -0,0 +1,210 @@
+"""
+A local stand-in of the Modrinth v2 and Hangar v1 APIs, for trying the plugin resolver without the
+internet: a small catalog of plugins (with dependencies, Minecraft versions, betas and a plugin
+too old for recent servers) and jars of random bytes. The requests are counted by operation.
+
+Usage:
+python benchmarks/plugin_standin.py [--port 8082] [--latency 0.05] [--jar-size 512]
+then MSM_MODRINTH_API=http://127.0.0.1:8082/modrinth/v2/ MSM_HANGAR_API=http://127.0.0.1:8082/hangar/api/v1/
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+ALL_VERSIONS = ["1.19.4", "1.20.4", "1.20.6", "1.21.1"]
+
+# slug: (id, [(version, version_type, game versions, required dependencies by slug)])
+MODRINTH_CATALOG = {
+    "luckperms": ("Vebnzrzj", [("5.4.100", "release", ALL_VERSIONS[:3], []), ("5.4.120", "release", ALL_VERSIONS[1:], [])]),
+    "worldedit": ("1u6JkXh5", [("7.2.15", "release", ALL_VERSIONS[:2], []), ("7.3.0", "release", ALL_VERSIONS[1:], []), ("7.3.1-beta-01", "beta", ALL_VERSIONS[1:], [])]),
+    "worldguard": ("DKY9btbd", [("7.0.9", "release", ALL_VERSIONS[:2], ["worldedit"]), ("7.0.10", "release", ALL_VERSIONS[1:], ["worldedit"])]),
+    "essentialsx": ("hXiIvTyT", [("2.20.1", "release", ALL_VERSIONS, [])]),
+    "essentialsx-chat": ("2qgyQbO1", [("2.20.1", "release", ALL_VERSIONS, ["essentialsx"])]),
+    "oldplugin": ("0ldP1ugn", [("1.0.0", "release", ["1.16.5"], [])]),
+}
+
+# slug: [(version, channel, Minecraft versions, required dependencies by slug)]
+HANGAR_CATALOG = {
+    "ViaVersion": [("4.9.2", "Release", ALL_VERSIONS[:2], []), ("5.0.1", "Release", ALL_VERSIONS, [])],
+    "ViaBackwards": [("5.0.1", "Release", ALL_VERSIONS, ["ViaVersion"])],
+}
+
+# slug: (id, display name), dependencies are given by display name and id like Hangar, not by slug
+HANGAR_PROJECTS = {"ViaVersion": (1, "Via Version"), "ViaBackwards": (2, "Via Backwards")}
+
+MODRINTH_ROUTE = re.compile(r"^/modrinth/v2/project/([^/]+)/version$")
+HANGAR_ROUTE = re.compile(r"^/hangar/api/v1/projects/([^/]+)/versions$")
+HANGAR_PROJECT_ROUTE = re.compile(r"^/hangar/api/v1/projects/([^/]+)$")
+FILE_ROUTE = re.compile(r"^/files/([^/]+)$")
+
+
+class PluginStandIn(ThreadingHTTPServer):
+    """
+    The HTTP server of the stand-in, see the module docstring.
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jar_size: int = 512 * 1024):
+        """
+        :param latency: Seconds added before every answer
+        :param jar_size: The size of the jars, in bytes
+        """
+        super().__init__((host, port), PluginHandler)
+        self.latency = latency
+        self.jar_size = jar_size
+        self.jars: dict[str, bytes] = {}
+        self.counts: dict[str, int] = {}
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/"
+
+    @property
+    def modrinth_url(self) -> str:
+        return self.base_url + "modrinth/v2/"
+
+    @property
+    def hangar_url(self) -> str:
+        return self.base_url + "hangar/api/v1/"
+
+    def jar(self, filename: str) -> bytes:
+        with self._lock:
+            if filename not in self.jars: # the same bytes for every run
+                self.jars[filename] = random.Random(filename).randbytes(self.jar_size)
+            return self.jars[filename]
+
+    def count(self, operation: str, sent: int = 0):
+        with self._lock:
+            self.counts[operation] = self.counts.get(operation, 0) + 1
+            self.bytes_sent += sent
+
+    def reset(self) -> dict:
+        """
+        It returns the request counts and the bytes sent so far, and resets them.
+        """
+        with self._lock:
+            result = {"requests": dict(self.counts), "total_requests": sum(self.counts.values()), "bytes_sent": self.bytes_sent}
+            self.counts, self.bytes_sent = {}, 0
+        return result
+
+    def modrinth_versions(self, project: str) -> list[dict]|None:
+        slug = next((slug for slug, (project_id, _) in MODRINTH_CATALOG.items() if project in (slug, project_id)), None)
+        if slug is None:
+            return None
+        project_id, versions = MODRINTH_CATALOG[slug]
+        answer = []
+        for i, (number, version_type, game_versions, dependencies) in enumerate(versions):
+            filename = f"{slug}-{number}.jar"
+            answer.append({
+                "id": hashlib.sha1(filename.encode()).hexdigest()[:8], "project_id": project_id, "name": f"{slug} {number}", "version_number": number,
+                "version_type": version_type, "game_versions": game_versions, "loaders": ["bukkit", "paper", "spigot"], "date_published": f"2024-01-{i + 1:02d}T00:00:00Z",
+                "dependencies": [{"project_id": MODRINTH_CATALOG[dependency][0], "version_id": None, "dependency_type": "required"} for dependency in dependencies],
+                "files": [{"filename": filename, "url": f"{self.base_url}files/{filename}", "primary": True, "size": self.jar_size, "hashes": {"sha512": hashlib.sha512(self.jar(filename)).hexdigest(), "sha1": hashlib.sha1(self.jar(filename)).hexdigest()}}],
+            })
+        return answer[::-1] # newest first, like Modrinth
+
+    def hangar_versions(self, project: str, platform_version: str|None) -> dict|None:
+        slug = next((slug for slug in HANGAR_CATALOG if slug.lower() == project.lower()), None)
+        if slug is None:
+            return None
+        result = []
+        for i, (name, channel, minecraft_versions, dependencies) in enumerate(HANGAR_CATALOG[slug]):
+            if platform_version and platform_version not in minecraft_versions:
+                continue
+            filename = f"{slug}-{name}.jar"
+            result.append({
+                "id": i + 1, "name": name, "createdAt": f"2024-01-{i + 1:02d}T00:00:00Z", "channel": {"name": channel},
+                "platformDependencies": {"PAPER": minecraft_versions},
+                "pluginDependencies": {"PAPER": [{"name": HANGAR_PROJECTS[dependency][1], "projectId": HANGAR_PROJECTS[dependency][0], "required": True, "externalUrl": None} for dependency in dependencies]},
+                "downloads": {"PAPER": {"fileInfo": {"name": filename, "sizeBytes": self.jar_size, "sha256Hash": hashlib.sha256(self.jar(filename)).hexdigest()}, "externalUrl": None, "downloadUrl": f"{self.base_url}files/{filename}"}},
+            })
+        return {"pagination": {"count": len(result), "limit": 25, "offset": 0}, "result": result[::-1]}
+
+    def hangar_project(self, project: str) -> dict|None:
+        slug = next((slug for slug, (project_id, _) in HANGAR_PROJECTS.items() if project.lower() in (slug.lower(), str(project_id))), None)
+        if slug is None:
+            return None
+        project_id, name = HANGAR_PROJECTS[slug]
+        return {"id": project_id, "name": name, "namespace": {"owner": "ViaVersion", "slug": slug}}
+
+    def start(self) -> "PluginStandIn":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class PluginHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: PluginStandIn
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        path, query = unquote(url.path), parse_qs(url.query)
+        if match := MODRINTH_ROUTE.match(path):
+            answer = self.server.modrinth_versions(match.group(1))
+            return self.send_json(200 if answer is not None else 404, answer if answer is not None else {"error": "not_found"}, "modrinth_versions")
+        if match := HANGAR_ROUTE.match(path):
+            answer = self.server.hangar_versions(match.group(1), query.get("platformVersion", [None])[0])
+            return self.send_json(200 if answer is not None else 404, answer if answer is not None else {"message": "Not found"}, "hangar_versions")
+        if match := HANGAR_PROJECT_ROUTE.match(path):
+            answer = self.server.hangar_project(match.group(1))
+            return self.send_json(200 if answer is not None else 404, answer if answer is not None else {"message": "Not found"}, "hangar_project")
+        if match := FILE_ROUTE.match(path):
+            data = self.server.jar(match.group(1))
+            self.server.count("download", len(data))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/java-archive")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self.send_json(404, {"error": "Not found"}, "unknown")
+
+    def send_json(self, status: int, data, operation: str):
+        body = json.dumps(data).encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            self.server.count(operation + "_304")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.server.count(operation, len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 200:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A local stand-in of the Modrinth and Hangar APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added before every answer.")
+    parser.add_argument("--jar-size", type=float, default=512, help="The size of the jars, in KB.")
+    args = parser.parse_args()
+    server = PluginStandIn(args.host, args.port, args.latency, int(args.jar_size * 1024))
+    print(f"Modrinth stand-in on {server.modrinth_url}, Hangar stand-in on {server.hangar_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
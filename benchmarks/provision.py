@@ -0,0 +1,160 @@
+"""
+End-to-end benchmark of the PaperMC client and of the server creation, against the local
+stand-in of the API (benchmarks/paper_standin.py), without internet.
+
+Usage:
+python benchmarks/provision.py [--servers 4] [--latency 0.05] [--bandwidth 20] [--jar-size 40] [--segments 4] [--output result.json]
+
+It reports, as JSON:
+- the API requests of get_versions, get_builds and get_download_url, cold then from the cache
+- the throughput of the jar downloads, in one request or in --segments parallel ranges
+- the number of fsync calls
+- the latency of every stage of the server creation (median and max over the servers)
+- the peak RSS of the process
+Everything runs in temporary directories (cache, jar store, servers).
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from paper_standin import PaperStandIn
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+
+def peak_rss_mb() -> float|None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024 # bytes on macOS, KB elsewhere
+
+
+def git_commit() -> str|None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class FsyncCounter:
+    """
+    It counts the calls to os.fsync while installed.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._fsync = os.fsync
+
+    def __call__(self, fd):
+        self.count += 1
+        return self._fsync(fd)
+
+    def __enter__(self):
+        os.fsync = self
+        return self
+
+    def __exit__(self, *exc):
+        os.fsync = self._fsync
+
+
+def bench_api(standin: PaperStandIn) -> dict:
+    """
+    It times the API calls of the GUI, cold (empty cache) then warm (cached).
+    """
+    import get_papermc
+    result = {}
+    standin.reset()
+    for phase in ("cold", "warm"):
+        start = time.perf_counter()
+        versions = get_papermc.get_versions()
+        builds = {version: get_papermc.get_builds(version) for version in versions}
+        version = versions[-1]
+        get_papermc.get_download_url(version, builds[version][-1])
+        result[phase] = {"seconds": time.perf_counter() - start, **standin.reset()}
+    result["cache"] = get_papermc.cache_stats()
+    return result
+
+
+def bench_provision(standin: PaperStandIn, servers: int, workdir: str, segments: int = 1) -> dict:
+    """
+    It creates servers headlessly like msm create, all of them on the latest build: the jar store
+    downloads the jar once (in segments parallel HTTP ranges) and links it into the other servers.
+    """
+    import msm
+
+    manifest = [{"name": f"server-{i}", "folder_path": workdir, "version": standin.versions[-1], "accept_eula": True, "download_segments": segments} for i in range(servers)]
+    standin.reset()
+    start = time.perf_counter()
+    with FsyncCounter() as fsyncs, ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda server: msm.run_job(server), manifest))
+    wall = time.perf_counter() - start
+    network = standin.reset()
+
+    stages, download_bytes, download_seconds = {}, 0, 0.0
+    for _, ctx, _ in results:
+        for record in (ctx.trace.records if ctx else []):
+            stages.setdefault(record.name, []).append(record.duration)
+            if record.name == "download" and record.bytes:
+                download_bytes += record.bytes
+                download_seconds += record.duration
+    return {
+        "servers": len(manifest),
+        "segments": segments,
+        "failed": [f"{name}: {error}" for name, _, error in results if error],
+        "wall_seconds": wall,
+        "fsync_calls": fsyncs.count,
+        "download": {"bytes": download_bytes, "seconds": download_seconds, "mb_per_s": download_bytes / 1024 ** 2 / download_seconds if download_seconds else None},
+        "stages": {name: {"median": statistics.median(durations), "max": max(durations), "count": len(durations)} for name, durations in stages.items()},
+        **network,
+    }
+
+
+def main(argv: list[str]|None = None) -> int:
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the server creation against a local PaperMC stand-in.")
+    parser.add_argument("--servers", type=int, default=4, help="How many servers on the same build are created.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added before every answer of the stand-in.")
+    parser.add_argument("--bandwidth", type=float, help="MB/s of every download of the stand-in, no limit by default.")
+    parser.add_argument("--jar-size", type=float, default=40, help="The size of the jars, in MB.")
+    parser.add_argument("--segments", type=int, default=1, help="How many HTTP ranges of the jar are downloaded in parallel.")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    standin = PaperStandIn(latency=args.latency, bandwidth=args.bandwidth * 1024 ** 2 if args.bandwidth else None, jar_size=int(args.jar_size * 1024 ** 2)).start()
+    workdir = tempfile.mkdtemp(prefix="msm-bench-")
+    # before the first import of get_papermc, whose cache and client are created at import
+    os.environ.update(MSM_CACHE_DIR=os.path.join(workdir, "cache"), MSM_CONFIG_DIR=os.path.join(workdir, "config"), MSM_PAPER_API=standin.url)
+    try:
+        result = {
+            "commit": git_commit(),
+            "params": vars(args),
+            "api": bench_api(standin),
+            "provision": bench_provision(standin, args.servers, os.path.join(workdir, "servers"), args.segments),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    finally:
+        standin.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 1 if result["provision"]["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+A local stand-in of the RCON server of Paper, for trying the telemetry without a server: it
+accepts a password, answers tps and mspt like Paper (with color codes) and can drop the
+connections to exercise the reconnections.
+
+Usage:
+python benchmarks/rcon_standin.py --port 25575 --password secret [--tps 19.5] [--mspt 12.3] [--drop-every 5]
+"""
+import argparse
+import socketserver
+import struct
+import threading
+
+RCON_LOGIN, RCON_COMMAND, RCON_RESPONSE, RCON_AUTH_RESPONSE = 3, 2, 0, 2
+
+
+class RconStandIn(socketserver.ThreadingTCPServer):
+    """
+    The TCP server of the stand-in, see the module docstring.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, password: str = "secret", tps: float = 20.0, mspt: float = 5.0, drop_every: int = 0):
+        """
+        :param tps: The TPS of the answers to tps
+        :param mspt: The average MSPT of the answers to mspt
+        :param drop_every: Close the connection after this many commands, 0 to never
+        """
+        super().__init__((host, port), RconHandler)
+        self.password, self.tps, self.mspt, self.drop_every = password, tps, mspt, drop_every
+        self.connections = 0
+        self.commands: list[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def answer(self, command: str) -> str:
+        with self._lock:
+            self.commands.append(command)
+        if command == "tps":
+            star = "*" if self.tps > 20 else ""
+            return f"§6TPS from last 1m, 5m, 15m: §a{star}{min(self.tps, 20):.1f}, §a{self.tps:.1f}, §a{self.tps:.1f}"
+        if command == "mspt":
+            low, high = self.mspt / 2, self.mspt * 3
+            triple = f"§a{self.mspt:.1f}§7/§a{low:.1f}§7/§a{high:.1f}"
+            return f"§6Server tick times §e(§7avg§e/§7min§e/§7max§e)§6 from last 5s§7,§6 10s§7,§6 1m§e:\n§6◴ {triple}§7, {triple}§7, {triple}"
+        return f"Unknown command \"{command}\""
+
+    def start(self) -> "RconStandIn":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class RconHandler(socketserver.BaseRequestHandler):
+    server: RconStandIn
+
+    def read_packet(self) -> tuple[int, int, str]|None:
+        header = self.read_exactly(4)
+        if header is None:
+            return None
+        length, = struct.unpack("<i", header)
+        data = self.read_exactly(length)
+        if data is None:
+            return None
+        request_id, packet_type = struct.unpack("<ii", data[:8])
+        return request_id, packet_type, data[8:-2].decode("utf-8")
+
+    def read_exactly(self, size: int) -> bytes|None:
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def send_packet(self, request_id: int, packet_type: int, body: str):
+        payload = struct.pack("<ii", request_id, packet_type) + body.encode("utf-8") + b"\0\0"
+        self.request.sendall(struct.pack("<i", len(payload)) + payload)
+
+    def handle(self):
+        with self.server._lock:
+            self.server.connections += 1
+        authenticated, commands = False, 0
+        while packet := self.read_packet():
+            request_id, packet_type, body = packet
+            if packet_type == RCON_LOGIN:
+                authenticated = body == self.server.password
+                self.send_packet(request_id if authenticated else -1, RCON_AUTH_RESPONSE, "")
+            elif packet_type == RCON_COMMAND and authenticated:
+                self.send_packet(request_id, RCON_RESPONSE, self.server.answer(body))
+                commands += 1
+                if self.server.drop_every and commands >= self.server.drop_every:
+                    return
+            else:
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A local stand-in of the RCON server of Paper.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=25575)
+    parser.add_argument("--password", default="secret")
+    parser.add_argument("--tps", type=float, default=20.0)
+    parser.add_argument("--mspt", type=float, default=5.0)
+    parser.add_argument("--drop-every", type=int, default=0, help="Close the connection after this many commands.")
+    args = parser.parse_args()
+    server = RconStandIn(args.host, args.port, args.password, args.tps, args.mspt, args.drop_every)
+    print(f"RCON stand-in on {args.host}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
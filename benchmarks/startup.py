@@ -0,0 +1,78 @@
+"""
+Startup benchmark of the GUI: the time from launching main.py to its first window and to its
+first interactive version dropdown.
+
+Usage:
+python benchmarks/startup.py [--runs 5] [--cold] [--max-window 1.5] [--max-interactive 3]
+
+--cold uses an empty cache directory for every run, so the versions come from the API instead of
+the cache. The results are printed as JSON, and the exit code is 1 if a median is above its
+--max-* limit or if a run failed (the versions couldn't be loaded, the GUI crashed or timed out),
+so regressions can fail a CI job.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_once(cache_dir: str|None, timeout: float) -> dict:
+    """
+    It launches the GUI once and returns the seconds to its first window and to its first
+    interactive dropdown, with an "error" if the run failed.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_path = os.path.join(tmp, "bench.json")
+        env = dict(os.environ, MSM_STARTUP_BENCH=bench_path)
+        if cache_dir:
+            env["MSM_CACHE_DIR"] = cache_dir
+        start = time.time()
+        try:
+            subprocess.run([sys.executable, "main.py"], cwd=ROOT, env=env, timeout=timeout, check=True)
+            with open(bench_path, "r", encoding="utf-8") as f:
+                marks = json.load(f)
+        except subprocess.TimeoutExpired:
+            return {"error": f"The GUI wasn't interactive after {timeout}s"}
+        except (subprocess.CalledProcessError, OSError, ValueError) as e:
+            return {"error": f"The GUI didn't start: {e}"}
+    error = marks.pop("error", None)
+    return {**{name: mark - start for name, mark in marks.items()}, **({"error": f"The versions couldn't be loaded: {error}"} if error else {})}
+
+
+def main(argv: list[str]|None = None) -> int:
+    parser = argparse.ArgumentParser(description="Startup benchmark of the GUI.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--cold", action="store_true", help="Start every run with an empty cache.")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--max-window", type=float, help="Fail if the median time to the first window is above this, in seconds.")
+    parser.add_argument("--max-interactive", type=float, help="Fail if the median time to the interactive dropdown is above this, in seconds.")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for _ in range(args.runs):
+        if args.cold:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                runs.append(run_once(cache_dir, args.timeout))
+        else:
+            runs.append(run_once(None, args.timeout))
+    succeeded = [run for run in runs if "error" not in run]
+    result = {"runs": args.runs, "cold": args.cold, "failed": [run["error"] for run in runs if "error" in run]}
+    for name in ("first_window", "first_interactive"):
+        values = sorted(run[name] for run in succeeded)
+        result[name] = {"median": statistics.median(values), "min": values[0], "max": values[-1]} if values else None
+    print(json.dumps(result, indent=2))
+
+    if result["failed"]:
+        return 1
+    failed = (args.max_window is not None and result["first_window"]["median"] > args.max_window) or (args.max_interactive is not None and result["first_interactive"]["median"] > args.max_interactive)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+A stand-in of a Paper server process, for trying the supervisor (and the tools reading the
+console) without Java: it prints a Paper-like console, answers "stop" and can crash, hang or use
+memory on demand.
+
+Usage:
+python -m msm supervise --min-backoff 0.5 -- python benchmarks/stub_server.py --crash-after 2
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+
+log_file = None # logs/latest.log with --log-file
+
+
+def log(text: str, level: str = "INFO"):
+    line = f"[{time.strftime('%H:%M:%S')} {level}]: {text}"
+    print(line, flush=True)
+    if log_file is not None:
+        log_file.write(line + "\n")
+        log_file.flush()
+
+
+def main(argv: list[str]|None = None) -> int:
+    parser = argparse.ArgumentParser(description="A stand-in of a Paper server process.")
+    parser.add_argument("--crash-after", type=float, help="Exit with --exit-code after this many seconds.")
+    parser.add_argument("--exit-code", type=int, default=1, help="The exit code of a crash.")
+    parser.add_argument("--startup", type=float, default=0.2, help="Seconds before \"Done\" is printed.")
+    parser.add_argument("--memory", type=int, default=0, help="MB of memory to allocate and touch.")
+    parser.add_argument("--ignore-stop", action="store_true", help="Don't exit on \"stop\", like a hung server.")
+    parser.add_argument("--lag", type=float, default=0, help="Print a \"Can't keep up!\" warning every this many seconds.")
+    parser.add_argument("--log-file", action="store_true", help="Also write the console to logs/latest.log, like Paper.")
+    args = parser.parse_args(argv)
+
+    global log_file
+    if args.log_file:
+        os.makedirs("logs", exist_ok=True)
+        log_file = open(os.path.join("logs", "latest.log"), "w", encoding="utf-8")
+
+    log("Starting minecraft server version 1.20.4")
+    ballast = bytearray(args.memory * 1024 ** 2)
+    for i in range(0, len(ballast), 4096): # resident, not only reserved
+        ballast[i] = 1
+    time.sleep(args.startup)
+    log(f"Done ({args.startup:.3f}s)! For help, type \"help\"")
+
+    if args.crash_after is not None:
+        def crash():
+            time.sleep(args.crash_after)
+            log("Encountered an unexpected exception", "ERROR")
+            sys.stdout.flush()
+            os._exit(args.exit_code)
+        threading.Thread(target=crash, daemon=True).start()
+    if args.lag:
+        def lag():
+            while True:
+                time.sleep(args.lag)
+                log(f"Can't keep up! Is the server overloaded? Running {int(args.lag * 1000)}ms or {int(args.lag * 20)} ticks behind", "WARN")
+        threading.Thread(target=lag, daemon=True).start()
+
+    for line in sys.stdin:
+        command = line.strip()
+        if command == "stop" and not args.ignore_stop:
+            log("Stopping the server")
+            log("Saving worlds")
+            return 0
+        if command:
+            log(f"Unknown command \"{command}\". Type \"/help\" for help.")
+    while args.ignore_stop: # stdin closed, a hung server keeps running
+        time.sleep(1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
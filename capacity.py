@@ -0,0 +1,173 @@
+"""
+Capacity planner: sizes the heap and the performance-related server.properties of a server from
+the resources of the host and the expected number of players.
+"""
+import os
+import sys
+from dataclasses import dataclass, field
+
+MIN_HEAP_MB = 1024
+
+MAX_HEAP_MB = 31 * 1024 # above ~32 GB the JVM loses compressed pointers, more heap is slower
+
+BASE_HEAP_MB = 2048 # an empty Paper server with its worlds loaded
+
+HEAP_PER_PLAYER_MB = 96
+
+OS_RESERVE_MB = 1024 # left to the OS and the other processes of the host
+
+JVM_OVERHEAD = 1.25 # the Java process uses about 25% more than its heap (metaspace, threads, buffers)
+
+# (max players per CPU core, view-distance, simulation-distance, entity-broadcast-range-percentage)
+LOAD_TIERS = [
+    (3, 10, 8, 100),
+    (6, 8, 6, 100),
+    (10, 7, 5, 75),
+    (float("inf"), 6, 4, 50),
+]
+
+
+@dataclass
+class HostResources:
+    total_mb: int
+    available_mb: int # what can be used without swapping the other processes of the host
+    cpus: int
+
+
+@dataclass
+class CapacityPlan:
+    players: int
+    heap_mb: int
+    view_distance: int
+    simulation_distance: int
+    network_compression_threshold: int
+    entity_broadcast_range_percentage: int
+    reasons: dict[str, str] = field(default_factory=dict) # why each value was chosen
+
+    def properties(self) -> dict[str, str]:
+        """
+        It returns the server.properties keys and values of the plan.
+        """
+        return {
+            "max-players": str(self.players),
+            "view-distance": str(self.view_distance),
+            "simulation-distance": str(self.simulation_distance),
+            "network-compression-threshold": str(self.network_compression_threshold),
+            "entity-broadcast-range-percentage": str(self.entity_broadcast_range_percentage),
+        }
+
+    def explain(self) -> str:
+        return "\n".join(f"{key}: {reason}" for key, reason in self.reasons.items())
+
+
+def _read_int(path: str) -> int|None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            value = f.read().split()[0]
+        return None if value == "max" else int(value)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _linux_resources() -> HostResources:
+    meminfo = {}
+    with open("/proc/meminfo", "r", encoding="utf-8") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            meminfo[key] = int(value.split()[0]) // 1024 # kB to MB
+    total, available = meminfo["MemTotal"], meminfo.get("MemAvailable", meminfo.get("MemFree", 0))
+    cpus = len(os.sched_getaffinity(0))
+    # containers: the cgroup (v2) limits are lower than what /proc shows
+    limit = _read_int("/sys/fs/cgroup/memory.max")
+    if limit:
+        usage = _read_int("/sys/fs/cgroup/memory.current") or 0
+        total = min(total, limit // 1024 ** 2)
+        available = min(available, (limit - usage) // 1024 ** 2)
+    try:
+        with open("/sys/fs/cgroup/cpu.max", "r", encoding="utf-8") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = max(1, min(cpus, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return HostResources(total, available, cpus)
+
+
+def _windows_resources() -> HostResources:
+    import ctypes
+
+    class MEMORYSTATUSEX(ctypes.Structure):
+        _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong), ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong), ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong), ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong), ("sullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+    status = MEMORYSTATUSEX()
+    status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+    ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+    return HostResources(status.ullTotalPhys // 1024 ** 2, status.ullAvailPhys // 1024 ** 2, os.cpu_count() or 1)
+
+
+def read_host_resources() -> HostResources:
+    """
+    It returns the RAM and CPU cores of the host (from /proc and the cgroup limits on Linux).
+    """
+    try:
+        if sys.platform.startswith("linux"):
+            return _linux_resources()
+        if sys.platform == "win32":
+            return _windows_resources()
+        total = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 1024 ** 2
+        return HostResources(total, total // 2, os.cpu_count() or 1) # no cheap "available" on macOS
+    except (OSError, ValueError, KeyError, AttributeError):
+        return HostResources(8192, 4096, os.cpu_count() or 1)
+
+
+def plan(players: int = 20, host: HostResources|None = None, servers: int = 1) -> CapacityPlan:
+    """
+    It recommends the heap and the performance-related properties of a server.
+
+    :param players: The expected number of players
+    :param host: The resources of the host, defaults to read_host_resources()
+    :param servers: How many servers share the host, they get an equal share of it
+    :return: The plan, with the reason of each value.
+    """
+    host = host or read_host_resources()
+    players = max(1, int(players))
+    servers = max(1, int(servers))
+    reasons = {}
+
+    wanted = -(-(BASE_HEAP_MB + HEAP_PER_PLAYER_MB * players) // 512) * 512 # rounded up to the slider resolution
+    budget = (host.available_mb - OS_RESERVE_MB) / servers / JVM_OVERHEAD
+    heap = int(min(wanted, budget, MAX_HEAP_MB)) // 512 * 512
+    memory_bound = heap < wanted
+    too_small = heap < MIN_HEAP_MB
+    heap = max(MIN_HEAP_MB, heap)
+    share = f" shared by {servers} servers" if servers > 1 else ""
+    if too_small:
+        reasons["heap"] = f"{heap} MB: the minimum to run a server, the host has only {host.available_mb} MB available{share} and may swap."
+    elif memory_bound and heap == MAX_HEAP_MB // 512 * 512:
+        reasons["heap"] = f"{heap} MB: capped below 32 GB to keep compressed pointers ({wanted} MB wanted for {players} players)."
+    elif memory_bound:
+        reasons["heap"] = f"{heap} MB: limited by the {host.available_mb} MB available{share}, minus {OS_RESERVE_MB} MB for the OS and {int((JVM_OVERHEAD - 1) * 100)}% of JVM overhead ({wanted} MB wanted for {players} players)."
+    else:
+        reasons["heap"] = f"{heap} MB: {BASE_HEAP_MB} MB for the server and its worlds plus {HEAP_PER_PLAYER_MB} MB per player."
+
+    cpus = host.cpus / servers
+    load = players / max(cpus, 1)
+    _, view_distance, simulation_distance, entity_range = next(tier for tier in LOAD_TIERS if load <= tier[0])
+    reasons["simulation-distance"] = f"{simulation_distance}: {load:.1f} players per CPU core ({host.cpus} core(s){share}), ticking fewer chunks keeps 20 TPS."
+    if memory_bound and view_distance > 4:
+        view_distance -= 2
+        reasons["view-distance"] = f"{view_distance}: lowered because the heap is smaller than wanted, every loaded chunk costs memory."
+    else:
+        reasons["view-distance"] = f"{view_distance}: sent chunks cost CPU for {load:.1f} players per core."
+    view_distance = max(view_distance, simulation_distance)
+    reasons["entity-broadcast-range-percentage"] = f"{entity_range}: " + ("the default." if entity_range == 100 else "fewer entity updates to send with many players per core.")
+
+    if cpus <= 2:
+        threshold = 512
+        reasons["network-compression-threshold"] = f"{threshold}: only {host.cpus} CPU core(s){share}, compressing fewer packets saves CPU."
+    else:
+        threshold = 256
+        reasons["network-compression-threshold"] = f"{threshold}: the default, the CPU can afford compression."
+    reasons["max-players"] = f"{players}: the expected number of players."
+
+    return CapacityPlan(players, heap, view_distance, simulation_distance, threshold, entity_range, reasons)
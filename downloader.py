@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import requests
+
+CHUNK_SIZE = 256 * 1024
+
+BUFFER_SIZE = 4 * 1024 * 1024 # data is written to the disk in blocks of this size
+
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024 # smaller files are not worth splitting in ranges
+
+
+class DownloadError(Exception):
+    """
+    Raised when a download fails (bad status code, incomplete data...).
+    """
+
+
+class ChecksumError(DownloadError):
+    """
+    Raised when downloaded data doesn't match its expected hash.
+    """
+
+
+class TransferStats:
+    """
+    The progress of a download: bytes done and total, throughput and ETA.
+    """
+
+    def __init__(self, total: int|None = None, done: int = 0):
+        self.total = total
+        self.done = done
+        self.resumed = done # bytes that were already on the disk, not counted in the throughput
+        self.started_at = time.monotonic()
+        self.finished_at: float|None = None
+        self._lock = threading.Lock()
+
+    def add(self, count: int):
+        with self._lock:
+            self.done += count
+
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def rate(self) -> float:
+        """
+        It returns the throughput of the download, in bytes per second.
+        """
+        elapsed = self.elapsed()
+        return (self.done - self.resumed) / elapsed if elapsed > 0 else 0.0
+
+    def eta(self) -> float|None:
+        """
+        It returns the estimated number of seconds left, None if it can't be estimated.
+        """
+        rate = self.rate()
+        if self.total is None or rate <= 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    def summary(self) -> str:
+        done = f"{self.done / 1024 ** 2:.1f}" + (f"/{self.total / 1024 ** 2:.1f}" if self.total else "")
+        eta = self.eta()
+        return f"{done} MB, {self.rate() / 1024 ** 2:.1f} MB/s" + (f", ETA {eta:.0f}s" if eta is not None and self.finished_at is None else "")
+
+    def as_dict(self) -> dict:
+        return {"total": self.total, "done": self.done, "elapsed": self.elapsed(), "rate": self.rate(), "eta": self.eta()}
+
+
+def _read_state(state_path: str) -> dict:
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_state(state_path: str, state: dict):
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+
+def _probe(session, url: str, timeout) -> tuple[int|None, bool, str|None]:
+    """
+    It returns the size of the file, if the server accepts ranges and the ETag of the file.
+    """
+    r = session.head(url, allow_redirects=True, timeout=timeout)
+    if r.status_code != 200:
+        return None, False, None
+    size = r.headers.get("Content-Length")
+    return (int(size) if size else None), r.headers.get("Accept-Ranges") == "bytes", r.headers.get("ETag")
+
+
+def _download_single(session, url: str, part_path: str, state_path: str, state: dict, stats: TransferStats, progress, timeout, digest):
+    headers = {}
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        if state.get("etag"):
+            headers["If-Range"] = state["etag"] # the server sends the whole file if it changed
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
+        if r.status_code == 206:
+            mode = "ab"
+        elif r.status_code == 200:
+            mode, offset = "wb", 0
+            _write_state(state_path, dict(state, url=url, etag=r.headers.get("ETag")))
+        elif r.status_code == 416 and r.headers.get("Content-Range") == f"bytes */{offset}":
+            mode = "ab" # the .part file is already complete
+        else:
+            raise DownloadError(f"Error downloading {url} | {r.status_code}")
+        length = r.headers.get("Content-Length") if r.status_code != 416 else 0
+        stats.total = offset + int(length) if length else None
+        stats.done = stats.resumed = offset
+        if digest is not None and offset:
+            with open(part_path, "rb") as f: # the hash must cover the resumed part too
+                for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+                    digest.update(block)
+        with open(part_path, mode, buffering=BUFFER_SIZE) as f:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+                    stats.add(len(chunk))
+                    if progress:
+                        progress(stats)
+    if stats.total is not None and stats.done != stats.total:
+        raise DownloadError(f"Incomplete download of {url}: {stats.done}/{stats.total} bytes")
+
+
+def _download_segments(session, url: str, part_path: str, state_path: str, state: dict, stats: TransferStats, progress, timeout, segments: int):
+    size = state["size"]
+    segment_size = -(-size // segments)
+    ranges = [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+    done_segments = set(state.get("segments_done", []))
+    if not os.path.exists(part_path) or os.path.getsize(part_path) != size:
+        done_segments.clear()
+        with open(part_path, "wb") as f:
+            f.truncate(size) # preallocated, every segment writes at its own offset
+    stats.done = stats.resumed = sum(end - start + 1 for i, (start, end) in enumerate(ranges) if i in done_segments)
+    lock = threading.Lock()
+
+    def fetch_segment(index: int):
+        start, end = ranges[index]
+        headers = {"Range": f"bytes={start}-{end}"}
+        if state.get("etag"):
+            headers["If-Range"] = state["etag"]
+        with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
+            if r.status_code != 206:
+                raise DownloadError(f"Error downloading {url} (range {start}-{end}) | {r.status_code}")
+            written = 0
+            with open(part_path, "r+b", buffering=BUFFER_SIZE) as f:
+                f.seek(start)
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                    if chunk:
+                        f.write(chunk)
+                        written += len(chunk)
+                        stats.add(len(chunk))
+                        if progress:
+                            progress(stats)
+        if written != end - start + 1:
+            raise DownloadError(f"Incomplete range {start}-{end} of {url}: {written} bytes")
+        with lock:
+            done_segments.add(index)
+            _write_state(state_path, dict(state, segments_done=sorted(done_segments)))
+
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        for future in [executor.submit(fetch_segment, i) for i in range(len(ranges)) if i not in done_segments]:
+            future.result()
+
+
+def _copy_local(path: str, part_path: str, stats: TransferStats, progress, digest):
+    """
+    It copies the local file of a file:// URL to the .part file.
+    """
+    stats.total = os.path.getsize(path)
+    with open(path, "rb") as src, open(part_path, "wb") as dst:
+        for block in iter(lambda: src.read(BUFFER_SIZE), b""):
+            dst.write(block)
+            if digest is not None:
+                digest.update(block)
+            stats.add(len(block))
+            if progress:
+                progress(stats)
+
+
+def download_file(url: str, dest_path: str, session: requests.Session|None = None, sha256: str|None = None, segments: int = 1, resume: bool = True, progress=None, timeout: tuple[float, float] = (5, 60), algorithm: str = "sha256") -> TransferStats:
+    """
+    It downloads the file of the url (http, https or file) to dest_path.
+
+    The data goes to dest_path + ".part" with large buffered writes, is synced to the disk once and
+    is then atomically renamed to dest_path, so dest_path is never a truncated file. An interrupted
+    download is resumed from its .part file.
+
+    :param url: The URL of the file
+    :param dest_path: The path of the downloaded file
+    :param session: The session to download with, defaults to a new one
+    :param sha256: The expected SHA-256 of the file, defaults to None (not verified)
+    :param segments: How many HTTP ranges are downloaded in parallel, if the server accepts ranges. A
+    .part left with another count is resumed without the ranges it had, which don't match anymore
+    :param resume: If an existing .part file should be resumed instead of restarted
+    :param progress: A callable receiving the TransferStats after every chunk
+    :param timeout: The connect and read timeouts, in seconds
+    :param algorithm: The hash function of sha256 (e.g. "sha512" for the files of Modrinth)
+    :return: The TransferStats of the download.
+    """
+    if session is None:
+        with requests.Session() as session: # closed once the download is done or failed
+            return download_file(url, dest_path, session, sha256, segments, resume, progress, timeout, algorithm)
+    part_path = dest_path + ".part"
+    state_path = part_path + ".json"
+    state = _read_state(state_path) if resume else {}
+    if not resume or state.get("url", url) != url:
+        state = {}
+        for path in (part_path, state_path):
+            if os.path.exists(path):
+                os.remove(path)
+    stats = TransferStats()
+
+    digest = hashlib.new(algorithm) if sha256 else None
+    if url.startswith("file:"): # e.g. a mirror on a shared drive, already at disk speed
+        try:
+            _copy_local(url2pathname(urlparse(url).path), part_path, stats, progress, digest)
+        except FileNotFoundError as e:
+            raise DownloadError(f"Error downloading {url} | {e}")
+    else:
+        if segments > 1:
+            size, accept_ranges, etag = _probe(session, url, timeout)
+            if state.get("etag") and etag != state.get("etag"): # the file changed since the .part was written
+                state = {}
+            if size is None or not accept_ranges or size < 2 * MIN_SEGMENT_SIZE:
+                segments = 1
+            else:
+                segments = min(segments, size // MIN_SEGMENT_SIZE)
+                if state.get("segments") != segments: # the indices of segments_done are ranges of another layout
+                    state.pop("segments_done", None)
+                state.update(url=url, size=size, etag=etag, segments=segments)
+                _write_state(state_path, state)
+                stats.total = size
+                _download_segments(session, url, part_path, state_path, state, stats, progress, timeout, segments)
+        if segments == 1:
+            if "size" in state or "segments_done" in state:
+                # left by a segmented download: the .part is preallocated, its length isn't what was received
+                for path in (part_path, state_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                state = {}
+            _download_single(session, url, part_path, state_path, state, stats, progress, timeout, digest)
+        else:
+            digest = None
+
+    with open(part_path, "r+b") as f:
+        if sha256 and digest is None: # ranges arrive out of order, the file is hashed once complete
+            digest = hashlib.new(algorithm)
+            for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+                digest.update(block)
+        os.fsync(f.fileno())
+    if sha256 and digest.hexdigest() != sha256.lower():
+        for path in (part_path, state_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise ChecksumError(f"{algorithm.upper()} mismatch for {url}: expected {sha256}, got {digest.hexdigest()}")
+    os.replace(part_path, dest_path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    stats.finished_at = time.monotonic()
+    if progress:
+        progress(stats)
+    return stats
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import shutil
+import sys
+
+FICLONE = 0x40049409 # linux/fs.h, supported by btrfs, xfs (reflink=1), bcachefs...
+
+
+def reflink(src: str, dst: str):
+    """
+    It makes dst a copy-on-write clone of src with its mode and times (like shutil.copy2), raising
+    OSError if the platform or the filesystem doesn't support it.
+
+    :param src: The path of the file to clone
+    :param dst: The path of the clone, must not exist
+    """
+    if not sys.platform.startswith("linux"):
+        raise OSError("reflinks are only supported on Linux")
+    import fcntl
+    with open(src, "rb") as s, open(dst, "xb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst) # e.g. the exec bit of start.sh
+
+
+def link_file(src: str, dst: str, methods: tuple[str, ...] = ("hardlink", "reflink", "copy")) -> str:
+    """
+    It makes dst point to the content of src without copying the data when possible.
+
+    The methods are tried in order, "hardlink" shares the inode, "reflink" shares the blocks until
+    one of the files is modified and "copy" copies the data. An existing dst is replaced.
+
+    :param src: The path of the source file
+    :param dst: The path of the destination file
+    :param methods: The methods to try, in order
+    :return: The method that worked.
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    for method in methods:
+        try:
+            if method == "hardlink":
+                os.link(src, dst)
+            elif method == "reflink":
+                reflink(src, dst)
+            else:
+                shutil.copy2(src, dst)
+            return method
+        except OSError:
+            if method == methods[-1]:
+                raise
+    raise ValueError("No link method given")
+
+
+
+def file_sha256(path: str, buffer_size: int = 1024 * 1024) -> str:
+    """
+    It returns the SHA-256 of a file, as lowercase hex.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(buffer_size):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,70 +1,306 @@
-import json
+import email.utils
+import os
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import Union
+from urllib.parse import urlparse
+from urllib.request import url2pathname
 
 import requests
-from lxml import html
+from requests.adapters import BaseAdapter, HTTPAdapter
 
-VERSIONS_URL = "https://api.papermc.io/v2/projects/paper/"
+from api_cache import DEFAULT_TTL, MetadataCache
 
-BUILDS_URL = "https://api.papermc.io/v2/projects/paper/versions/{version}/"
+PAPERMC_API_URL = "https://api.papermc.io/v2/projects/paper/"
 
-DOWNLOAD_URL = "https://api.papermc.io/v2/projects/paper/versions/{version}/builds/{build}/downloads/paper-{version}-{build}.jar"
+INDEX_FILE = "index.json" # the answer of an endpoint ending with / in a mirror directory, see mirror.py
+
+
+def normalize_api_url(url: str) -> str:
+    """
+    It returns the URL of an API (http, https or file) or of a mirror directory, ending with /.
+    """
+    if "://" not in url: # a directory
+        url = Path(url).resolve().as_uri()
+    return url.rstrip("/") + "/"
+
+
+# The API can be replaced by a mirror (see mirror.py) with MSM_PAPER_API or set_api_url
+API_URL = normalize_api_url(os.environ.get("MSM_PAPER_API") or PAPERMC_API_URL)
+
+VERSIONS_URL = API_URL
+
+BUILDS_URL = API_URL + "versions/{version}/"
+
+DOWNLOAD_URL = API_URL + "versions/{version}/builds/{build}/downloads/paper-{version}-{build}.jar"
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
 
 """CLASS FOR EXECPTIONS"""
 
+class PaperApiError(Exception):
+    """
+    Raised when the PaperMC API answers with an unexpected status code.
+    """
+    def __init__(self, message: str, status_code: int|None = None):
+        super().__init__(message if status_code is None else f"{message} | {status_code}")
+        self.status_code = status_code
+
+
+"""CLIENT"""
+
+class FileAdapter(BaseAdapter):
+    """
+    A requests adapter answering file:// URLs from a mirror directory, an URL ending with / being
+    answered with its INDEX_FILE.
+    """
+
+    def send(self, request, **kwargs):
+        path = url2pathname(urlparse(request.url).path)
+        if request.url.endswith("/") or os.path.isdir(path):
+            path = os.path.join(path, INDEX_FILE)
+        response = requests.Response()
+        response.url, response.request = request.url, request
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            response.status_code = 200
+            response.headers["Content-Length"] = str(len(data))
+            response.headers["Last-Modified"] = email.utils.formatdate(os.path.getmtime(path), usegmt=True)
+        except FileNotFoundError:
+            data, response.status_code = b"", 404
+        response._content = data if request.method != "HEAD" else b""
+        return response
+
+    def close(self):
+        pass
+
+
+class PaperApiClient:
+    """
+    A client of the PaperMC v2 API.
+
+    All the requests go through one pooled keep-alive session, with bounded timeouts and retries
+    with jittered exponential backoff, and their answers are kept in a MetadataCache.
+    """
+
+    def __init__(self, base_url: str = API_URL, cache: MetadataCache|None = None, timeout: tuple[float, float] = (5, 15), retries: int = 3, backoff: float = 0.5, max_workers: int = 8):
+        """
+        :param base_url: The URL of the paper project of the API, or of a mirror (see mirror.py)
+        :param cache: The cache to use, defaults to a new MetadataCache
+        :param timeout: The connect and read timeouts of a request, in seconds
+        :param retries: How many times a failed request is retried
+        :param backoff: The base delay between retries, in seconds, doubled at each retry
+        :param max_workers: How many requests the bulk methods run at once (also the pool size)
+        """
+        self.base_url = normalize_api_url(base_url)
+        self.cache = cache if cache is not None else MetadataCache()
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.mount("file://", FileAdapter())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    """URLS"""
+
+    def versions_url(self) -> str:
+        return self.base_url
+
+    def builds_url(self, version: Union[float, str]) -> str:
+        return f"{self.base_url}versions/{version}/"
+
+    def build_url(self, version: Union[float, str], build: Union[int, str]) -> str:
+        return f"{self.base_url}versions/{version}/builds/{build}/"
+
+    def get_download_url_raw(self, version: Union[float, str], build: Union[int, str]) -> str:
+        return f"{self.base_url}versions/{version}/builds/{build}/downloads/paper-{version}-{build}.jar"
+
+    """REQUESTS"""
+
+    def _request(self, url: str, headers: dict) -> requests.Response:
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.retries:
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt)) # full jitter
+            attempt += 1
+
+    def _get_json(self, url: str, error_message: str):
+        try:
+            return self.cache.fetch(url, self._request)
+        except requests.HTTPError as e:
+            raise PaperApiError(error_message, e.response.status_code) from e
+
+    def get_json(self, url: str) -> dict:
+        """
+        It returns the whole answer of an endpoint of the API, e.g. to mirror it.
+        """
+        return self._get_json(url, f"Error getting {url}")
+
+    """CHECKS"""
+
+    def check_version(self, version: Union[float, str]) -> bool:
+        return str(version) in self.get_versions()
+
+    def check_build(self, version: Union[float, str], build: Union[int, str]) -> bool:
+        builds = self.get_builds(version)
+        try:
+            return int(build) in builds
+        except ValueError:
+            raise ValueError("Build must be an integer or an integer in a string format")
+
+    """FUNCTIONS"""
+
+    def get_versions(self) -> list[str]:
+        return self._get_json(self.versions_url(), "Error getting versions")["versions"]
+
+    def get_cached_versions(self) -> list[str]|None:
+        """
+        It returns the versions of the last answer of the API, however old, without any request.
+        None if the versions were never fetched.
+        """
+        entry = self.cache.get(self.versions_url())
+        return entry["data"]["versions"] if entry else None
+
+    def get_builds_raw(self, version: Union[float, str]) -> list[int]:
+        return self._get_json(self.builds_url(version), "Error getting builds")["builds"]
+
+    def get_builds(self, version: Union[float, str]) -> list[int]:
+        # the builds endpoint answers 404 for an unknown version, no need to fetch the versions first
+        try:
+            return self.get_builds_raw(version)
+        except PaperApiError as e:
+            if e.status_code == 404:
+                raise PaperApiError("Version not found") from e
+            raise
+
+    def get_all_builds(self, versions: list[Union[float, str]]) -> dict[str, list[int]]:
+        """
+        It fetches the builds of many versions concurrently.
+
+        :param versions: The versions to get the builds of
+        :return: A dict of the builds of each version, in the order of versions.
+        """
+        versions = [str(version) for version in versions]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(versions, executor.map(self.get_builds, versions)))
+
+    def get_build(self, version: Union[float, str], build: Union[int, str]) -> dict:
+        """
+        It returns the metadata of a build (time, changes, downloads with their name and sha256).
+        """
+        return self._get_json(self.build_url(version, build), "Error getting build")
+
+    def get_build_sha256(self, version: Union[float, str], build: Union[int, str]) -> str:
+        return self.get_build(version, build)["downloads"]["application"]["sha256"]
+
+    def get_download_url(self, version: Union[float, str], build: Union[int, str]) -> str:
+        if not self.check_build(version, build): # also checks the version, see get_builds
+            raise PaperApiError("Build not found")
+        return self.get_download_url_raw(version, build)
+
+    def get_latest_version(self) -> str:
+        return self._get_json(self.versions_url(), "Error getting latest version")["versions"][-1]
+
+    def get_latest_build(self, version: Union[float, str]) -> int:
+        return self.get_builds(version)[-1]
+
+    def get_latest_version_and_build(self) -> tuple[str, int]:
+        version = self.get_latest_version()
+        return version, self.get_latest_build(version)
+
+
+"""DEFAULT CLIENT"""
+
+cache = MetadataCache(ttl=float(os.environ.get("MSM_CACHE_TTL", DEFAULT_TTL)))
+
+client = PaperApiClient(cache=cache)
+
+def set_api_url(url: str):
+    """
+    It makes the default client use another API or a mirror (see mirror.py).
+
+    :param url: The URL of the paper project of the API (http, https or file) or a mirror directory
+    """
+    global API_URL, VERSIONS_URL, BUILDS_URL, DOWNLOAD_URL
+    API_URL = VERSIONS_URL = client.base_url = normalize_api_url(url)
+    BUILDS_URL = API_URL + "versions/{version}/"
+    DOWNLOAD_URL = API_URL + "versions/{version}/builds/{build}/downloads/paper-{version}-{build}.jar"
+
+def invalidate_cache(url: str|None = None):
+    """
+    It removes the cached answer of the url, or every cached answer if no url is given.
+
+    :param url: The URL of the endpoint to invalidate, defaults to None (everything)
+    """
+    cache.invalidate(url)
+
+def cache_stats() -> dict:
+    """
+    It returns the hits, misses, revalidations, stale answers and network requests of the cache.
+    """
+    return cache.stats.as_dict()
+
 
 """CHECKS"""
 
 def check_version(version: Union[float, str]) -> bool:
-    versions = get_versions()
-    return str(version) in versions
+    return client.check_version(version)
 
 def check_build(version: Union[float, str], build: Union[int, str]) -> bool:
-    builds = get_builds(version)
-    try:
-        return int(build) in builds
-    except ValueError:
-        raise ValueError("Build must be an integer or an integer in a string format")
+    return client.check_build(version, build)
 
 """FUNCTIONS"""
 
 def get_versions() -> list[str]:
-    response = requests.get(VERSIONS_URL)
-    if response.status_code != 200:
-        raise Exception("Error getting versions")
-    return json.loads(response.text)["versions"]
-
-def get_builds_raw(version: Union[float, str]) -> list[str]:
-    response = requests.get(BUILDS_URL.format(version=str(version)))
-    if response.status_code != 200:
-        raise Exception("Error getting builds")
-    return json.loads(response.text)["builds"]
-
-def get_builds(version: Union[float, str]) -> list[str]:
-    if not check_version(version):
-        raise Exception("Version not found")
-    return get_builds_raw(version)
+    return client.get_versions()
+
+def get_cached_versions() -> list[str]|None:
+    return client.get_cached_versions()
+
+def get_builds_raw(version: Union[float, str]) -> list[int]:
+    return client.get_builds_raw(version)
+
+def get_builds(version: Union[float, str]) -> list[int]:
+    return client.get_builds(version)
+
+def get_build(version: Union[float, str], build: Union[int, str]) -> dict:
+    return client.get_build(version, build)
+
+def get_build_sha256(version: Union[float, str], build: Union[int, str]) -> str:
+    return client.get_build_sha256(version, build)
 
 def get_download_url_raw(version: Union[float, str], build: Union[int, str]) -> str:
-    return DOWNLOAD_URL.format(version=str(version), build=str(build))
+    return client.get_download_url_raw(version, build)
 
 def get_download_url(version: Union[float, str], build: Union[int, str]) -> str:
-    if not check_version(version):
-        raise Exception("Version not found")
-    if not check_build(version, build):
-        raise Exception("Build not found")
-    return get_download_url_raw(version, build)
+    return client.get_download_url(version, build)
 
 def get_latest_version() -> str:
-    response = requests.get(VERSIONS_URL)
-    if response.status_code != 200:
-        raise Exception(f"Error getting latest version | {response.status_code}")
-    return json.loads(response.text)["versions"][-1]
+    return client.get_latest_version()
 
 def get_latest_build(version: Union[float, str]) -> int:
-    return get_builds(version)[-1]
+    return client.get_latest_build(version)
 
 def get_latest_version_and_build():
-    version = get_latest_version()
-    return version, get_latest_build(version)
+    return client.get_latest_version_and_build()
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+
+import requests
+
+from downloader import DownloadError, download_file
+from fsutil import link_file
+from paths import cache_dir
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3 # 2 GiB, around 40 Paper jars
+
+_path_locks: dict[str, threading.Lock] = {} # shared by all the JarStore instances of the process
+_path_locks_lock = threading.Lock()
+
+
+class JarStore:
+    """
+    A local content-addressed store of jars, keyed by their SHA-256.
+
+    A jar is downloaded once and then hardlinked (or reflinked, or copied) into every server
+    folder that needs it. The least recently used jars are evicted above max_bytes.
+
+    The store of the plugins (see plugins) is keyed by another hash function, its "sha256"
+    arguments are then hashes of that function.
+    """
+
+    def __init__(self, directory: str|None = None, max_bytes: int = DEFAULT_MAX_BYTES, algorithm: str = "sha256"):
+        self.directory = directory or cache_dir("jars")
+        self.max_bytes = max_bytes
+        self.algorithm = algorithm
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, sha256: str) -> str:
+        sha256 = sha256.lower()
+        return os.path.join(self.directory, sha256[:2], sha256 + ".jar")
+
+    def contains(self, sha256: str) -> bool:
+        return os.path.isfile(self.path(sha256))
+
+    def link(self, sha256: str, dest_path: str) -> str|None:
+        """
+        It puts the stored jar with the hash at dest_path, without any network use.
+
+        :param sha256: The SHA-256 of the jar
+        :param dest_path: Where to put the jar
+        :return: The method used ("hardlink", "reflink" or "copy"), None if the jar isn't stored.
+        """
+        path = self.path(sha256)
+        try:
+            os.utime(path) # the mtime is the last use, see prune
+        except FileNotFoundError:
+            return None
+        return link_file(path, dest_path)
+
+    def fetch(self, url: str, sha256: str, dest_path: str, session: requests.Session|None = None, progress=None, segments: int = 1) -> str:
+        """
+        It puts the jar with the hash at dest_path, downloading it into the store first if needed.
+
+        :param url: The URL to download the jar from on a miss
+        :param sha256: The SHA-256 of the jar
+        :param dest_path: Where to put the jar
+        :param session: The session to download with, defaults to a new one
+        :param progress: A callable receiving the TransferStats of the download, see download_file
+        :param segments: How many HTTP ranges are downloaded in parallel, see download_file
+        :return: "hit" if the jar was already stored (or downloaded meanwhile by another thread), "miss"
+        if this call downloaded it.
+        :raises DownloadError: If the jar can't be downloaded, or is evicted by concurrent prunes
+        before it is linked, twice.
+        """
+        if self.link(sha256, dest_path):
+            return "hit"
+        downloaded = False
+        for _ in range(2): # a prune of another store instance can evict the jar before it is linked
+            with self._hash_lock(sha256): # servers on the same build wait for one download
+                if not self.contains(sha256):
+                    os.makedirs(os.path.dirname(self.path(sha256)), exist_ok=True)
+                    download_file(url, self.path(sha256), session=session, sha256=sha256, segments=segments, progress=progress, algorithm=self.algorithm)
+                    self.prune(keep=sha256)
+                    downloaded = True
+            if self.link(sha256, dest_path):
+                return "miss" if downloaded else "hit"
+        raise DownloadError(f"The jar {sha256} was evicted from the store before it could be linked to {dest_path}")
+
+    def _hash_lock(self, sha256: str) -> threading.Lock:
+        with _path_locks_lock:
+            return _path_locks.setdefault(self.path(sha256), threading.Lock())
+
+    def entries(self) -> list[tuple[str, int, float]]:
+        """
+        It returns the (path, size, last use) of the stored jars, least recently used first.
+        """
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".jar"):
+                    st = os.stat(os.path.join(root, name))
+                    entries.append((os.path.join(root, name), st.st_size, st.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def prune(self, max_bytes: int|None = None, keep: str|None = None) -> list[str]:
+        """
+        It evicts the least recently used jars until the store is at most max_bytes, and removes
+        the partial files of downloads interrupted more than a day ago.
+
+        :param max_bytes: The size to reach, defaults to the max_bytes of the store
+        :param keep: The SHA-256 of a jar that must not be evicted
+        :return: The paths of the removed files.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        removed = []
+        with self._lock:
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if name.endswith((".part", ".part.json")) and time.time() - os.path.getmtime(path) > 24 * 3600:
+                        os.remove(path)
+                        removed.append(path)
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= max_bytes:
+                    break
+                if keep and path == self.path(keep):
+                    continue
+                os.remove(path)
+                removed.append(path)
+                total -= size
+        return removed
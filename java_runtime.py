@@ -0,0 +1,247 @@
+import glob
+import json
+import os
+import sys
+import threading
+from dataclasses import asdict, dataclass
+
+from paths import cache_dir
+
+JAVA_EXECUTABLE = "java.exe" if sys.platform == "win32" else "java"
+
+# (first Minecraft version, minimum Java, maximum Java or None, recommended Java), the last
+# matching row applies. Sources: Paper documentation and the Minecraft release notes. The old
+# versions don't start on a newer Java (removed internal APIs, class file versions of their
+# libraries), the recent ones have no known maximum.
+JAVA_REQUIREMENTS = [
+    ("1.8", 8, 8, 8),
+    ("1.12", 8, 11, 11),
+    ("1.16.5", 8, 16, 16),
+    ("1.17", 16, 17, 17),
+    ("1.18", 17, None, 17),
+    ("1.20.5", 21, None, 21),
+]
+
+# Directories whose sub-directories are Java installations
+if sys.platform == "win32":
+    SCAN_ROOTS = [os.path.join(os.environ.get(variable, default), vendor) for variable, default in (("ProgramFiles", "C:\\Program Files"), ("ProgramFiles(x86)", "C:\\Program Files (x86)")) for vendor in ("Java", "Eclipse Adoptium", "Eclipse Foundation", "AdoptOpenJDK", "Microsoft", "Zulu", "Amazon Corretto", "BellSoft", "Semeru")]
+elif sys.platform == "darwin":
+    SCAN_ROOTS = ["/Library/Java/JavaVirtualMachines", os.path.expanduser("~/Library/Java/JavaVirtualMachines")]
+else:
+    SCAN_ROOTS = ["/usr/lib/jvm", "/usr/lib64/jvm", "/usr/java", "/usr/local/java", "/opt/java", "/opt/jdk"]
+SCAN_ROOTS += [os.path.expanduser(path) for path in ("~/.sdkman/candidates/java", "~/.jdks", "~/.asdf/installs/java", "~/.gradle/jdks")]
+
+
+@dataclass
+class JavaRuntime:
+    home: str
+    executable: str
+    version: str|None # JAVA_VERSION of the release file, e.g. "17.0.2" or "1.8.0_292"
+    major: int|None # e.g. 17 or 8
+    vendor: str|None = None
+
+
+def parse_java_version(version: str) -> int|None:
+    """
+    It returns the major version of a Java version string ("1.8.0_292" is 8, "17.0.2" is 17).
+    """
+    parts = version.split(".")
+    try:
+        return int(parts[1]) if parts[0] == "1" and len(parts) > 1 else int(parts[0].split("-")[0].split("+")[0])
+    except ValueError:
+        return None
+
+
+def read_release(home: str) -> dict[str, str]:
+    """
+    It reads the release file of a Java installation, without running Java.
+
+    :param home: The directory of the installation (JAVA_HOME)
+    :return: The keys and values of the file, empty if there is none.
+    """
+    release = {}
+    try:
+        with open(os.path.join(home, "release"), "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                key, sep, value = line.strip().partition("=")
+                if sep:
+                    release[key] = value.strip().strip('"')
+    except OSError:
+        pass
+    return release
+
+
+def home_of(path: str) -> str|None:
+    """
+    It returns the Java installation of a path: a java executable, its bin directory or the
+    installation itself. Symlinks (e.g. /usr/bin/java) are followed.
+
+    :return: The directory of the installation, None if the path has no java executable.
+    """
+    path = os.path.realpath(path)
+    if os.path.isfile(path):
+        path = os.path.dirname(path)
+    if os.path.basename(path) == "bin":
+        path = os.path.dirname(path)
+    if os.path.isdir(os.path.join(path, "Contents", "Home")): # macOS bundles
+        path = os.path.join(path, "Contents", "Home")
+    if not os.path.isfile(os.path.join(path, "bin", JAVA_EXECUTABLE)):
+        return None
+    # a JRE inside a JDK 8 (jdk/jre) has no release file, the JDK has one
+    if not os.path.isfile(os.path.join(path, "release")) and os.path.isfile(os.path.join(path, os.pardir, "release")):
+        path = os.path.realpath(os.path.join(path, os.pardir))
+    return path
+
+
+def runtime_of(path: str) -> JavaRuntime|None:
+    """
+    It returns the JavaRuntime of a path (see home_of), None if it isn't a Java installation.
+    The version is unknown (None) if the installation has no release file.
+    """
+    home = home_of(path)
+    if home is None:
+        return None
+    release = read_release(home)
+    version = release.get("JAVA_VERSION")
+    executable = os.path.join(home, "bin", JAVA_EXECUTABLE)
+    if not os.path.isfile(executable): # JDK 8, the executable is in the jre directory too
+        executable = os.path.join(home, "jre", "bin", JAVA_EXECUTABLE)
+    return JavaRuntime(home, executable, version, parse_java_version(version) if version else None, release.get("IMPLEMENTOR"))
+
+
+def minecraft_requirement(minecraft_version: str) -> tuple[int, int|None, int]:
+    """
+    It returns the minimum, maximum (None if there is none) and recommended Java versions of a
+    Minecraft version.
+    """
+    def key(version: str) -> tuple[int, ...]:
+        return tuple(int(part) if part.isdigit() else 0 for part in version.split("-")[0].split("."))
+    requirement = JAVA_REQUIREMENTS[0][1:]
+    for first_version, *row in JAVA_REQUIREMENTS:
+        if key(minecraft_version) >= key(first_version):
+            requirement = tuple(row)
+    return requirement
+
+
+def is_compatible(runtime: JavaRuntime, minecraft_version: str) -> bool:
+    minimum, maximum, _ = minecraft_requirement(minecraft_version)
+    return runtime.major is not None and runtime.major >= minimum and (maximum is None or runtime.major <= maximum)
+
+
+class JavaIndex:
+    """
+    An index of the Java installations of the system (PATH, JAVA_HOME and the usual installation
+    directories), cached on disk.
+
+    The cache is reused as long as PATH and JAVA_HOME are the same and the modification times of
+    the scanned directories didn't change, i.e. no Java was installed or removed.
+    """
+
+    def __init__(self, index_path: str|None = None):
+        self.index_path = index_path or os.path.join(cache_dir("java"), "index.json")
+        self.runtimes: list[JavaRuntime] = []
+        self._key: dict|None = None
+        self._lock = threading.Lock()
+
+    def _watched_dirs(self) -> list[str]:
+        dirs = [path for path in os.environ.get("PATH", "").split(os.pathsep) if path]
+        if os.environ.get("JAVA_HOME"):
+            dirs.append(os.environ["JAVA_HOME"])
+        return dirs + SCAN_ROOTS
+
+    def _current_key(self) -> dict:
+        mtimes = {}
+        for path in self._watched_dirs():
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[path] = None
+        return {"PATH": os.environ.get("PATH", ""), "JAVA_HOME": os.environ.get("JAVA_HOME", ""), "mtimes": mtimes}
+
+    def scan(self) -> list[JavaRuntime]:
+        """
+        It looks for the Java installations of the system, without running Java.
+        """
+        candidates = []
+        if os.environ.get("JAVA_HOME"):
+            candidates.append(os.environ["JAVA_HOME"])
+        for path in os.environ.get("PATH", "").split(os.pathsep):
+            if path and os.path.isfile(os.path.join(path, JAVA_EXECUTABLE)):
+                candidates.append(os.path.join(path, JAVA_EXECUTABLE))
+        for root in SCAN_ROOTS:
+            candidates += glob.glob(os.path.join(root, "*"))
+        runtimes, homes = [], set()
+        for candidate in candidates:
+            runtime = runtime_of(candidate)
+            if runtime is not None and runtime.home not in homes:
+                homes.add(runtime.home)
+                runtimes.append(runtime)
+        return runtimes
+
+    def load(self, force: bool = False) -> list[JavaRuntime]:
+        """
+        It returns the Java installations of the system, from memory, from the index on the disk
+        or from a new scan, whichever is still valid.
+
+        :param force: If a new scan should be done anyway
+        """
+        with self._lock:
+            key = self._current_key()
+            if not force and key == self._key:
+                return self.runtimes
+            if not force:
+                try:
+                    with open(self.index_path, "r", encoding="utf-8") as f:
+                        index = json.load(f)
+                    if index.get("key") == key:
+                        self.runtimes, self._key = [JavaRuntime(**runtime) for runtime in index["runtimes"]], key
+                        return self.runtimes
+                except (OSError, ValueError, TypeError, KeyError):
+                    pass
+            self.runtimes, self._key = self.scan(), key
+            tmp_path = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp" # a half-written index is never read
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"key": key, "runtimes": [asdict(runtime) for runtime in self.runtimes]}, f, indent=2)
+                os.replace(tmp_path, self.index_path)
+            except OSError:
+                pass
+            return self.runtimes
+
+    def best_for(self, minecraft_version: str) -> JavaRuntime|None:
+        """
+        It returns the best compatible Java installation for a Minecraft version: the oldest one
+        at least as recent as the recommended version, else the most recent one. None if no
+        installation is compatible.
+        """
+        recommended = minecraft_requirement(minecraft_version)[2]
+        compatible = [runtime for runtime in self.load() if is_compatible(runtime, minecraft_version)]
+        recent_enough = [runtime for runtime in compatible if runtime.major >= recommended]
+        if recent_enough:
+            return min(recent_enough, key=lambda runtime: runtime.major)
+        return max(compatible, key=lambda runtime: runtime.major, default=None)
+
+    def newest(self) -> JavaRuntime|None:
+        return max((runtime for runtime in self.load() if runtime.major is not None), key=lambda runtime: runtime.major, default=None)
+
+
+def validate(path: str, minecraft_version: str|None = None) -> tuple[JavaRuntime|None, str|None]:
+    """
+    It checks a user-supplied Java path like the installations of the index.
+
+    :param path: The path to a java executable or to a Java installation
+    :param minecraft_version: The Minecraft version it must be able to run, defaults to None
+    :return: The runtime (None if the path isn't a Java installation) and a problem, if any.
+    """
+    runtime = runtime_of(path.strip('"'))
+    if runtime is None:
+        return None, f"{path} is not a Java installation"
+    if runtime.major is None:
+        return runtime, f"The version of {path} is unknown (no release file)"
+    if minecraft_version and not is_compatible(runtime, minecraft_version):
+        minimum, maximum, _ = minecraft_requirement(minecraft_version)
+        return runtime, f"Java version is {runtime.major} but Minecraft {minecraft_version} needs at least {minimum}" + (f" and at most {maximum}" if maximum else "")
+    return runtime, None
+
+
+index = JavaIndex() # shared by the whole process, see JavaIndex.load
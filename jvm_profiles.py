@@ -0,0 +1,179 @@
+"""
+JVM tuning profiles for the start files.
+
+A profile is a set of flags, plus flags that depend on the heap size (the last rule whose
+min_heap_mb is reached applies). The flags of a profile are checked against the Java version
+of the server: a flag the runtime doesn't support is rejected with a ProfileError.
+
+Users can add profiles in a JSON file (see profiles_path), e.g.:
+{
+    "my-g1": {
+        "description": "Aikar's flags with a longer pause target",
+        "extends": "aikar",
+        "flags": ["-XX:MaxGCPauseMillis=130"],
+        "heap_flags": [[16384, ["-XX:G1HeapRegionSize=32M"]]]
+    }
+}
+"""
+import json
+import os
+from dataclasses import dataclass, field
+
+from paths import config_dir
+
+# flag name: (first Java version supporting it, last Java version supporting it or None)
+FLAG_SUPPORT = {
+    "UseG1GC": (7, None),
+    "G1NewSizePercent": (8, None),
+    "G1MaxNewSizePercent": (8, None),
+    "G1HeapRegionSize": (7, None),
+    "G1ReservePercent": (7, None),
+    "G1HeapWastePercent": (7, None),
+    "G1MixedGCCountTarget": (7, None),
+    "G1MixedGCLiveThresholdPercent": (8, None),
+    "G1RSetUpdatingPauseTimePercent": (8, None),
+    "InitiatingHeapOccupancyPercent": (7, None),
+    "UseZGC": (15, None), # experimental from 11 to 14
+    "ZGenerational": (21, 23),
+    "UseShenandoahGC": (12, None), # not in every build (e.g. Oracle JDK)
+    "ActiveProcessorCount": (10, None),
+    "UseTransparentHugePages": (7, None),
+}
+
+# Aikar's flags, https://docs.papermc.io/paper/aikars-flags
+AIKAR_FLAGS = [
+    "-XX:+UseG1GC", "-XX:+ParallelRefProcEnabled", "-XX:MaxGCPauseMillis=200", "-XX:+UnlockExperimentalVMOptions",
+    "-XX:+DisableExplicitGC", "-XX:+AlwaysPreTouch", "-XX:G1HeapWastePercent=5", "-XX:G1MixedGCCountTarget=4",
+    "-XX:G1MixedGCLiveThresholdPercent=90", "-XX:G1RSetUpdatingPauseTimePercent=5", "-XX:SurvivorRatio=32",
+    "-XX:+PerfDisableSharedMem", "-XX:MaxTenuringThreshold=1",
+    "-Dusing.aikars.flags=https://mcflags.emc.gs", "-Daikars.new.flags=true",
+]
+
+
+class ProfileError(Exception):
+    """
+    Raised for an unknown profile or flags the Java runtime doesn't support.
+    """
+
+
+@dataclass
+class Profile:
+    name: str
+    description: str = ""
+    flags: list[str] = field(default_factory=list)
+    heap_flags: list[tuple[int, list[str]]] = field(default_factory=list) # (min_heap_mb, flags)
+    min_java: int|None = None
+
+
+BUILTIN_PROFILES = {profile.name: profile for profile in [
+    Profile("default", "No tuning, the JVM defaults."),
+    Profile("aikar", "Aikar's G1 flags, the region sizes scale with the heap.", AIKAR_FLAGS, [
+        (0, ["-XX:G1NewSizePercent=30", "-XX:G1MaxNewSizePercent=40", "-XX:G1HeapRegionSize=8M", "-XX:G1ReservePercent=20", "-XX:InitiatingHeapOccupancyPercent=15"]),
+        (12 * 1024, ["-XX:G1NewSizePercent=40", "-XX:G1MaxNewSizePercent=50", "-XX:G1HeapRegionSize=16M", "-XX:G1ReservePercent=15", "-XX:InitiatingHeapOccupancyPercent=20"]),
+    ], 8),
+    Profile("zgc", "ZGC, low pauses for large heaps (16 GB and more).", ["-XX:+UseZGC", "-XX:+AlwaysPreTouch", "-XX:+DisableExplicitGC", "-XX:+PerfDisableSharedMem"], min_java=15),
+    Profile("zgc-generational", "Generational ZGC (Java 21 to 23).", ["-XX:+UseZGC", "-XX:+ZGenerational", "-XX:+AlwaysPreTouch", "-XX:+DisableExplicitGC", "-XX:+PerfDisableSharedMem"], min_java=21),
+    Profile("shenandoah", "Shenandoah, low pauses for large heaps (OpenJDK builds only).", ["-XX:+UseShenandoahGC", "-XX:+AlwaysPreTouch", "-XX:+DisableExplicitGC", "-XX:+PerfDisableSharedMem"], min_java=12),
+]}
+
+AUTO_PROFILE = "auto" # aikar, or (generational) ZGC for heaps of 16 GB and more on Java 21+
+
+LARGE_HEAP_MB = 16 * 1024
+
+
+def profiles_path() -> str:
+    return os.environ.get("MSM_JVM_PROFILES") or os.path.join(config_dir(), "jvm_profiles.json")
+
+
+def load_profiles(path: str|None = None) -> dict[str, Profile]:
+    """
+    It returns the built-in profiles and the profiles of the user file, which can extend the
+    built-in ones.
+
+    :param path: The path to the user file, defaults to profiles_path()
+    """
+    profiles = dict(BUILTIN_PROFILES)
+    path = path or profiles_path()
+    if not os.path.isfile(path):
+        return profiles
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            user_profiles = json.load(f)
+        except ValueError as e:
+            raise ProfileError(f"Invalid JVM profiles file {path}: {e}")
+    try:
+        for name, data in user_profiles.items():
+            extends = data.get("extends")
+            if extends and extends not in profiles:
+                raise ProfileError(f"Profile {name} extends the unknown profile {extends}")
+            base = profiles[extends] if extends else Profile(name)
+            profiles[name] = Profile(
+                name,
+                data.get("description", base.description),
+                base.flags + list(data.get("flags", [])),
+                base.heap_flags + [(int(min_heap), list(flags)) for min_heap, flags in data.get("heap_flags", [])],
+                data.get("min_java", base.min_java),
+            )
+    except (AttributeError, TypeError, ValueError) as e: # e.g. a list instead of an object
+        raise ProfileError(f"Invalid JVM profiles file {path}: {e}")
+    return profiles
+
+
+def flag_name(flag: str) -> str|None:
+    """
+    It returns the name of a -XX flag ("-XX:+UseG1GC" and "-XX:G1HeapRegionSize=8M" give
+    "UseG1GC" and "G1HeapRegionSize"), None for other arguments.
+    """
+    if not flag.startswith("-XX:"):
+        return None
+    return flag[4:].lstrip("+-").split("=", 1)[0]
+
+
+def unsupported_flags(flags: list[str], java_major: int) -> list[str]:
+    """
+    It returns the flags of the list that the Java version doesn't support, per FLAG_SUPPORT.
+    """
+    unsupported = []
+    for flag in flags:
+        first, last = FLAG_SUPPORT.get(flag_name(flag), (None, None))
+        if (first is not None and java_major < first) or (last is not None and java_major > last):
+            unsupported.append(flag)
+    return unsupported
+
+
+def resolve_flags(profile_name: str, heap_mb: int, java_major: int|None = None, large_pages: bool = False, active_processor_count: int|None = None, profiles: dict[str, Profile]|None = None) -> list[str]:
+    """
+    It returns the JVM flags of a profile for a heap size and a Java version.
+
+    :param profile_name: The name of the profile, or "auto"
+    :param heap_mb: The maximum heap (-Xmx), in MB
+    :param java_major: The major Java version of the server, None if unknown (flags aren't checked)
+    :param large_pages: If -XX:+UseLargePages should be added (the OS must be configured for it)
+    :param active_processor_count: The number of CPUs the JVM sizes its threads for, defaults to all
+    :param profiles: The available profiles, defaults to load_profiles()
+    :return: The flags, without -Xms/-Xmx.
+    """
+    profiles = profiles if profiles is not None else load_profiles()
+    if profile_name == AUTO_PROFILE:
+        if heap_mb >= LARGE_HEAP_MB and java_major is not None and java_major >= 21:
+            profile_name = "zgc-generational" if java_major <= 23 else "zgc" # ZGC is always generational since Java 24
+        else:
+            profile_name = "aikar"
+    if profile_name not in profiles:
+        raise ProfileError(f"Unknown JVM profile {profile_name}, available: {', '.join(sorted(profiles))}")
+    profile = profiles[profile_name]
+    if java_major is not None and profile.min_java is not None and java_major < profile.min_java:
+        raise ProfileError(f"The JVM profile {profile_name} needs Java {profile.min_java} or newer, the server uses Java {java_major}")
+    flags = list(profile.flags)
+    heap_rules = [rule for rule in profile.heap_flags if heap_mb >= rule[0]]
+    if heap_rules:
+        flags += max(heap_rules, key=lambda rule: rule[0])[1]
+    if large_pages:
+        flags.append("-XX:+UseLargePages")
+    if active_processor_count:
+        flags.append(f"-XX:ActiveProcessorCount={int(active_processor_count)}")
+    if java_major is not None:
+        unsupported = unsupported_flags(flags, java_major)
+        if unsupported:
+            raise ProfileError(f"Java {java_major} doesn't support {', '.join(unsupported)} (JVM profile {profile_name})")
+    return flags
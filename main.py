@@ -1,14 +1,26 @@
+import json
 import os
 import sys
 import threading
+import time
 import webbrowser
 from os import chdir
 
 import PySimpleGUI as sg
 
 import settings
-from get_papermc import get_builds, get_download_url, get_versions
-from setup_server import setup_server
+from capacity import plan, read_host_resources
+from jvm_profiles import AUTO_PROFILE, BUILTIN_PROFILES, ProfileError, load_profiles, profiles_path
+from progress import BytesProgress, ErrorEvent, Finished, ProgressBus, StageStarted
+from server_properties import SCHEMA, ServerProperties, validate_values
+
+# get_papermc (requests) and setup_server are imported when needed, so the window shows up first
+
+LOADING_VERSIONS = "loading versions..."
+
+BENCH_PATH = os.environ.get("MSM_STARTUP_BENCH") # see benchmarks/startup.py
+
+bench_marks = {}
 
 
 def read_file(file_path):
@@ -32,6 +44,75 @@ def write_file(file_path, content):
         f.write(content)
 
 
+def load_versions(window):
+    """
+    It sends the versions to the window: the cached ones first if there are some, then the ones of
+    the API. Runs in a thread.
+
+    :param window: The main window, receiving "--VERSIONS-LOADED--" or "--VERSIONS-ERROR--"
+    """
+    from get_papermc import get_cached_versions, get_versions
+    cached = get_cached_versions()
+    if cached:
+        window.write_event_value("--VERSIONS-LOADED--", cached)
+    try:
+        versions = get_versions()
+    except Exception as e:
+        if not cached:
+            window.write_event_value("--VERSIONS-ERROR--", str(e))
+        return
+    if versions != cached:
+        window.write_event_value("--VERSIONS-LOADED--", versions)
+
+
+def load_builds(window, version):
+    """
+    It sends the builds of a version to the window. Runs in a thread.
+
+    :param window: The main window, receiving "--BUILDS-LOADED--" or "--BUILDS-ERROR--"
+    :param version: The Minecraft version
+    """
+    from get_papermc import get_builds
+    try:
+        window.write_event_value("--BUILDS-LOADED--", (version, sorted(get_builds(version), reverse=True)))
+    except Exception as e:
+        window.write_event_value("--BUILDS-ERROR--", (version, str(e)))
+
+
+def create_server(target, values, bus):
+    """
+    It resolves the download URL of the chosen build, then creates or updates the server with
+    target. Runs in a thread, so the window doesn't freeze or crash when the API can't be reached.
+
+    :param target: setup_server or update_server
+    :param values: The values of the main window
+    :param bus: The progress bus of the loading window, receiving an error and Finished if the URL
+    can't be resolved
+    """
+    from get_papermc import get_download_url
+    try:
+        url = get_download_url(values["--DROPDOWN-VERSIONS--"], values["--DROPDOWN-BUILDS--"])
+    except Exception as e:
+        text = f"The download URL of Paper {values['--DROPDOWN-VERSIONS--']} build {values['--DROPDOWN-BUILDS--']} couldn't be resolved: {e}"
+        bus.publish(ErrorEvent(job=values["--NAME--"], text=text, title="PaperMC API"))
+        bus.publish(Finished(job=values["--NAME--"], errors=[text]))
+        return
+    target(url, values, bus)
+
+
+def bench_mark(name, error: str|None = None):
+    """
+    It records the time of a startup step for benchmarks/startup.py, and exits once the window
+    is interactive, or once the versions failed to load (the run is then tagged with the error).
+    """
+    if BENCH_PATH and name not in bench_marks:
+        bench_marks[name] = time.time()
+        if name == "first_interactive":
+            with open(BENCH_PATH, "w", encoding="utf-8") as f:
+                json.dump(dict(bench_marks, error=error) if error else bench_marks, f)
+            os._exit(0)
+
+
 if __name__ == "__main__":
 
     if getattr(sys, "frozen", False):  # Running as compiled
@@ -41,7 +122,7 @@ if __name__ == "__main__":
 
     settings.init()
 
-    settings.add("folder_path", os.path.join(os.path.join(os.environ["USERPROFILE"]), "Desktop\\"))
+    settings.add("folder_path", os.path.join(os.path.join(os.environ.get("USERPROFILE", os.path.expanduser("~"))), "Desktop\\"))
 
     tab1_layout =  [
         [
@@ -55,7 +136,8 @@ if __name__ == "__main__":
         ],
         [
             sg.Text("Version:"),
-            sg.DropDown(get_versions()[::-1], key="--DROPDOWN-VERSIONS--", tooltip="The version of Minecraft that the server will be.", readonly=True, enable_events=True)
+            sg.DropDown([], default_value=LOADING_VERSIONS, key="--DROPDOWN-VERSIONS--", tooltip="The version of Minecraft that the server will be.", size=(20, 30), readonly=True, disabled=True, enable_events=True),
+            sg.Button("Reload", key="--RELOAD-VERSIONS--", tooltip="Fetch the versions again.")
         ],
         [
             sg.Text("Build:"),
@@ -64,14 +146,23 @@ if __name__ == "__main__":
         [sg.Checkbox("Accept EULA", key="--ACCEPT-EULA--", default=True)]
         ]
 
-    server_properties_template = read_file("template/server.properties")
+    server_properties_template = ServerProperties.parse(read_file("template/server.properties"))
 
-    column = [
-        [
-            sg.Text(line.split("=")[0] + "="),
-            sg.Input("" if len(line.split("=")) == 1 else line.split("=")[1], size=((5,1) if line.split("=")[0] in ["true", "false"] else (20,1)))
-        ] for line in server_properties_template.split("\n") if len(line) != 0
-        ]
+    host = read_host_resources()
+    capacity_plan = plan(20, host) # the template is made for 20 players
+    max_ram = max(2048, host.total_mb // 512 * 512)
+    try:
+        jvm_profiles, profiles_error = load_profiles(), None
+    except ProfileError as e: # a broken user file must not keep the window from opening
+        jvm_profiles, profiles_error = dict(BUILTIN_PROFILES), str(e)
+    planned_properties = capacity_plan.properties()
+
+    property_inputs = {
+        key: sg.Input(planned_properties.get(key, value), size=(5,1) if key in SCHEMA and SCHEMA[key].kind == "bool" else (20,1))
+        for key, value in server_properties_template.as_dict().items()
+        }
+    column = [[sg.Text(key + "="), element] for key, element in property_inputs.items()]
+    initial_properties = {key: element.DefaultText for key, element in property_inputs.items()}
 
 
     tab2_layout = [
@@ -94,10 +185,19 @@ if __name__ == "__main__":
             sg.Input(key="--CUSTOM-JAVA--", tooltip="The path to the Java executable.\nLeave blank to use the default Java path.\ne.g. C:\Program Files (x86)\Common Files\Oracle\Java\javapath\java.exe"),
             sg.FileBrowse(button_text="Browse", tooltip="Select your Java executable.")],
         [
-            sg.Slider(range=(1024,10240), resolution=512, default_value=2048, orientation="horizontal", key="--XMS--", enable_events=True),
-            sg.Slider(range=(1024,10240), resolution=512, default_value=2048, orientation="horizontal", key="--XMX--", enable_events=True)
+            sg.Slider(range=(1024,max_ram), resolution=512, default_value=capacity_plan.heap_mb, orientation="horizontal", key="--XMS--", enable_events=True),
+            sg.Slider(range=(1024,max_ram), resolution=512, default_value=capacity_plan.heap_mb, orientation="horizontal", key="--XMX--", enable_events=True)
         ],
         [sg.Checkbox("Sync RAM (recommended)", key="--ENABLE-SYNC-RAM--", default=True, enable_events=True)],
+        [
+            sg.Text("Expected players:"),
+            sg.Spin(list(range(1, 1001)), initial_value=20, key="--PLAYERS--", size=5),
+            sg.Button("Recommend", key="--PLAN--", tooltip=f"Sizes the RAM and the view/simulation distances, network compression and entity broadcast range\nfor this number of players, from the {host.total_mb} MB of RAM ({host.available_mb} MB available) and the {host.cpus} CPU cores of this computer.")
+        ],
+        [
+            sg.Text("JVM profile:"),
+            sg.DropDown([AUTO_PROFILE] + list(jvm_profiles), default_value=AUTO_PROFILE, key="--JVM-PROFILE--", readonly=True, tooltip="The garbage collector and JVM flags of the start file.\nauto: Aikar's flags, or ZGC for 16 GB of RAM and more with Java 21+.\nCustom profiles can be added in " + profiles_path())
+        ],
         [sg.Text("Warning: Some versions may not accept some of these options!")],
         [
             sg.Checkbox("Server GUI", key="--ENABLE-GUI--", default=True, tooltip="Doesn\"t open the GUI when launching the server.\nYou will still be able to interact with your server, but you must use the cmd or Terminal if enabled."),
@@ -113,6 +213,13 @@ if __name__ == "__main__":
             sg.Checkbox("Demo Mode", key="--DEMO-MODE--", default=False, tooltip="If the server is in demo mode. (Shows the players a demo pop-up, and players cannot break or place blocks or eat if the demo time has expired).\nEquivalent to playing Minecraft without an account, you have about 5 in-game days before your trial ends."),
             sg.Checkbox("Online Authentication", key="--ONLINE-AUTHENTICATION--", default=False, tooltip="To tell the server to run in online mode so only authenticated users can join.\nNo cracked accounts are allowed to join."),
             sg.Checkbox("Auto Restart", key="--AUTO-RESTART--", default=False, tooltip="If the server should automatically restart when it crashes."),
+            sg.Checkbox("Supervised", key="--SUPERVISOR--", default=True, tooltip="Auto Restart waits longer after every crash in a row and gives up when the server keeps crashing,\nthe console is saved in logs/console.log and the RAM and CPU used in logs/supervisor.jsonl.\nThe start file falls back to restarting right away if Python or Minecraft Server Maker was moved."),
+        ],
+        [sg.Checkbox("Enable RCON", key="--RCON--", default=False, tooltip="Enables RCON with a random password (rcon.password in server.properties),\nso python -m msm telemetry can follow the TPS and MSPT of the server.")],
+        [sg.Checkbox("Prepare the first start", key="--WARMUP--", default=False, tooltip="Patches the server jar and downloads its libraries once, in a cache shared by all your servers,\nso the first start of the server is faster and the files are stored only once.\nNeeds Java and an internet access, the first time for each build.")],
+        [
+            sg.Text("Plugins:"),
+            sg.Input(key="--PLUGINS--", tooltip="Plugins to install with their dependencies, separated by spaces or commas:\nModrinth projects (luckperms), Hangar projects (hangar:ViaVersion),\noptionally with a version (worldedit@7.3.0 or worldedit@>=7.2,<8).\nOnly versions supporting the Minecraft version of the server are installed.")
         ],
         [
             sg.Text("Other arguments:"),
@@ -129,63 +236,114 @@ if __name__ == "__main__":
     window = sg.Window("Minecraft Server Maker", layout, resizable=True, icon="MMA.ico", finalize=True)
 
     settings.add("window", window)
+    bench_mark("first_window")
+    if profiles_error:
+        sg.popup_error(f"{profiles_error}\nOnly the built-in JVM profiles are available.", title="JVM profiles", icon="MMA.ico")
+
+    versions = []
+    threading.Thread(target=load_versions, args=(window,), daemon=True).start()
 
     while True:
         event, values = window.read()
         if event == sg.WIN_CLOSED:
             window.close()
             os._exit(0)
+        elif event == "--VERSIONS-LOADED--":
+            versions = values[event][::-1]
+            current = values["--DROPDOWN-VERSIONS--"]
+            window["--DROPDOWN-VERSIONS--"].update(value=current if current in versions else "", values=versions, disabled=False)
+            bench_mark("first_interactive")
+        elif event == "--VERSIONS-ERROR--":
+            bench_mark("first_interactive", error=values[event]) # before the popup, which blocks
+            window["--DROPDOWN-VERSIONS--"].update(value="offline, click Reload", disabled=True)
+            sg.popup_error(f"The versions could not be fetched:\n{values[event]}", title="Error", icon="MMA.ico")
+        elif event == "--RELOAD-VERSIONS--":
+            if not versions:
+                window["--DROPDOWN-VERSIONS--"].update(value=LOADING_VERSIONS)
+            threading.Thread(target=load_versions, args=(window,), daemon=True).start()
+        elif event == "--BUILDS-LOADED--":
+            version, builds = values[event]
+            if version == values["--DROPDOWN-VERSIONS--"]: # not an answer for a version selected before
+                window["--DROPDOWN-BUILDS--"].update(values=builds, disabled=False)
+        elif event == "--BUILDS-ERROR--":
+            version, error = values[event]
+            if version == values["--DROPDOWN-VERSIONS--"]:
+                window["--DROPDOWN-BUILDS--"].update(values=[""], disabled=False)
+                sg.popup_error(f"The builds of {version} could not be fetched:\n{error}", title="Error", icon="MMA.ico")
         elif event == "--POPUP--":
             sg.popup(values[event]["text"], title=values[event]["title"], icon="MMA.ico")
         elif event == "--POPUP-ERROR--":
             sg.popup_error(values[event]["text"], title=values[event]["title"], icon="MMA.ico")
         elif event == "--DROPDOWN-VERSIONS--":
-            window["--DROPDOWN-BUILDS--"].update(values=sorted(get_builds(values["--DROPDOWN-VERSIONS--"]), reverse=True))
-        elif event == "Create server" and "" in [values["--NAME--"], values["--DROPDOWN-VERSIONS--"], values["--DROPDOWN-BUILDS--"]]:
+            window["--DROPDOWN-BUILDS--"].update(values=["loading..."], disabled=True)
+            threading.Thread(target=load_builds, args=(window, values["--DROPDOWN-VERSIONS--"]), daemon=True).start()
+        elif event == "Create server" and ("" in [values["--NAME--"], values["--DROPDOWN-VERSIONS--"], values["--DROPDOWN-BUILDS--"]] or values["--DROPDOWN-VERSIONS--"] not in versions or not str(values["--DROPDOWN-BUILDS--"]).isdigit()):
             sg.popup("Please fill in all fields", icon="MMA.ico")
             continue
         elif event == "Create server":
+            from setup_server import setup_server
+            from update_server import update_server
             if not values["--ACCEPT-EULA--"]:
                 sg.popup_ok("You must accept the EULA to continue. You can read it there: https://account.mojang.com/documents/minecraft_eula", icon="MMA.ico")
                 continue
+            target = setup_server
             if os.path.exists(os.path.join(values["--FOLDER-PATH--"],values["--NAME--"])):
-                answer = sg.popup_yes_no("A folder already exists with this name. It will erase it!\nDo you want to continue?", title="Do you want to continue?", icon="MMA.ico")
-                if answer == "No":
+                answer = sg.popup("A folder already exists with this name.\nUpdate: keep the worlds, plugins and other properties, only replace the JAR file if it changed and apply the properties you modified.\nReplace: erase the folder and create a new server.", title="The server already exists", custom_text=("Update", "Replace"), icon="MMA.ico")
+                if answer is None:
+                    continue
+                if answer == "Update":
+                    target = update_server
+                elif sg.popup_yes_no("The folder and its worlds will be erased!\nDo you want to continue?", title="Do you want to continue?", icon="MMA.ico") == "No":
                     continue
-            server_properties = "".join(element[0].get() + element[1].get() + "\n" for element in column)
+            server_properties = {key: element.get() for key, element in property_inputs.items()}
+            errors = validate_values(server_properties)
+            if errors:
+                sg.popup_error("Invalid server properties:\n" + "\n".join(str(error) for error in errors), title="Server Properties", icon="MMA.ico")
+                continue
+            if target is update_server: # only the properties modified in the tab
+                server_properties = {key: value for key, value in server_properties.items() if value != initial_properties.get(key)}
             settings.add("server_properties", server_properties)
-            server_properties = settings.get("server_properties")
             settings.add("folder_name", values["--NAME--"])
             settings.add("minecraft_version", values["--DROPDOWN-VERSIONS--"])
+            settings.add("build", values["--DROPDOWN-BUILDS--"])
             settings.add("folder_path", window["--FOLDER-PATH--"].get()+"\\")
-            threading.Thread(target=setup_server, args=(get_download_url(values["--DROPDOWN-VERSIONS--"], values["--DROPDOWN-BUILDS--"]),)).start()
+            title = "Creating server..." if target is setup_server else "Updating server..."
+            bus = ProgressBus(min_interval=0.1) # at most 10 refreshes per second
+            threading.Thread(target=create_server, args=(target, values, bus)).start()
             layout_loading = [
-                [sg.Image(sg.DEFAULT_BASE64_LOADING_GIF, key="--LOADING-IMAGE--")],
-                [sg.Text("Creating server...", key="--LOADING-TEXT--")]
+                [sg.Text(title, key="--LOADING-TEXT--", size=(40, 2))],
+                [sg.ProgressBar(1000, orientation="h", size=(30, 20), key="--PROGRESS-BAR--")],
+                [sg.Text("", key="--PROGRESS-TEXT--", size=(40, 1))]
             ]
             loading_window = sg.Window("", layout_loading, modal=True, finalize=True, icon="MMA.ico", element_justification="center", disable_close=True)
-            while True:
-                loading_window.read(timeout=50)
-                loading_window["--LOADING-IMAGE--"].update_animation(sg.DEFAULT_BASE64_LOADING_GIF, time_between_frames=100)
-                event, values = window.read(timeout=50)
-                if event == "--FINISHED--":
-                    loading_window.close()
-                    answer = sg.popup_ok("Server created!", icon="MMA.ico")
-                    if answer == "OK":
-                        # open the folder in the explorer
-                        os.startfile(os.path.join(values["--FOLDER-PATH--"],values["--NAME--"]))
-                    break
-                elif event == "--POPUP-ERROR--":
-                    sg.popup_error(values[event]["text"], title=values[event]["title"], icon="MMA.ico")
-                    if values[event]["text"].startswith("Java is not installed!") or values[event]["text"].startswith("Java version is"):
-                        if values[event]["text"].startswith("Java is not installed!"):
-                            answer = sg.popup_yes_no("Java is not installed!\nDo you want to download it?", title="Java is not installed!", icon="MMA.ico")
-                        else:
-                            answer = sg.popup_yes_no("The version of Java is outdated!\nDo you want to download the latest version?", title="Your version of Java is outdated!", icon="MMA.ico")
-                        if answer == "Yes":
-                            webbrowser.open("https://adoptium.net")
-                elif event == "--UPDATE--":
-                    loading_window["--LOADING-TEXT--"].update("Creating server...\n" + values[event])
+            bus.forward(lambda batch: loading_window.write_event_value("--PROGRESS--", batch))
+            finished = None
+            while finished is None:
+                _, loading_values = loading_window.read() # wakes up only when the bus has a batch
+                for progress_event in loading_values.get("--PROGRESS--", []):
+                    if isinstance(progress_event, StageStarted):
+                        loading_window["--LOADING-TEXT--"].update(f"{title}\n{progress_event.text}")
+                    elif isinstance(progress_event, BytesProgress):
+                        if progress_event.total:
+                            loading_window["--PROGRESS-BAR--"].update(current_count=int(1000 * progress_event.done / progress_event.total))
+                        loading_window["--PROGRESS-TEXT--"].update(progress_event.summary())
+                    elif isinstance(progress_event, ErrorEvent):
+                        sg.popup_error(progress_event.text, title=progress_event.title, icon="MMA.ico")
+                        if progress_event.text.startswith("Java is not installed!") or progress_event.text.startswith("Java version is"):
+                            if progress_event.text.startswith("Java is not installed!"):
+                                answer = sg.popup_yes_no("Java is not installed!\nDo you want to download it?", title="Java is not installed!", icon="MMA.ico")
+                            else:
+                                answer = sg.popup_yes_no("The version of Java is outdated!\nDo you want to download the latest version?", title="Your version of Java is outdated!", icon="MMA.ico")
+                            if answer == "Yes":
+                                webbrowser.open("https://adoptium.net")
+                    elif isinstance(progress_event, Finished):
+                        finished = progress_event
+            bus.close()
+            loading_window.close()
+            answer = sg.popup_ok(("Server created!" if target is setup_server else "Server updated!") if not finished.errors else "The server has errors, see the previous messages.", icon="MMA.ico")
+            if answer == "OK" and not finished.errors:
+                # open the folder in the explorer
+                os.startfile(os.path.join(values["--FOLDER-PATH--"],values["--NAME--"]))
         elif (event == "--ENABLE-SYNC-RAM--" and values["--ENABLE-SYNC-RAM--"]) or (event == "--XMS--" and values["--ENABLE-SYNC-RAM--"]):
             window["--XMX--"].update(value=values["--XMS--"])
         elif event == "--XMX--" and values["--XMX--"] < values["--XMS--"]:
@@ -194,5 +352,17 @@ if __name__ == "__main__":
         elif event == "--XMS--" and values["--XMS--"] > values["--XMX--"]:
             window["--XMS--"].update(value=values["--XMX--"])
             sg.popup("XMS must be less than XMX", icon="MMA.ico")
+        elif event == "--PLAN--":
+            try:
+                capacity_plan = plan(int(values["--PLAYERS--"]), host)
+            except ValueError:
+                sg.popup("The number of players must be a number", icon="MMA.ico")
+                continue
+            window["--XMS--"].update(value=capacity_plan.heap_mb)
+            window["--XMX--"].update(value=capacity_plan.heap_mb)
+            for key, value in capacity_plan.properties().items():
+                if key in property_inputs:
+                    property_inputs[key].update(value=value)
+            sg.popup(capacity_plan.explain(), title=f"Recommended settings for {capacity_plan.players} players", icon="MMA.ico")
         elif event == "--MORE-INFO--":
             webbrowser.open("https://minecraft.fandom.com/wiki/Tutorials/Setting_up_a_server#Java_options")
@@ -0,0 +1,194 @@
+"""
+Local mirror of the PaperMC API, for hosts with a slow or no internet access.
+
+A mirror is a directory with the layout of the API, every endpoint ending with / being stored as
+its INDEX_FILE:
+
+mirror/index.json                                           the versions
+mirror/versions/1.20.4/index.json                           the builds of a version
+mirror/versions/1.20.4/builds/400/index.json                a build
+mirror/versions/1.20.4/builds/400/downloads/paper-1.20.4-400.jar
+
+Only the mirrored versions and builds are listed in the indexes. The mirror is served over HTTP
+(see make_server), or used directly as a file:// URL (e.g. on a shared drive), by setting MSM_PAPER_API
+or the --api-url option of msm to its URL.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from downloader import DownloadError, download_file
+from get_papermc import INDEX_FILE, PaperApiClient, PaperApiError
+from jar_store import JarStore
+
+SERVE_PREFIX = "/v2/projects/paper/" # the path of the API served by make_server
+
+
+@dataclass
+class SyncReport:
+    versions: list[str] = field(default_factory=list)
+    builds_fetched: int = 0 # build metadata written
+    builds_skipped: int = 0 # build metadata already in the mirror
+    jars_downloaded: int = 0
+    jars_linked: int = 0 # taken from the local jar store instead of the network
+    jars_skipped: int = 0 # already in the mirror
+    bytes: int = 0
+    errors: list[str] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class Mirror:
+    """
+    A mirror directory, see the module docstring.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        self._lock = threading.Lock()
+
+    def index_path(self, *parts: str) -> str:
+        return os.path.join(self.directory, *parts, INDEX_FILE)
+
+    def jar_path(self, version: str, build: int) -> str:
+        return os.path.join(self.directory, "versions", version, "builds", str(build), "downloads", f"paper-{version}-{build}.jar")
+
+    def read_index(self, *parts: str) -> dict|None:
+        try:
+            with open(self.index_path(*parts), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_index(self, data: dict, *parts: str):
+        """
+        It writes the index of an endpoint atomically, so it can be served while syncing.
+        """
+        path = self.index_path(*parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    def mirrored_builds(self, version: str, with_jars: bool = True) -> list[int]:
+        """
+        It returns the builds of a version in the mirror, sorted. With with_jars, only the builds
+        whose jar is in the mirror.
+        """
+        builds_dir = os.path.join(self.directory, "versions", version, "builds")
+        if not os.path.isdir(builds_dir):
+            return []
+        builds = [int(name) for name in os.listdir(builds_dir) if name.isdigit() and self.read_index("versions", version, "builds", name) is not None]
+        return sorted(build for build in builds if not with_jars or os.path.isfile(self.jar_path(version, build)))
+
+    def sync(self, client: PaperApiClient, versions: list[str]|None = None, latest_versions: int|None = None, builds: int = 1, jars: bool = True, max_workers: int = 8, log=None) -> SyncReport:
+        """
+        It fetches the metadata and the jars of the latest builds of some versions into the mirror,
+        concurrently. Build metadata and jars already in the mirror are skipped, they never change.
+
+        :param client: The client of the upstream API
+        :param versions: The versions to mirror, defaults to all of them (see latest_versions)
+        :param latest_versions: Only mirror this many of the latest versions, defaults to None (all)
+        :param builds: How many of the latest builds of each version are mirrored
+        :param jars: If the jars are mirrored too, not only the metadata
+        :param max_workers: How many requests and downloads run at once
+        :param log: A callable receiving progress messages, defaults to None
+        :return: What was fetched and skipped.
+        """
+        if builds < 1 or latest_versions is not None and latest_versions < 1:
+            raise ValueError("builds and latest_versions must be at least 1") # [-0:] would select everything
+        log = log or (lambda message: None)
+        report = SyncReport()
+        project = client.get_json(client.versions_url())
+        available = project["versions"]
+        selected = [str(version) for version in versions] if versions else list(available)
+        unknown = [version for version in selected if version not in available]
+        if unknown:
+            raise ValueError(f"Unknown version(s) {', '.join(unknown)}")
+        if latest_versions:
+            selected = sorted(selected, key=available.index)[-latest_versions:]
+        report.versions = selected
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            version_indexes = dict(zip(selected, executor.map(lambda version: client.get_json(client.builds_url(version)), selected)))
+            wanted = [(version, build) for version, index in version_indexes.items() for build in index["builds"][-builds:]]
+            for _ in executor.map(lambda item: self._sync_build(client, *item, jars, report, log), wanted):
+                pass
+
+        for version, index in version_indexes.items():
+            self.write_index(dict(index, builds=self.mirrored_builds(version, jars)), "versions", version)
+        mirrored = [version for version in available if self.mirrored_builds(version, jars)]
+        self.write_index(dict(project, versions=mirrored))
+        return report
+
+    def _sync_build(self, client: PaperApiClient, version: str, build: int, jars: bool, report: SyncReport, log):
+        try:
+            metadata = self.read_index("versions", version, "builds", str(build))
+            if metadata is None:
+                metadata = client.get_json(client.build_url(version, build))
+                self.write_index(metadata, "versions", version, "builds", str(build))
+                self._count(report, "builds_fetched")
+            else:
+                self._count(report, "builds_skipped")
+            if not jars:
+                return
+            path = self.jar_path(version, build)
+            if os.path.isfile(path):
+                self._count(report, "jars_skipped")
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            sha256 = metadata["downloads"]["application"]["sha256"]
+            if JarStore().link(sha256, path):
+                self._count(report, "jars_linked")
+                return
+            stats = download_file(client.get_download_url_raw(version, build), path, session=client.session, sha256=sha256)
+            self._count(report, "jars_downloaded")
+            self._count(report, "bytes", stats.done - stats.resumed)
+            log(f"{version}-{build}: {stats.summary()}")
+        except (PaperApiError, DownloadError, OSError, KeyError, ValueError) as e:
+            with self._lock:
+                report.errors.append(f"{version}-{build}: {e}")
+
+    def _count(self, report: SyncReport, name: str, count: int = 1):
+        with self._lock:
+            setattr(report, name, getattr(report, name) + count)
+
+
+class MirrorRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves a mirror directory under SERVE_PREFIX, an URL ending with / being answered with its
+    INDEX_FILE.
+    """
+
+    def translate_path(self, path: str) -> str:
+        path = unquote(urlparse(path).path)[len(SERVE_PREFIX):]
+        path = os.path.join(self.directory, *[part for part in path.split("/") if part not in ("", ".", "..")])
+        if os.path.isdir(path):
+            path = os.path.join(path, INDEX_FILE)
+        return path
+
+    def send_head(self):
+        if not urlparse(self.path).path.startswith(SERVE_PREFIX):
+            self.send_error(404)
+            return None
+        return super().send_head()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(directory: str, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+    """
+    It returns an HTTP server of a mirror, not started (see serve_forever).
+
+    :param directory: The mirror directory
+    :param host: The address to listen on, 0.0.0.0 for the whole network
+    :param port: The port to listen on, 0 for any free port
+    """
+    directory = os.path.abspath(directory)
+    return ThreadingHTTPServer((host, port), lambda *args: MirrorRequestHandler(*args, directory=directory))
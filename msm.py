@@ -0,0 +1,668 @@
+"""
+Headless command line of Minecraft Server Maker.
+
+Usage:
+python -m msm create --manifest servers.toml [--workers 4] [--accept-eula]
+python -m msm update --manifest servers.toml [--dry-run]
+(create and update also take --events FILE, "-" for stdout, to stream the progress as JSON lines)
+python -m msm plan --players 40 [--servers 1] [--json]
+python -m msm mirror sync --dir mirror [--versions 1.20.4 1.19.4 | --latest-versions 3] [--builds 2]
+python -m msm mirror serve --dir mirror [--host 0.0.0.0] [--port 8080]
+python -m msm paperclip
+python -m msm plugins --version 1.20.4 luckperms hangar:ViaBackwards worldedit@7.3.0
+python -m msm snapshot create --name lobby --server servers/lobby [--no-world]
+python -m msm snapshot clone --name lobby --manifest clones.toml
+python -m msm snapshot clone --name lobby --count 100 --folder servers [--prefix lobby] [--base-port 25566] [--set motd=Lobby]
+python -m msm snapshot list | delete --name lobby
+python -m msm properties --server servers/lobby [--server servers/survival] [--set view-distance=8] [--dry-run]
+python -m msm supervise [--dir servers/lobby] -- java -Xmx4096M -jar paper.jar --nogui
+python -m msm backup create --server servers/lobby [--store servers/backups]
+python -m msm backup restore --server servers/lobby [--id 20240102-030405] [--only world_nether]
+python -m msm backup list | prune --server servers/lobby [--keep 7]
+python -m msm telemetry --server servers/lobby [--server servers/survival] [--interval 10] [--jsonl FILE|-] [--prometheus 9225]
+python -m msm --api-url http://mirror-host:8080/v2/projects/paper/ create --manifest servers.toml
+(--modrinth-url and --hangar-url replace the plugin APIs the same way, see plugins)
+
+A manifest has an optional [defaults] table and a [[server]] array of tables (or, in JSON, a
+"defaults" object and a "servers" list), with the fields of setup_server.ServerSpec:
+
+[defaults]
+folder_path = "servers"
+version = "1.20.4" # or "latest", the default
+xmx = 4096
+
+[[server]]
+name = "lobby"
+build = 400 # the latest build of the version if missing
+jvm_args = "-XX:+UseG1GC"
+download_segments = 4 # the jar in 4 parallel HTTP ranges, when the server accepts ranges
+[server.properties]
+server-port = 25566
+
+[[server]]
+name = "survival"
+players = 40 # xms, xmx and the performance properties are planned for the host (see capacity)
+warmup = true # patch the jar once in the shared Paperclip cache (see paperclip_cache)
+plugins = ["luckperms", "hangar:ViaVersion@>=5"] # with their dependencies (see plugins)
+
+The servers with players share the RAM and CPU cores of the host. Fields and properties given in
+the manifest win over the plan.
+
+update brings the existing servers of a manifest to their fields without erasing them: the jar is
+replaced only if its hash differs, only the properties of the manifest are changed in
+server.properties and the start files are written only if they changed (see update_server).
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, fields
+
+from backup import BackupError, BackupStore, default_store
+from capacity import plan, read_host_resources
+from get_papermc import client as paper_client, get_download_url, get_latest_build, get_latest_version, set_api_url
+from mirror import SERVE_PREFIX, Mirror, make_server
+from paperclip_cache import PaperclipCache
+from plugins import PluginError, PluginResolver, set_api_urls
+from pipeline import Trace, export_traces
+from progress import Finished, ProgressBus, json_lines_sink
+from server_properties import ServerProperties, validate_values
+from setup_server import EULA_URL, ServerSpec, SetupContext, provision
+from snapshots import SnapshotError, SnapshotStore
+from supervisor import Supervisor, SupervisorConfig
+from telemetry import MetricsServer, RconError, ServerTelemetry, json_lines_sink as samples_sink, poll
+from update_server import update
+
+try:
+    import tomllib
+except ImportError: # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+SPEC_FIELDS = {f.name for f in fields(ServerSpec)}
+
+print_lock = threading.Lock()
+
+output = sys.stdout # sys.stderr when the events are streamed to stdout
+
+
+def log(*args, file=None):
+    with print_lock:
+        print(*args, file=file or output, flush=True)
+
+
+def load_manifest(path: str) -> list[dict]:
+    """
+    It reads a TOML or JSON manifest and returns the fields of each server, defaults included.
+
+    :param path: The path to the manifest
+    :return: A list of dicts of ServerSpec fields.
+    """
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    else:
+        if tomllib is None:
+            raise SystemExit("Reading TOML needs Python 3.11+ or the tomli package, use a JSON manifest instead.")
+        with open(path, "rb") as f:
+            manifest = tomllib.load(f)
+    defaults = manifest.get("defaults", {})
+    servers = []
+    for server in manifest.get("servers", manifest.get("server", [])):
+        server = {**defaults, **server, "properties": {**defaults.get("properties", {}), **server.get("properties", {})}}
+        unknown = set(server) - SPEC_FIELDS
+        if unknown:
+            raise SystemExit(f"Unknown field(s) {', '.join(sorted(unknown))} for server {server.get('name')!r}")
+        servers.append(server)
+    return servers
+
+
+def apply_plan(server: dict, host=None, servers: int = 1) -> dict:
+    """
+    It returns the fields of a server with the heap and properties planned for its players, if
+    it has a players field. The fields and properties of the server win over the plan.
+
+    :param server: The fields of the server
+    :param host: The resources of the host, see capacity.read_host_resources
+    :param servers: How many planned servers share the host
+    """
+    if not server.get("players"):
+        return server
+    capacity_plan = plan(server["players"], host, servers)
+    server = {"xmx": capacity_plan.heap_mb, **server, "properties": {**capacity_plan.properties(), **server.get("properties", {})}}
+    server.setdefault("xms", min(capacity_plan.heap_mb, server["xmx"]))
+    return server
+
+
+def make_spec(server: dict, accept_eula: bool = False) -> ServerSpec:
+    """
+    It returns the ServerSpec of the fields of a server, resolving the latest version and build.
+    """
+    server = dict(server)
+    server.setdefault("folder_path", os.getcwd())
+    if server.get("version", "latest") == "latest":
+        server["version"] = get_latest_version()
+    server["version"] = str(server["version"])
+    if server.get("build") is None:
+        server["build"] = get_latest_build(server["version"])
+    server["accept_eula"] = server.get("accept_eula", False) or accept_eula
+    return ServerSpec(**server)
+
+
+def run_job(server: dict, accept_eula: bool = False, verbose: bool = False, mode: str = "create", dry_run: bool = False, bus: ProgressBus|None = None) -> tuple[str, SetupContext|None, str|None]:
+    """
+    It resolves and creates (or updates, with mode "update") one server of a manifest.
+    The progress events are published on bus, if any.
+
+    :return: The name of the server, its context (None if it failed before being created) and
+    the error that stopped it, if any.
+    """
+    name = server.get("name", "?")
+    def notify(event: str, payload):
+        if event == "--POPUP-ERROR--":
+            log(f"[{name}] {payload['text']}", file=sys.stderr)
+        elif event == "--UPDATE--" and verbose:
+            log(f"[{name}] {payload}")
+    def failed(error: str) -> tuple[str, None, str]:
+        if bus is not None:
+            bus.publish(Finished(job=name, errors=[error]))
+        return name, None, error
+    try:
+        trace = Trace(name)
+        with trace.span("resolve"):
+            spec = make_spec(server, accept_eula)
+            if not spec.accept_eula and mode == "create":
+                return failed(f"The EULA must be accepted (accept_eula = true or --accept-eula): {EULA_URL}") # before any request, provision checks it too
+            url = get_download_url(spec.version, spec.build)
+        if mode == "update":
+            ctx = update(SetupContext(spec, url, notify, trace, bus), dry_run)
+        else:
+            ctx = provision(SetupContext(spec, url, notify, trace, bus))
+        return name, ctx, ctx.errors[0] if ctx.errors else None
+    except Exception as e:
+        return failed(str(e))
+
+
+def print_summary(results: list[tuple[str, SetupContext|None, str|None]]):
+    """
+    It prints a table of the servers with their status, the time of each stage and the wall time
+    (smaller than the sum of the stages, some of them run at the same time).
+    """
+    stages = []
+    for _, ctx, _ in results:
+        for stage in (ctx.timings if ctx else {}):
+            if stage not in stages:
+                stages.append(stage)
+    updates = any(ctx and ctx.changes for _, ctx, _ in results)
+    header = ["server", "version", "status"] + (["changes"] if updates else []) + stages + ["total"]
+    rows = []
+    for name, ctx, error in results:
+        status = "failed" if error else f"ok ({len(ctx.warnings)} warning(s))" if ctx.warnings else "ok"
+        row = [name, f"{ctx.spec.version}-{ctx.spec.build}" if ctx else "-", status]
+        if updates:
+            row.append(len(ctx.changes) if ctx else "-")
+        row += [f"{ctx.timings[stage]:.2f}s" if ctx and stage in ctx.timings else "-" for stage in stages]
+        row.append(f"{ctx.trace.wall_time():.2f}s" if ctx else "-")
+        rows.append(row)
+    widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+    for row in [header, ["-" * width for width in widths]] + rows:
+        log("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+    for name, ctx, _ in results:
+        if ctx and ctx.warmup:
+            log(f"{name}: {ctx.warmup.summary()}")
+        if ctx and ctx.plugins:
+            log(f"{name}: {ctx.plugins.summary()}")
+    for name, _, error in results:
+        if error:
+            log(f"{name}: {error}", file=sys.stderr)
+
+
+def run_manifest(args, mode: str = "create", dry_run: bool = False) -> int:
+    servers = load_manifest(args.manifest)
+    folders = [os.path.join(server.get("folder_path", os.getcwd()), server["name"]) for server in servers]
+    if len(set(folders)) != len(folders):
+        raise SystemExit("Two servers of the manifest have the same folder")
+    planned = sum(1 for server in servers if server.get("players"))
+    if planned:
+        host = read_host_resources()
+        servers = [apply_plan(server, host, planned) for server in servers]
+    global output
+    bus, events_file, forwarder = None, None, None
+    if args.events:
+        bus = ProgressBus(min_interval=0.25)
+        events_file = sys.stdout if args.events == "-" else open(args.events, "w", encoding="utf-8")
+        if events_file is sys.stdout:
+            output = sys.stderr
+        forwarder = bus.forward(json_lines_sink(events_file))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(lambda server: run_job(server, args.accept_eula, args.verbose, mode, dry_run, bus), servers))
+    if bus is not None:
+        bus.close()
+        forwarder.join()
+        if events_file is not sys.stdout:
+            events_file.close()
+    if dry_run:
+        for name, ctx, _ in results:
+            for change in (ctx.changes if ctx else []):
+                log(f"[{name}] {change}")
+    print_summary(results)
+    if args.trace:
+        export_traces([ctx.trace for _, ctx, _ in results if ctx], args.trace, chrome=args.trace_format == "chrome")
+    log(f"{len(results)} server(s) in {time.perf_counter() - start:.2f}s")
+    return 1 if any(error for _, _, error in results) else 0
+
+
+def create(args) -> int:
+    return run_manifest(args)
+
+
+def update_servers(args) -> int:
+    return run_manifest(args, "update", args.dry_run)
+
+
+def show_plan(args) -> int:
+    host = read_host_resources()
+    capacity_plan = plan(args.players, host, args.servers)
+    if args.json:
+        log(json.dumps({"host": asdict(host), "xms": capacity_plan.heap_mb, "xmx": capacity_plan.heap_mb, "properties": capacity_plan.properties(), "reasons": capacity_plan.reasons}, indent=2))
+    else:
+        log(f"Host: {host.total_mb} MB of RAM ({host.available_mb} MB available), {host.cpus} CPU core(s)")
+        log(capacity_plan.explain())
+    return 0
+
+
+def mirror_sync(args) -> int:
+    start = time.perf_counter()
+    report = Mirror(args.dir).sync(paper_client, args.versions, args.latest_versions, args.builds, not args.no_jars, args.workers, log)
+    log(json.dumps(report.as_dict(), indent=2))
+    log(f"Mirror synced in {time.perf_counter() - start:.2f}s, use it with --api-url {args.dir} or serve it with msm mirror serve")
+    return 1 if report.errors else 0
+
+
+def mirror_serve(args) -> int:
+    server = make_server(args.dir, args.host, args.port)
+    log(f"Serving {os.path.abspath(args.dir)} on http://{args.host}:{server.server_address[1]}{SERVE_PREFIX}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def list_paperclip_cache(args) -> int:
+    cache = PaperclipCache()
+    entries = cache.entries()
+    for entry in entries:
+        log(f"{entry.version}  {entry.sha256[:12]}  {entry.files} files  {entry.bytes / 1024 ** 2:.1f} MB  patched in {entry.patch_seconds:.1f}s")
+    log(f"{len(entries)} build(s), {sum(entry.bytes for entry in entries) / 1024 ** 2:.1f} MB in {cache.directory}")
+    return 0
+
+
+def resolve_plugins(args) -> int:
+    resolver = PluginResolver(args.version)
+    try:
+        resolved = resolver.resolve(args.plugins)
+    except PluginError as e:
+        log(e, file=sys.stderr)
+        return 1
+    finally:
+        resolver.client.close()
+    for plugin in resolved:
+        log(plugin)
+    return 0
+
+
+def parse_assignments(assignments: list[str]) -> dict[str, str]:
+    properties = {}
+    for assignment in assignments:
+        key, sep, value = assignment.partition("=")
+        if not sep:
+            raise SystemExit(f"Expected KEY=VALUE, got {assignment!r}")
+        properties[key] = value
+    return properties
+
+
+def positive_int(value: str) -> int:
+    """
+    It parses an argument that must be at least 1: --builds 0 would mirror every build and --keep 0
+    delete every backup.
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def snapshot_create(args) -> int:
+    try:
+        snapshot = SnapshotStore().create(args.name, args.server, not args.no_world)
+    except SnapshotError as e:
+        log(e, file=sys.stderr)
+        return 1
+    log(f"Snapshot {snapshot.name}: {len(snapshot.files)} files, {snapshot.bytes / 1024 ** 2:.1f} MB" + ("" if snapshot.world else ", without the world"))
+    return 0
+
+
+def snapshot_list(args) -> int:
+    store = SnapshotStore()
+    for name in store.names():
+        snapshot = store.get(name)
+        log(f"{name}  {len(snapshot.files)} files  {snapshot.bytes / 1024 ** 2:.1f} MB  {'with' if snapshot.world else 'without'} world  from {snapshot.source}")
+    return 0
+
+
+def snapshot_delete(args) -> int:
+    try:
+        SnapshotStore().delete(args.name)
+    except (SnapshotError, OSError) as e:
+        log(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def snapshot_clone(args) -> int:
+    """
+    It clones a snapshot into the servers of a manifest (only their name, folder_path and
+    properties are used) or into --count servers with consecutive ports.
+    """
+    common = parse_assignments(args.set)
+    if args.manifest:
+        clones = [(os.path.join(server.get("folder_path", os.getcwd()), server["name"]), {**common, **server["properties"]}) for server in load_manifest(args.manifest)]
+    elif args.count:
+        prefix = args.prefix or args.name
+        clones = [(os.path.join(args.folder, f"{prefix}-{i + 1}"), {"server-port": args.base_port + i, **common}) for i in range(args.count)]
+    else:
+        raise SystemExit("Give --manifest or --count")
+    errors = {str(error) for _, properties in clones for error in validate_values(properties)}
+    if errors:
+        raise SystemExit("Invalid server.properties values:\n" + "\n".join(sorted(errors)))
+    start = time.perf_counter()
+    try:
+        results = SnapshotStore().clone_many(args.name, clones, args.workers)
+    except SnapshotError as e:
+        log(e, file=sys.stderr)
+        return 1
+    for (folder, _), result in zip(clones, results):
+        if isinstance(result, Exception):
+            log(f"{folder}: {result}", file=sys.stderr)
+        elif args.verbose:
+            log(f"{folder}: {result.summary()}")
+    reports = [result for result in results if not isinstance(result, Exception)]
+    log(f"{len(reports)}/{len(clones)} clone(s) in {time.perf_counter() - start:.2f}s, {sum(report.bytes for report in reports) / 1024 ** 2:.1f} MB cloned, {sum(report.new_bytes for report in reports) / 1024 ** 2:.1f} MB copied")
+    return 0 if len(reports) == len(clones) else 1
+
+
+def edit_properties(args) -> int:
+    """
+    It sets keys of the server.properties of servers, writing only the files that change, and
+    reports the invalid values of the files.
+    """
+    values = parse_assignments(args.set)
+    errors = validate_values(values)
+    if errors:
+        raise SystemExit("\n".join(str(error) for error in errors))
+    status = 0
+    for folder in args.server:
+        path = os.path.join(folder, "server.properties")
+        if not os.path.isfile(path):
+            log(f"{folder}: no server.properties", file=sys.stderr)
+            status = 1
+            continue
+        properties = ServerProperties.load(path)
+        changes = properties.patch(values)
+        for key, (old, new) in changes.items():
+            log(f"{folder}: {key}: {old} -> {new}" if old is not None else f"{folder}: {key}: added {new}")
+        if changes and not args.dry_run:
+            properties.save(path)
+        for error in properties.validate():
+            log(f"{folder}: {error}", file=sys.stderr)
+            status = 1
+    return status
+
+
+def supervise(args) -> int:
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        raise SystemExit("Give the command of the server after --")
+    config = SupervisorConfig(command, args.dir, min_backoff=args.min_backoff, max_backoff=args.max_backoff, stable_after=args.stable_after,
+                              crash_loop_crashes=args.crash_loop_crashes, crash_loop_window=args.crash_loop_window, restart_on_exit_zero=args.restart_on_exit_zero,
+                              stop_timeout=args.stop_timeout, max_log_bytes=int(args.max_log_mb * 1024 ** 2), sample_interval=args.sample_interval)
+    supervisor = Supervisor(config)
+    supervisor.install_signal_handlers()
+    return supervisor.run()
+
+
+def follow_telemetry(args) -> int:
+    servers = [ServerTelemetry(folder) for folder in args.server]
+    for server in servers:
+        if server.client is None:
+            log(f"{server.name}: RCON is disabled in its server.properties, only the lag warnings of the log are followed", file=sys.stderr)
+    sinks, metrics, jsonl_file = [], None, None
+    if args.jsonl:
+        jsonl_file = sys.stdout if args.jsonl == "-" else open(args.jsonl, "a", encoding="utf-8")
+        sinks.append(samples_sink(jsonl_file))
+    if args.prometheus is not None:
+        metrics = MetricsServer(args.host, args.prometheus).start()
+        sinks.append(metrics.update)
+        log(f"Prometheus metrics on http://{args.host}:{metrics.server_address[1]}/metrics", file=sys.stderr)
+    if not sinks:
+        raise SystemExit("Give --jsonl and/or --prometheus")
+    try:
+        poll(servers, args.interval, sinks, count=args.count)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.close()
+        if metrics is not None:
+            metrics.shutdown()
+        if jsonl_file not in (None, sys.stdout):
+            jsonl_file.close()
+    return 0
+
+
+def backup_create(args) -> int:
+    store = BackupStore(args.store or default_store(args.server))
+    client = None
+    if not args.no_save_off: # the server keeps running, its worlds must not change during the backup
+        server = ServerTelemetry(args.server)
+        client = server.client
+    if client is not None:
+        try:
+            client.command("save-off")
+        except RconError as e:
+            log(f"The server can't be paused over RCON, it should be stopped: {e}", file=sys.stderr)
+            client.close()
+            client = None # save-off failed, there is nothing to turn back on
+    if client is not None:
+        try:
+            client.command("save-all flush")
+        except RconError as e: # saving is off, save-on is still sent after the backup
+            log(f"The worlds couldn't be flushed over RCON, the backup may miss the last changes: {e}", file=sys.stderr)
+    try:
+        manifest, stats = store.backup(args.server, args.name, args.workers)
+    finally:
+        if client is not None:
+            try:
+                client.command("save-on")
+            except RconError as e:
+                log(f"Couldn't run save-on, run it in the console of the server: {e}", file=sys.stderr)
+            client.close()
+    log(f"Backup {manifest.id} of {manifest.server} in {store.directory}: {stats.summary()}")
+    return 0
+
+
+def backup_list(args) -> int:
+    store = BackupStore(args.store or default_store(args.server))
+    name = args.name or os.path.basename(os.path.abspath(args.server))
+    for backup_id in store.backups(name):
+        manifest = store.manifest(name, backup_id)
+        log(f"{backup_id}  {len(manifest.files)} files  {sum(entry['size'] for entry in manifest.files.values()) / 1024 ** 2:.1f} MB  {manifest.stats.get('new_bytes', 0) / 1024 ** 2:.1f} MB new")
+    return 0
+
+
+def backup_restore(args) -> int:
+    store = BackupStore(args.store or default_store(args.server))
+    try:
+        manifest = store.manifest(args.name or os.path.basename(os.path.abspath(args.server)), args.id)
+        count = store.restore(manifest, args.server, args.only)
+    except BackupError as e:
+        log(e, file=sys.stderr)
+        return 1
+    log(f"{count} file(s) of backup {manifest.id} restored into {args.server}")
+    return 0
+
+
+def backup_prune(args) -> int:
+    store = BackupStore(args.store or default_store(args.server))
+    backups, objects = store.prune(args.name or os.path.basename(os.path.abspath(args.server)), args.keep)
+    log(f"{backups} backup(s) and {objects} object(s) deleted")
+    return 0
+
+
+def main(argv: list[str]|None = None) -> int:
+    parser = argparse.ArgumentParser(prog="msm", description="Minecraft Server Maker, headless mode.")
+    parser.add_argument("--api-url", help="The PaperMC API to use: a URL or a mirror directory (see msm mirror), defaults to MSM_PAPER_API or api.papermc.io.")
+    parser.add_argument("--modrinth-url", help="The Modrinth API to use for the plugins, defaults to MSM_MODRINTH_API or api.modrinth.com.")
+    parser.add_argument("--hangar-url", help="The Hangar API to use for the plugins, defaults to MSM_HANGAR_API or hangar.papermc.io.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    create_parser = subparsers.add_parser("create", help="Create the servers of a manifest.")
+    create_parser.add_argument("--manifest", required=True, help="The TOML or JSON file listing the servers.")
+    create_parser.add_argument("--workers", type=int, default=4, help="How many servers are created at once.")
+    create_parser.add_argument("--accept-eula", action="store_true", help="Accept the Minecraft EULA for every server.")
+    create_parser.add_argument("--trace", help="Write the trace of the stages of every server to this file.")
+    create_parser.add_argument("--trace-format", choices=["json", "chrome"], default="json", help="The format of --trace, chrome is for chrome://tracing or ui.perfetto.dev.")
+    create_parser.add_argument("--events", help="Stream the progress events (stages, bytes, errors) as JSON lines to this file, - for stdout.")
+    create_parser.add_argument("-v", "--verbose", action="store_true", help="Print the progress of every server.")
+    create_parser.set_defaults(func=create)
+
+    update_parser = subparsers.add_parser("update", help="Update the existing servers of a manifest without erasing them.")
+    update_parser.add_argument("--manifest", required=True, help="The TOML or JSON file listing the servers.")
+    update_parser.add_argument("--workers", type=int, default=4, help="How many servers are updated at once.")
+    update_parser.add_argument("--dry-run", action="store_true", help="Print the changes without making them.")
+    update_parser.add_argument("--accept-eula", action="store_true", help="Accept the Minecraft EULA for every server.")
+    update_parser.add_argument("--trace", help="Write the trace of the stages of every server to this file.")
+    update_parser.add_argument("--trace-format", choices=["json", "chrome"], default="json", help="The format of --trace, chrome is for chrome://tracing or ui.perfetto.dev.")
+    update_parser.add_argument("--events", help="Stream the progress events (stages, bytes, errors) as JSON lines to this file, - for stdout.")
+    update_parser.add_argument("-v", "--verbose", action="store_true", help="Print the progress of every server.")
+    update_parser.set_defaults(func=update_servers)
+
+    plan_parser = subparsers.add_parser("plan", help="Recommend the RAM and properties of a server for this computer.")
+    plan_parser.add_argument("--players", type=int, default=20, help="The expected number of players.")
+    plan_parser.add_argument("--servers", type=int, default=1, help="How many servers share this computer.")
+    plan_parser.add_argument("--json", action="store_true", help="Print the plan as JSON.")
+    plan_parser.set_defaults(func=show_plan)
+
+    mirror_parser = subparsers.add_parser("mirror", help="Mirror the PaperMC API for offline hosts.")
+    mirror_subparsers = mirror_parser.add_subparsers(dest="mirror_command", required=True)
+    sync_parser = mirror_subparsers.add_parser("sync", help="Fetch versions, builds and jars into a mirror directory, skipping what is already there.")
+    sync_parser.add_argument("--dir", required=True, help="The mirror directory.")
+    sync_parser.add_argument("--versions", nargs="+", help="The versions to mirror, defaults to all of them.")
+    sync_parser.add_argument("--latest-versions", type=positive_int, help="Only mirror this many of the latest versions.")
+    sync_parser.add_argument("--builds", type=positive_int, default=1, help="How many of the latest builds of each version are mirrored.")
+    sync_parser.add_argument("--no-jars", action="store_true", help="Only mirror the metadata.")
+    sync_parser.add_argument("--workers", type=int, default=8, help="How many requests and downloads run at once.")
+    sync_parser.set_defaults(func=mirror_sync)
+    serve_parser = mirror_subparsers.add_parser("serve", help="Serve a mirror directory over HTTP with the API layout.")
+    serve_parser.add_argument("--dir", required=True, help="The mirror directory.")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="The address to listen on, 0.0.0.0 for the whole network.")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.set_defaults(func=mirror_serve)
+
+    paperclip_parser = subparsers.add_parser("paperclip", help="List the shared Paperclip cache used to prepare the first start (warmup = true).")
+    paperclip_parser.set_defaults(func=list_paperclip_cache)
+
+    plugins_parser = subparsers.add_parser("plugins", help="Resolve plugins with their dependencies for a Minecraft version, without installing them.")
+    plugins_parser.add_argument("--version", required=True, help="The Minecraft version of the server.")
+    plugins_parser.add_argument("plugins", nargs="+", help="[provider:]project[@constraint], e.g. luckperms or hangar:ViaVersion@>=5.")
+    plugins_parser.set_defaults(func=resolve_plugins)
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="Snapshot a server and clone it into many servers.")
+    snapshot_subparsers = snapshot_parser.add_subparsers(dest="snapshot_command", required=True)
+    snapshot_create_parser = snapshot_subparsers.add_parser("create", help="Snapshot a stopped server folder, an existing snapshot with the name is replaced.")
+    snapshot_create_parser.add_argument("--name", required=True, help="The name of the snapshot.")
+    snapshot_create_parser.add_argument("--server", required=True, help="The folder of the server.")
+    snapshot_create_parser.add_argument("--no-world", action="store_true", help="Leave the worlds out of the snapshot.")
+    snapshot_create_parser.set_defaults(func=snapshot_create)
+    clone_parser = snapshot_subparsers.add_parser("clone", help="Make servers from a snapshot, with their own server.properties keys.")
+    clone_parser.add_argument("--name", required=True, help="The name of the snapshot.")
+    clone_parser.add_argument("--manifest", help="The TOML or JSON file listing the clones (name, folder_path and properties).")
+    clone_parser.add_argument("--count", type=int, help="Make this many clones, named PREFIX-1, PREFIX-2...")
+    clone_parser.add_argument("--folder", default=os.getcwd(), help="The folder of the --count clones.")
+    clone_parser.add_argument("--prefix", help="The name of the --count clones, defaults to the name of the snapshot.")
+    clone_parser.add_argument("--base-port", type=int, default=25566, help="The server-port of the first --count clone, the next ones get the next ports.")
+    clone_parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="A server.properties key of every clone, can be repeated.")
+    clone_parser.add_argument("--workers", type=int, default=8, help="How many clones are made at once.")
+    clone_parser.add_argument("-v", "--verbose", action="store_true", help="Print what every clone took.")
+    clone_parser.set_defaults(func=snapshot_clone)
+    snapshot_list_parser = snapshot_subparsers.add_parser("list", help="List the snapshots.")
+    snapshot_list_parser.set_defaults(func=snapshot_list)
+    snapshot_delete_parser = snapshot_subparsers.add_parser("delete", help="Delete a snapshot.")
+    snapshot_delete_parser.add_argument("--name", required=True, help="The name of the snapshot.")
+    snapshot_delete_parser.set_defaults(func=snapshot_delete)
+
+    properties_parser = subparsers.add_parser("properties", help="Set keys of the server.properties of servers and check their values.")
+    properties_parser.add_argument("--server", action="append", required=True, help="The folder of a server, can be repeated.")
+    properties_parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="A key to set, can be repeated. Without it the files are only checked.")
+    properties_parser.add_argument("--dry-run", action="store_true", help="Print the changes without making them.")
+    properties_parser.set_defaults(func=edit_properties)
+
+    supervise_parser = subparsers.add_parser("supervise", help="Run a server, restarting it with a backoff when it crashes (used by the start files).")
+    supervise_parser.add_argument("--dir", default=".", help="The folder of the server.")
+    supervise_parser.add_argument("--min-backoff", type=float, default=1.0, help="Seconds before the first restart, doubled at every crash in a row.")
+    supervise_parser.add_argument("--max-backoff", type=float, default=300.0, help="The longest delay before a restart.")
+    supervise_parser.add_argument("--stable-after", type=float, default=60.0, help="Seconds of uptime after which the delay goes back to --min-backoff.")
+    supervise_parser.add_argument("--crash-loop-crashes", type=int, default=5, help="Give up after this many crashes in --crash-loop-window seconds.")
+    supervise_parser.add_argument("--crash-loop-window", type=float, default=300.0)
+    supervise_parser.add_argument("--restart-on-exit-zero", action="store_true", help="Also restart the server when it stopped normally (/stop).")
+    supervise_parser.add_argument("--stop-timeout", type=float, default=60.0, help="Seconds given to the server to stop on SIGTERM or Ctrl+C before it is terminated.")
+    supervise_parser.add_argument("--max-log-mb", type=float, default=10.0, help="The size of logs/console.log before it is rotated.")
+    supervise_parser.add_argument("--sample-interval", type=float, default=10.0, help="Seconds between two samples of the RSS and CPU of the server (Linux), 0 to disable.")
+    supervise_parser.add_argument("command", nargs=argparse.REMAINDER, help="-- then the command of the server.")
+    supervise_parser.set_defaults(func=supervise)
+
+    backup_parser = subparsers.add_parser("backup", help="Incremental backups of servers, deduplicated down to the chunks of the worlds.")
+    backup_subparsers = backup_parser.add_subparsers(dest="backup_command", required=True)
+    for command, help_text, func in (("create", "Back a server up, only storing what changed.", backup_create), ("list", "List the backups of a server.", backup_list),
+                                     ("restore", "Restore a backup into a stopped server.", backup_restore), ("prune", "Delete the oldest backups of a server and the data no backup uses.", backup_prune)):
+        command_parser = backup_subparsers.add_parser(command, help=help_text)
+        command_parser.add_argument("--server", required=True, help="The folder of the server.")
+        command_parser.add_argument("--store", help="The backup directory, defaults to backups/ next to the server folder.")
+        command_parser.add_argument("--name", help="The name of the server in the store, defaults to the name of its folder.")
+        command_parser.set_defaults(func=func)
+        if command == "create":
+            command_parser.add_argument("--workers", type=int, help="How many processes hash the files, defaults to the number of CPUs.")
+            command_parser.add_argument("--no-save-off", action="store_true", help="Don't pause the saving of a running server over RCON during the backup.")
+        elif command == "restore":
+            command_parser.add_argument("--id", help="The backup to restore, defaults to the latest one.")
+            command_parser.add_argument("--only", nargs="+", help="Only restore these paths, e.g. world_nether or world/region/r.0.0.mca.")
+        elif command == "prune":
+            command_parser.add_argument("--keep", type=positive_int, default=7, help="How many of the latest backups are kept.")
+
+    telemetry_parser = subparsers.add_parser("telemetry", help="Follow the TPS and MSPT (over RCON) and the lag warnings of running servers.")
+    telemetry_parser.add_argument("--server", action="append", required=True, help="The folder of a server, can be repeated.")
+    telemetry_parser.add_argument("--interval", type=float, default=10.0, help="Seconds between two samples.")
+    telemetry_parser.add_argument("--count", type=int, help="Stop after this many samples, defaults to never.")
+    telemetry_parser.add_argument("--jsonl", help="Write the samples as JSON lines to this file, - for stdout.")
+    telemetry_parser.add_argument("--prometheus", type=int, metavar="PORT", help="Serve the latest samples as Prometheus metrics on this port.")
+    telemetry_parser.add_argument("--host", default="127.0.0.1", help="The address of the Prometheus endpoint, 0.0.0.0 for the whole network.")
+    telemetry_parser.set_defaults(func=follow_telemetry)
+
+    args = parser.parse_args(argv)
+    if args.api_url:
+        set_api_url(args.api_url)
+    set_api_urls(args.modrinth_url, args.hangar_url)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
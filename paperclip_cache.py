@@ -0,0 +1,206 @@
+"""
+Shared cache of what Paperclip makes on the first start of a server.
+
+Paper jars are Paperclip launchers: on its first start, a server downloads the Mojang jar into
+cache/, patches it into versions/ and downloads its libraries into libraries/, which takes a while
+and a lot of disk for every server. The cache runs a jar once in patch-only mode
+(-Dpaperclip.patchonly=true) and keeps these trees, by version and jar hash:
+
+paperclip/1.20.4/<sha256 of the jar>/cache/mojang_1.20.4.jar
+paperclip/1.20.4/<sha256 of the jar>/libraries/...
+paperclip/1.20.4/<sha256 of the jar>/versions/1.20.4/paper-1.20.4.jar
+paperclip/1.20.4/<sha256 of the jar>/meta.json       how long the patching took, the size of the trees
+
+New servers get hardlinks (or reflinks, or copies) of the trees, so their first start skips the
+patching and the files are stored once.
+"""
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+
+from fsutil import link_file
+from paths import cache_dir
+
+PAPERCLIP_DIRS = ("cache", "libraries", "versions")
+META_FILE = "meta.json"
+DEFAULT_TIMEOUT = 600 # seconds, the Mojang jar and the libraries are downloaded
+
+_entry_locks: dict[str, threading.Lock] = {}
+_entry_locks_lock = threading.Lock()
+
+
+class WarmupError(Exception):
+    """
+    Raised when the jar couldn't be run in patch-only mode.
+    """
+
+
+@dataclass
+class CacheEntry:
+    version: str
+    sha256: str
+    patch_seconds: float # how long the patching took, what the first start of a server saves
+    files: int
+    bytes: int
+    created: float = field(default_factory=time.time)
+
+
+@dataclass
+class LinkReport:
+    entry: CacheEntry
+    warmed: bool # the jar was patched for this server, the entry wasn't cached
+    seconds: float # to link the trees into the server, patching included if warmed
+    files: int = 0
+    bytes: int = 0 # the size of the trees in the server
+    new_bytes: int = 0 # the disk actually used by the server, the copies
+    methods: dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        start = f"patched in {self.seconds:.1f}s" if self.warmed else f"linked in {self.seconds:.2f}s instead of patching for {self.entry.patch_seconds:.1f}s"
+        return f"Paperclip cache of {self.entry.version}: {self.bytes / 1024 ** 2:.1f} MB in {self.files} files {start}, {self.new_bytes / 1024 ** 2:.1f} MB of new disk use"
+
+
+def tree_size(path: str) -> tuple[int, int]:
+    """
+    It returns the number of files and their size in a directory tree.
+    """
+    files, size = 0, 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+class PaperclipCache:
+    """
+    The shared cache of the Paperclip trees, see the module docstring.
+    """
+
+    def __init__(self, directory: str|None = None):
+        self.directory = directory or cache_dir("paperclip")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, version: str, sha256: str) -> str:
+        return os.path.join(self.directory, version, sha256.lower())
+
+    def get(self, version: str, sha256: str) -> CacheEntry|None:
+        """
+        It returns the entry of a jar, None if it was never warmed up.
+        """
+        try:
+            with open(os.path.join(self.path(version, sha256), META_FILE), "r", encoding="utf-8") as f:
+                return CacheEntry(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def entries(self) -> list[CacheEntry]:
+        entries = []
+        for version in sorted(os.listdir(self.directory)):
+            if os.path.isdir(os.path.join(self.directory, version)):
+                entries += [entry for sha256 in os.listdir(os.path.join(self.directory, version)) if (entry := self.get(version, sha256))]
+        return entries
+
+    def warm(self, jar_path: str, version: str, sha256: str, java: str = "java", timeout: float = DEFAULT_TIMEOUT) -> CacheEntry:
+        """
+        It runs the jar in patch-only mode into the cache, unless it is already there. Servers on
+        the same jar wait for one warmup.
+
+        :param jar_path: The path of the Paper jar
+        :param version: The Minecraft version of the jar
+        :param sha256: The SHA-256 of the jar
+        :param java: The Java executable to run the jar with
+        :param timeout: The maximum number of seconds of the patching
+        :return: The cache entry of the jar.
+        """
+        return self._warm(jar_path, version, sha256, java, timeout)[0]
+
+    def _warm(self, jar_path: str, version: str, sha256: str, java: str, timeout: float) -> tuple[CacheEntry, bool]:
+        path = self.path(version, sha256)
+        with _entry_locks_lock:
+            lock = _entry_locks.setdefault(path, threading.Lock())
+        with lock:
+            entry = self.get(version, sha256)
+            if entry is not None:
+                return entry, False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            work = tempfile.mkdtemp(prefix=".warmup-", dir=os.path.dirname(path))
+            try:
+                link_file(jar_path, os.path.join(work, "paper.jar"))
+                start = time.perf_counter()
+                try:
+                    result = subprocess.run([java, "-Dpaperclip.patchonly=true", "-jar", "paper.jar"], cwd=work, capture_output=True, text=True, timeout=timeout, stdin=subprocess.DEVNULL)
+                except (OSError, subprocess.TimeoutExpired) as e:
+                    raise WarmupError(f"Couldn't run {java}: {e}") from e
+                if result.returncode != 0:
+                    output = (result.stderr or result.stdout).strip().splitlines()
+                    raise WarmupError(f"The patching failed with code {result.returncode}" + (f": {output[-1]}" if output else ""))
+                patch_seconds = time.perf_counter() - start
+                os.remove(os.path.join(work, "paper.jar"))
+                for name in os.listdir(work): # e.g. the logs
+                    if name in PAPERCLIP_DIRS:
+                        continue
+                    if os.path.isdir(os.path.join(work, name)):
+                        shutil.rmtree(os.path.join(work, name))
+                    else:
+                        os.remove(os.path.join(work, name))
+                if not os.listdir(work):
+                    raise WarmupError("The jar made nothing to cache, it may not be a Paperclip jar")
+                files, size = tree_size(work)
+                entry = CacheEntry(version, sha256.lower(), patch_seconds, files, size)
+                with open(os.path.join(work, META_FILE), "w", encoding="utf-8") as f:
+                    json.dump(asdict(entry), f)
+                try:
+                    os.rename(work, path)
+                except OSError: # another process warmed it up meanwhile
+                    if self.get(version, sha256) is None:
+                        raise
+                    return self.get(version, sha256), False
+                return entry, True
+            finally:
+                shutil.rmtree(work, ignore_errors=True)
+
+    def link_into(self, entry: CacheEntry, dest_folder: str) -> LinkReport:
+        """
+        It links the trees of an entry into the folder of a server. Files the server already has
+        are kept.
+
+        :param entry: The cache entry, see warm
+        :param dest_folder: The folder of the server
+        """
+        start = time.perf_counter()
+        report = LinkReport(entry, False, 0.0)
+        source = self.path(entry.version, entry.sha256)
+        for name in PAPERCLIP_DIRS:
+            for root, _, names in os.walk(os.path.join(source, name)):
+                dest_root = os.path.join(dest_folder, os.path.relpath(root, source))
+                os.makedirs(dest_root, exist_ok=True)
+                for file_name in names:
+                    dest = os.path.join(dest_root, file_name)
+                    if os.path.lexists(dest):
+                        continue
+                    method = link_file(os.path.join(root, file_name), dest)
+                    size = os.path.getsize(dest)
+                    report.files += 1
+                    report.bytes += size
+                    report.methods[method] = report.methods.get(method, 0) + 1
+                    if method == "copy":
+                        report.new_bytes += size
+        report.seconds = time.perf_counter() - start
+        return report
+
+    def prepare(self, jar_path: str, version: str, sha256: str, dest_folder: str, java: str = "java", timeout: float = DEFAULT_TIMEOUT) -> LinkReport:
+        """
+        It warms the jar up if needed, then links the trees into the folder of the server.
+        """
+        start = time.perf_counter()
+        entry, warmed = self._warm(jar_path, version, sha256, java, timeout)
+        report = self.link_into(entry, dest_folder)
+        if warmed:
+            report.warmed, report.seconds = True, time.perf_counter() - start
+        return report
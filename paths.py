@@ -0,0 +1,46 @@
+import os
+import sys
+
+APP_NAME = "Minecraft-Server-Maker"
+
+
+def cache_dir(*parts: str) -> str:
+    """
+    It returns the per-user cache directory of the application (joined with the given parts) and
+    creates it if it doesn't exist.
+
+    The location can be overridden with the MSM_CACHE_DIR environment variable.
+
+    :param parts: Sub-directories to join to the cache directory
+    :return: The absolute path to the directory.
+    """
+    base = os.environ.get("MSM_CACHE_DIR")
+    if not base:
+        if sys.platform == "win32":
+            base = os.path.join(os.environ.get("LOCALAPPDATA", os.path.expanduser("~")), APP_NAME, "cache")
+        else:
+            base = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), APP_NAME.lower())
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def config_dir(*parts: str) -> str:
+    """
+    It returns the per-user configuration directory of the application (joined with the given
+    parts) and creates it if it doesn't exist.
+
+    The location can be overridden with the MSM_CONFIG_DIR environment variable.
+
+    :param parts: Sub-directories to join to the configuration directory
+    :return: The absolute path to the directory.
+    """
+    base = os.environ.get("MSM_CONFIG_DIR")
+    if not base:
+        if sys.platform == "win32":
+            base = os.path.join(os.environ.get("APPDATA", os.path.expanduser("~")), APP_NAME)
+        else:
+            base = os.path.join(os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config")), APP_NAME.lower())
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+
+@dataclass
+class StageRecord:
+    """
+    The trace of one stage: when it ran, on which thread, how many bytes it moved and its outcome.
+    """
+    name: str
+    start: float # seconds since the start of the trace
+    end: float|None = None
+    thread: int = 0
+    outcome: str = "running" # "ok", "error" or "skipped"
+    bytes: int = 0
+    error: str|None = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else self.start) - self.start
+
+
+class Trace:
+    """
+    A structured trace of the stages of a job, exportable as JSON or as a Chrome trace
+    (chrome://tracing, https://ui.perfetto.dev).
+    """
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.records: list[StageRecord] = []
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        return time.perf_counter() - self.origin
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        It records the stage run in the with block, an exception marks it as an error.
+
+        :param name: The name of the stage
+        :return: The StageRecord, so the block can set its bytes or outcome.
+        """
+        record = StageRecord(name, self.now(), thread=threading.get_ident())
+        with self._lock:
+            self.records.append(record)
+        try:
+            yield record
+        except BaseException as e:
+            record.outcome, record.error = "error", str(e)
+            raise
+        finally:
+            record.end = self.now()
+            if record.outcome == "running":
+                record.outcome = "ok"
+
+    def set_bytes(self, name: str, count: int):
+        """
+        It sets the bytes moved by the last stage with the name.
+        """
+        with self._lock:
+            for record in reversed(self.records):
+                if record.name == name:
+                    record.bytes = count
+                    return
+
+    def skip(self, name: str, reason: str):
+        with self._lock:
+            self.records.append(StageRecord(name, self.now(), self.now(), threading.get_ident(), "skipped", error=reason))
+
+    def durations(self) -> dict[str, float]:
+        return {record.name: record.duration for record in self.records}
+
+    def wall_time(self) -> float:
+        return max((record.end or 0 for record in self.records), default=0.0)
+
+    def to_dict(self) -> dict:
+        return {"label": self.label, "wall_time": self.wall_time(), "stages": [asdict(record) | {"duration": record.duration} for record in self.records]}
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def chrome_events(self, pid: int = 1, offset: float = 0.0) -> list[dict]:
+        """
+        It returns the Chrome trace events of the stages, one process per trace.
+
+        :param pid: The process id of the trace in the Chrome trace
+        :param offset: The seconds to add to the timestamps, to align traces started at other times
+        """
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.label or f"job {pid}"}}]
+        for record in self.records:
+            events.append({
+                "name": record.name, "cat": "stage", "ph": "X", "pid": pid, "tid": record.thread,
+                "ts": (offset + record.start) * 1e6, "dur": record.duration * 1e6,
+                "args": {"outcome": record.outcome, "bytes": record.bytes, "error": record.error},
+            })
+        return events
+
+    def to_chrome_trace(self) -> str:
+        return json.dumps({"traceEvents": self.chrome_events()})
+
+
+def export_traces(traces: list[Trace], path: str, chrome: bool = False):
+    """
+    It writes many traces to one file, as a JSON list or as one Chrome trace.
+
+    :param traces: The traces to write
+    :param path: The path to the file
+    :param chrome: If the Chrome trace format should be used
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        if chrome:
+            origin = min((trace.origin for trace in traces), default=0.0)
+            events = [event for pid, trace in enumerate(traces, 1) for event in trace.chrome_events(pid, trace.origin - origin)]
+            json.dump({"traceEvents": events}, f)
+        else:
+            json.dump([trace.to_dict() for trace in traces], f, indent=2)
+
+
+@dataclass
+class Stage:
+    """
+    A step of a job, run once all the stages it depends on succeeded.
+    """
+    name: str
+    func: object # callable receiving the results of the stages done so far, see run_stages
+    deps: tuple[str, ...] = field(default_factory=tuple)
+
+
+def run_stages(stages: list[Stage], trace: Trace, max_workers: int = 4) -> dict[str, object]:
+    """
+    It runs a graph of stages, independent stages running concurrently on a thread pool.
+
+    A stage whose dependencies failed is skipped. The first exception of a stage is raised once
+    every runnable stage is done.
+
+    :param stages: The stages, their deps being names of other stages
+    :param trace: The trace where the stages are recorded
+    :param max_workers: How many stages can run at once
+    :return: The results of the stages, by name.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = set(stage.deps) - set(by_name)
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on unknown stage(s) {', '.join(sorted(missing))}")
+    results, failed, errors = {}, set(), []
+    pending = list(stages)
+    running = {}
+
+    def run(stage: Stage, done_results: dict):
+        with trace.span(stage.name):
+            return stage.func(done_results)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for stage in list(pending):
+                if any(dep in failed for dep in stage.deps):
+                    pending.remove(stage)
+                    failed.add(stage.name)
+                    trace.skip(stage.name, "a dependency failed")
+                elif all(dep in results for dep in stage.deps):
+                    pending.remove(stage)
+                    running[executor.submit(run, stage, dict(results))] = stage
+            if not running:
+                if pending: # only possible with a cycle
+                    raise ValueError(f"Stages {', '.join(stage.name for stage in pending)} depend on each other")
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    results[stage.name] = future.result()
+                except Exception as e:
+                    failed.add(stage.name)
+                    errors.append(e)
+    if errors:
+        raise errors[0]
+    return results
@@ -0,0 +1,389 @@
+"""
+Plugins of new servers, from Modrinth and Hangar.
+
+A server spec lists its plugins as "[provider:]project[@constraint]", Modrinth by default:
+
+plugins = ["luckperms", "modrinth:worldedit@>=7.2,<8", "hangar:ViaVersion@5.0.1"]
+
+A constraint is a version (the same as "==5.0.1"), comparisons separated by commas or "*".
+
+The resolver takes the newest version of every plugin matching its constraints and declaring the
+Minecraft version of the server and a loader Paper runs (paper, spigot, bukkit...), then does the
+same for their required dependencies, level by level: the projects of a level are requested
+concurrently, and a project needed by several plugins must satisfy all of them. The jars are
+downloaded concurrently into stores shared by all the servers and verified against the hash given
+by the API (SHA-512 for Modrinth, SHA-256 for Hangar, see jar_store), then linked into plugins/.
+
+The APIs can be replaced (e.g. by benchmarks/plugin_standin.py) with MSM_MODRINTH_API and
+MSM_HANGAR_API, or set_api_urls.
+"""
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import quote
+
+import requests
+
+from downloader import DownloadError
+from get_papermc import PaperApiClient, PaperApiError
+from jar_store import JarStore
+from paths import APP_NAME, cache_dir
+
+MODRINTH_API_URL = os.environ.get("MSM_MODRINTH_API") or "https://api.modrinth.com/v2/"
+HANGAR_API_URL = os.environ.get("MSM_HANGAR_API") or "https://hangar.papermc.io/api/v1/"
+
+PROVIDERS = ("modrinth", "hangar")
+LOADERS = ("paper", "spigot", "bukkit", "purpur", "folia") # Modrinth loaders a Paper server runs
+USER_AGENT = f"{APP_NAME} (plugin resolver)" # Modrinth asks for an identifiable User-Agent
+
+CONSTRAINT = re.compile(r"^(==|!=|>=|<=|>|<)?\s*(\S+)$")
+
+
+class PluginError(Exception):
+    """
+    Raised when a plugin can't be found, resolved or installed.
+    """
+
+
+def set_api_urls(modrinth: str|None = None, hangar: str|None = None):
+    """
+    It replaces the Modrinth and/or Hangar APIs, for the resolvers created afterwards.
+    """
+    global MODRINTH_API_URL, HANGAR_API_URL
+    if modrinth:
+        MODRINTH_API_URL = modrinth
+    if hangar:
+        HANGAR_API_URL = hangar
+
+
+def version_key(version: str) -> tuple:
+    """
+    It returns a sort key of a version: "1.10" > "1.9", and "7.3.0-SNAPSHOT" < "7.3.0" < "7.3.0.1".
+    """
+    parts = [(1, int(token)) if token.isdigit() else (0, token.lower()) for token in re.findall(r"\d+|[A-Za-z]+", version.lstrip("vV"))]
+    return tuple(parts) + ((0.5, ""),) # ends a release above its pre-releases and below its sub-versions
+
+
+def satisfies(version: str, constraint: str) -> bool:
+    """
+    It checks if a version matches a constraint such as "7.3.0", ">=7.2,<8" or "*".
+    """
+    for part in constraint.split(","):
+        part = part.strip()
+        if not part or part == "*":
+            continue
+        match = CONSTRAINT.match(part)
+        if match is None:
+            raise PluginError(f"Invalid version constraint {part!r}")
+        operator, expected = match.group(1) or "==", match.group(2)
+        if operator == "==" and version == expected:
+            continue
+        key, expected_key = version_key(version), version_key(expected)
+        if not {"==": key == expected_key, "!=": key != expected_key, ">=": key >= expected_key, "<=": key <= expected_key, ">": key > expected_key, "<": key < expected_key}[operator]:
+            return False
+    return True
+
+
+def supports_minecraft(declared: list[str], minecraft_version: str) -> bool:
+    """
+    It checks if the Minecraft versions declared by a plugin version ("1.20.4", "1.20.x" or
+    "1.20-1.20.4") include the version of the server.
+    """
+    for entry in declared:
+        if entry == minecraft_version:
+            return True
+        if entry.endswith(".x") and (minecraft_version + ".").startswith(entry[:-1]):
+            return True
+        low, separator, high = entry.partition("-")
+        if separator and re.fullmatch(r"[\d.]+", low) and re.fullmatch(r"[\d.]+", high) and version_key(low) <= version_key(minecraft_version) <= version_key(high):
+            return True
+    return False
+
+
+@dataclass
+class Requirement:
+    provider: str
+    project: str # the slug or id of the project
+    constraint: str = "*"
+    version_id: str|None = None # a Modrinth dependency pinned to a version
+    project_id: str|None = None # a Hangar dependency known by its id, project being only its display name
+    required_by: str|None = None # None when asked by the spec
+
+    @classmethod
+    def parse(cls, text: str) -> "Requirement":
+        """
+        It parses "[provider:]project[@constraint]", see the module docstring.
+        """
+        provider, _, rest = text.strip().rpartition(":") if ":" in text else ("", "", text.strip())
+        project, _, constraint = rest.partition("@")
+        provider = provider.lower() or PROVIDERS[0]
+        if provider not in PROVIDERS:
+            raise PluginError(f"Unknown plugin provider {provider!r} in {text!r}, expected one of {', '.join(PROVIDERS)}")
+        if not project:
+            raise PluginError(f"No project in {text!r}")
+        return cls(provider, project.strip(), constraint.strip() or "*")
+
+    def accepts(self, version: "PluginVersion") -> bool:
+        if self.version_id:
+            return version.id == self.version_id
+        return satisfies(version.version, self.constraint)
+
+    def __str__(self) -> str:
+        text = f"{self.provider}:{self.project}" + (f"@{self.constraint}" if self.constraint != "*" else "")
+        return text + (f" (required by {self.required_by})" if self.required_by else "")
+
+
+@dataclass
+class PluginVersion:
+    """
+    A version of a plugin, the same for both providers.
+    """
+    provider: str
+    project: str # the key of the project: the Modrinth id, the lowercase Hangar slug
+    name: str
+    id: str
+    version: str
+    published: str # ISO 8601, the newest is preferred
+    release: bool # not a beta nor an alpha
+    minecraft_versions: list[str]
+    compatible_loader: bool
+    filename: str|None
+    url: str|None
+    algorithm: str
+    hash: str|None
+    size: int
+    dependencies: list[Requirement] = field(default_factory=list)
+    incompatible: list[str] = field(default_factory=list) # projects of the same provider
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.provider, self.project
+
+
+@dataclass
+class ResolvedPlugin:
+    version: PluginVersion
+    required_by: list[str] = field(default_factory=list) # empty when asked by the spec
+
+    def __str__(self) -> str:
+        return f"{self.version.name} {self.version.version} ({self.version.provider})" + (f", required by {', '.join(self.required_by)}" if self.required_by else "")
+
+
+@dataclass
+class InstallReport:
+    plugins: list[ResolvedPlugin]
+    downloaded: int = 0
+    cached: int = 0
+    bytes: int = 0 # downloaded
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        dependencies = sum(1 for plugin in self.plugins if plugin.required_by)
+        return f"{len(self.plugins)} plugin(s) ({dependencies} as dependencies), {self.downloaded} downloaded ({self.bytes / 1024 ** 2:.1f} MB), {self.cached} from the cache in {self.seconds:.2f}s"
+
+
+class PluginResolver:
+    """
+    It resolves the plugins of a Minecraft version with their dependencies, see the module
+    docstring.
+    """
+
+    def __init__(self, minecraft_version: str, modrinth_url: str|None = None, hangar_url: str|None = None, client: PaperApiClient|None = None, max_workers: int = 8):
+        """
+        :param minecraft_version: The version of the server
+        :param modrinth_url: The Modrinth v2 API, defaults to MODRINTH_API_URL
+        :param hangar_url: The Hangar v1 API, defaults to HANGAR_API_URL
+        :param client: The client making the requests, defaults to a new one (pooled, with retries and the metadata cache)
+        identified by USER_AGENT, a given client is used as is
+        :param max_workers: How many projects are requested at once
+        """
+        self.minecraft_version = minecraft_version
+        self.modrinth_url = (modrinth_url or MODRINTH_API_URL).rstrip("/") + "/"
+        self.hangar_url = (hangar_url or HANGAR_API_URL).rstrip("/") + "/"
+        if client is None:
+            client = PaperApiClient(max_workers=max_workers)
+            client.session.headers["User-Agent"] = USER_AGENT
+        self.client = client
+        self.max_workers = max_workers
+
+    def versions(self, requirement: Requirement) -> list[PluginVersion]:
+        """
+        It returns the versions of the project of a requirement, compatible or not.
+        """
+        try:
+            if requirement.provider == "modrinth":
+                answer = self.client.get_json(f"{self.modrinth_url}project/{quote(requirement.project)}/version?loaders={quote(json.dumps(LOADERS))}")
+                return [self._modrinth_version(requirement.project, version) for version in answer]
+            project = requirement.project
+            if requirement.project_id: # the slug, so a dependency and a request of the same project give the same key
+                project = self.client.get_json(f"{self.hangar_url}projects/{quote(requirement.project_id)}")["namespace"]["slug"]
+            answer = self.client.get_json(f"{self.hangar_url}projects/{quote(project)}/versions?platform=PAPER&platformVersion={quote(self.minecraft_version)}&limit=25")
+            return [self._hangar_version(project, version) for version in answer.get("result", [])]
+        except PaperApiError as e:
+            if e.status_code == 404 and requirement.provider == "hangar" and requirement.required_by:
+                hint = f" (project {requirement.project_id})" if requirement.project_id else " by its name, add it to the plugins with its slug (hangar:<slug>)"
+                raise PluginError(f"The hangar dependency {requirement.project!r} of {requirement.required_by} can't be found{hint}") from e
+            if e.status_code == 404:
+                raise PluginError(f"No {requirement.provider} project {requirement.project!r} ({requirement})") from e
+            raise PluginError(f"Error getting the versions of {requirement}: {e}") from e
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            raise PluginError(f"Error getting the versions of {requirement}: {e}") from e
+
+    def _modrinth_version(self, project: str, data: dict) -> PluginVersion:
+        files = data.get("files") or []
+        file = next((file for file in files if file.get("primary")), files[0] if files else None)
+        if project == data["project_id"] and file: # a dependency, only known by its id
+            project = os.path.splitext(file["filename"])[0].removesuffix("-" + data["version_number"])
+        version = PluginVersion(
+            "modrinth", data["project_id"], project, data["id"], data["version_number"], data.get("date_published", ""),
+            data.get("version_type", "release") == "release", data.get("game_versions", []), any(loader in LOADERS for loader in data.get("loaders", [])),
+            file and file["filename"], file and file["url"], "sha512", file and file.get("hashes", {}).get("sha512"), file and file.get("size", 0) or 0)
+        for dependency in data.get("dependencies", []):
+            if not dependency.get("project_id"):
+                continue # a dependency on a file outside of Modrinth
+            if dependency.get("dependency_type") == "required":
+                version.dependencies.append(Requirement("modrinth", dependency["project_id"], version_id=dependency.get("version_id")))
+            elif dependency.get("dependency_type") == "incompatible":
+                version.incompatible.append(dependency["project_id"])
+        return version
+
+    def _hangar_version(self, project: str, data: dict) -> PluginVersion:
+        download = (data.get("downloads") or {}).get("PAPER") or {}
+        file_info = download.get("fileInfo") or {}
+        version = PluginVersion(
+            "hangar", project.lower(), project, str(data.get("id", data["name"])), data["name"], data.get("createdAt", ""),
+            (data.get("channel") or {}).get("name", "Release").lower() == "release", (data.get("platformDependencies") or {}).get("PAPER", []),
+            "PAPER" in (data.get("downloads") or {}), file_info.get("name"), download.get("downloadUrl"), "sha256", file_info.get("sha256Hash"), file_info.get("sizeBytes", 0))
+        for dependency in (data.get("pluginDependencies") or {}).get("PAPER", []):
+            if not dependency.get("required") or dependency.get("externalUrl"):
+                continue
+            slug = (dependency.get("namespace") or {}).get("slug") # the name is the display name, not always the slug of the URLs
+            project_id = dependency.get("projectId")
+            version.dependencies.append(Requirement("hangar", slug or dependency["name"], project_id=None if slug or project_id is None else str(project_id)))
+        return version
+
+    def choose(self, versions: list[PluginVersion], requirements: list[Requirement]) -> PluginVersion:
+        """
+        It returns the newest compatible version accepted by all the requirements, a release if
+        there is one.
+        """
+        compatible = [version for version in versions if version.compatible_loader and supports_minecraft(version.minecraft_versions, self.minecraft_version)]
+        accepted = [version for version in compatible if all(requirement.accepts(version) for requirement in requirements)]
+        if not accepted:
+            asked = "; ".join(str(requirement) for requirement in requirements)
+            if not compatible:
+                raise PluginError(f"No version of {asked} supports Paper {self.minecraft_version}")
+            raise PluginError(f"No version of {asked} supporting Paper {self.minecraft_version} matches, the compatible versions are {', '.join(version.version for version in compatible[:10])}")
+        releases = [version for version in accepted if version.release]
+        return max(releases or accepted, key=lambda version: version.published)
+
+    def resolve(self, plugins: list[str|Requirement]) -> list[ResolvedPlugin]:
+        """
+        It returns the plugins and their required dependencies, the plugins of the spec first.
+
+        :param plugins: The plugins, see Requirement.parse
+        """
+        level = [plugin if isinstance(plugin, Requirement) else Requirement.parse(plugin) for plugin in plugins]
+        resolved: dict[tuple[str, str], ResolvedPlugin] = {}
+        requirements: dict[tuple[str, str], list[Requirement]] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while level:
+                found: dict[tuple[str, str], list[PluginVersion]] = {}
+                for requirement, versions in zip(level, executor.map(self.versions, level)):
+                    if not versions:
+                        raise PluginError(f"{requirement} has no version for Paper {self.minecraft_version}")
+                    key = versions[0].key # the slug of a request and the id of a dependency give the same key
+                    requirements.setdefault(key, []).append(requirement)
+                    found[key] = versions
+                next_level = []
+                for key, versions in found.items():
+                    if key in resolved: # already chosen at a previous level, it must fit the new requirements too
+                        bad = [requirement for requirement in requirements[key] if not requirement.accepts(resolved[key].version)]
+                        if bad:
+                            raise PluginError(f"{resolved[key].version.name} {resolved[key].version.version} was chosen, but {bad[0]} needs another version")
+                    else:
+                        version = self.choose(versions, requirements[key])
+                        resolved[key] = ResolvedPlugin(version)
+                        for dependency in version.dependencies:
+                            dependency.required_by = version.name
+                            next_level.append(dependency)
+                    resolved[key].required_by = sorted({requirement.required_by for requirement in requirements[key] if requirement.required_by})
+                    if any(requirement.required_by is None for requirement in requirements[key]):
+                        resolved[key].required_by = []
+                level = next_level
+        for plugin in resolved.values():
+            for project in plugin.version.incompatible:
+                if (plugin.version.provider, project) in resolved:
+                    raise PluginError(f"{plugin.version.name} is incompatible with {resolved[(plugin.version.provider, project)].version.name}")
+        return list(resolved.values())
+
+
+class PluginInstaller:
+    """
+    It downloads resolved plugins into the shared stores and links them into a plugins/ folder.
+    """
+
+    def __init__(self, directory: str|None = None, session: requests.Session|None = None, max_workers: int = 8):
+        """
+        :param directory: The directory of the stores, one per hash function
+        :param session: The session to download with, defaults to a new one
+        :param max_workers: How many plugins are downloaded at once
+        """
+        self.directory = directory or cache_dir("plugins")
+        self.session = session or requests.Session()
+        self.max_workers = max_workers
+        self._stores: dict[str, JarStore] = {}
+
+    def store(self, algorithm: str) -> JarStore:
+        if algorithm not in self._stores:
+            self._stores[algorithm] = JarStore(os.path.join(self.directory, algorithm), algorithm=algorithm)
+        return self._stores[algorithm]
+
+    def install(self, plugins: list[ResolvedPlugin], plugins_folder: str) -> InstallReport:
+        """
+        It puts the jars of the plugins into plugins_folder, downloading the missing ones.
+        """
+        start = time.perf_counter()
+        report = InstallReport(plugins)
+        os.makedirs(plugins_folder, exist_ok=True)
+        def install_one(plugin: ResolvedPlugin) -> tuple[str, int]:
+            version = plugin.version
+            if not version.url or not version.hash:
+                raise PluginError(f"{version.name} {version.version} has no file hosted by {version.provider} with a hash, it must be installed by hand")
+            filename = os.path.basename(version.filename or f"{version.name}-{version.version}.jar")
+            store = self.store(version.algorithm)
+            downloaded = 0
+            def progress(stats):
+                nonlocal downloaded
+                downloaded = stats.done - stats.resumed
+            try:
+                outcome = store.fetch(version.url, version.hash, os.path.join(plugins_folder, filename), session=self.session, progress=progress)
+            except (DownloadError, requests.RequestException, OSError) as e:
+                raise PluginError(f"Error downloading {version.name} {version.version}: {e}") from e
+            return outcome, downloaded
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for outcome, downloaded in executor.map(install_one, plugins):
+                report.downloaded += outcome == "miss"
+                report.cached += outcome == "hit"
+                report.bytes += downloaded
+        report.seconds = time.perf_counter() - start
+        return report
+
+
+def install_plugins(plugins: list[str], minecraft_version: str, plugins_folder: str, max_workers: int = 8) -> InstallReport:
+    """
+    It resolves the plugins of a spec for a Minecraft version and installs them into
+    plugins_folder, see the module docstring.
+    """
+    start = time.perf_counter()
+    resolver = PluginResolver(minecraft_version, max_workers=max_workers)
+    try:
+        resolved = resolver.resolve(plugins)
+        report = PluginInstaller(session=resolver.client.session, max_workers=max_workers).install(resolved, plugins_folder)
+    finally:
+        resolver.client.close()
+    report.seconds = time.perf_counter() - start
+    return report
@@ -0,0 +1,176 @@
+"""
+Progress events of the server creation, published by the stages through a ProgressBus and
+consumed by the GUI or, as JSON lines, by headless tools.
+
+The bus coalesces the byte progress of a stage (only the latest value is kept until it is
+consumed) and hands the events out in batches at most every min_interval seconds, so a consumer
+refreshes at a bounded rate however fast the download goes.
+"""
+import json
+import queue
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import ClassVar
+
+
+@dataclass(kw_only=True)
+class Event:
+    kind: ClassVar[str] = "event"
+    job: str # the name of the server
+    time: float = field(default_factory=time.time)
+
+    def as_dict(self) -> dict:
+        return {"kind": self.kind, **asdict(self)}
+
+
+@dataclass(kw_only=True)
+class StageStarted(Event):
+    kind: ClassVar[str] = "stage_started"
+    stage: str
+    text: str = ""
+
+
+@dataclass(kw_only=True)
+class StageFinished(Event):
+    kind: ClassVar[str] = "stage_finished"
+    stage: str
+    outcome: str # "ok" or "error"
+    duration: float
+    error: str|None = None
+
+
+@dataclass(kw_only=True)
+class BytesProgress(Event):
+    kind: ClassVar[str] = "bytes"
+    stage: str
+    done: int
+    total: int|None
+    rate: float # bytes per second
+    eta: float|None # seconds
+
+    def summary(self) -> str:
+        done = f"{self.done / 1024 ** 2:.1f}" + (f"/{self.total / 1024 ** 2:.1f}" if self.total else "")
+        return f"{done} MB, {self.rate / 1024 ** 2:.1f} MB/s" + (f", ETA {self.eta:.0f}s" if self.eta is not None else "")
+
+
+@dataclass(kw_only=True)
+class Message(Event):
+    kind: ClassVar[str] = "message"
+    text: str
+
+
+@dataclass(kw_only=True)
+class ErrorEvent(Event):
+    kind: ClassVar[str] = "error"
+    text: str
+    title: str = "Error"
+    fatal: bool = True
+
+
+@dataclass(kw_only=True)
+class Finished(Event):
+    kind: ClassVar[str] = "finished"
+    errors: list[str] = field(default_factory=list)
+    warnings: list[str] = field(default_factory=list)
+
+
+class ProgressBus:
+    """
+    A thread-safe queue of progress events, see the module docstring.
+    """
+
+    def __init__(self, min_interval: float = 0.1):
+        """
+        :param min_interval: The minimum number of seconds between two batches, see next_batch
+        """
+        self.min_interval = min_interval
+        self._queue = queue.Queue()
+        self._latest: dict[tuple[str, str], BytesProgress] = {} # byte progress not consumed yet
+        self._lock = threading.Lock()
+        self._last_batch = 0.0
+        self.closed = False
+
+    def publish(self, event: Event):
+        if isinstance(event, BytesProgress):
+            key = (event.job, event.stage)
+            with self._lock:
+                queued = key in self._latest
+                self._latest[key] = event
+            if queued: # the queued key will give this event
+                return
+            self._queue.put(key)
+        else:
+            self._queue.put(event)
+
+    def close(self):
+        """
+        It ends the stream, the consumers stop once they got the events published before.
+        """
+        self._queue.put(None)
+
+    def _resolve(self, item) -> Event:
+        if isinstance(item, tuple):
+            with self._lock:
+                return self._latest.pop(item)
+        return item
+
+    def next_batch(self, timeout: float|None = None) -> list[Event]:
+        """
+        It blocks until an event is published, then returns every event published so far (the
+        byte progress of a stage coalesced into its latest value), no sooner than min_interval
+        after the previous batch.
+
+        :param timeout: The maximum number of seconds to wait for an event, defaults to None (forever)
+        :return: The events, empty on timeout or once the bus is closed.
+        """
+        if self.closed:
+            return []
+        try:
+            items = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        wait = self._last_batch + self.min_interval - time.monotonic()
+        if wait > 0 and items[0] is not None:
+            time.sleep(wait)
+        while items[-1] is not None:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if items[-1] is None:
+            self.closed = True
+            items.pop()
+        self._last_batch = time.monotonic()
+        return [self._resolve(item) for item in items]
+
+    def forward(self, callback) -> threading.Thread:
+        """
+        It calls callback(batch) with every batch of events, from a thread, until the bus is closed.
+
+        :param callback: A callable receiving a list of events
+        :return: The started thread.
+        """
+        def run():
+            while not self.closed:
+                batch = self.next_batch()
+                if batch:
+                    callback(batch)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+def json_lines_sink(file):
+    """
+    It returns a callback for ProgressBus.forward writing every event as a line of JSON.
+
+    :param file: A text file, e.g. sys.stdout
+    """
+    lock = threading.Lock()
+    def write(batch: list[Event]):
+        with lock:
+            for event in batch:
+                file.write(json.dumps(event.as_dict()) + "\n")
+            file.flush()
+    return write
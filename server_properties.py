@@ -0,0 +1,225 @@
+"""
+The server.properties file as a model shared by the GUI, msm create/update, the snapshots and the
+telemetry.
+
+It is parsed in one pass and keeps the order of the lines, the comments, the blank lines and the
+keys it doesn't know: the lines that are not modified are written back exactly as they were read,
+so changing a key of a file changes only its line. The values are kept as written in the file,
+escapes included (level-type=minecraft\\:normal).
+
+The keys of Minecraft have a type in SCHEMA (boolean, integer in a range or one of a list of
+values) and validate() reports the values that don't match. diff() returns the keys a set of
+values would change and patch() changes them, so updating many servers costs the parse of every
+file and the write of the modified ones.
+"""
+from dataclasses import dataclass
+
+INT_MAX = 2 ** 31 - 1
+
+
+class PropertyError(ValueError):
+    """
+    A value of server.properties that doesn't match the type of its key.
+    """
+
+    def __init__(self, key: str, value: str, message: str):
+        super().__init__(f"{key}={value}: {message}")
+        self.key, self.value = key, value
+
+
+@dataclass(frozen=True)
+class PropertyType:
+    kind: str # "bool", "int", "enum" or "str"
+    minimum: int|None = None
+    maximum: int|None = None
+    choices: tuple[str, ...] = () # of an enum, compared without case
+
+    def check(self, value: str) -> str|None:
+        """
+        It returns why the value doesn't match the type, None if it does.
+        """
+        if self.kind == "bool":
+            return None if value in ("true", "false") else "must be true or false"
+        if self.kind == "int":
+            try:
+                number = int(value)
+            except ValueError:
+                return "must be an integer"
+            if self.minimum is not None and number < self.minimum or self.maximum is not None and number > self.maximum:
+                return f"must be between {self.minimum} and {self.maximum}" if self.maximum is not None else f"must be at least {self.minimum}"
+            return None
+        if self.kind == "enum":
+            return None if value.lower() in self.choices else f"must be one of {', '.join(self.choices)}"
+        return None
+
+
+BOOL = PropertyType("bool")
+PORT = PropertyType("int", 1, 65535)
+
+SCHEMA: dict[str, PropertyType] = {
+    **{key: BOOL for key in (
+        "accepts-transfers", "allow-flight", "allow-nether", "broadcast-console-to-ops", "broadcast-rcon-to-ops", "debug", "enable-command-block",
+        "enable-jmx-monitoring", "enable-query", "enable-rcon", "enable-status", "enforce-secure-profile", "enforce-whitelist", "force-gamemode",
+        "generate-structures", "hardcore", "hide-online-players", "log-ips", "online-mode", "previews-chat", "prevent-proxy-connections", "pvp",
+        "require-resource-pack", "spawn-animals", "spawn-monsters", "spawn-npcs", "sync-chunk-writes", "use-native-transport", "white-list",
+    )},
+    "server-port": PORT,
+    "query.port": PORT,
+    "rcon.port": PORT,
+    "max-players": PropertyType("int", 0, INT_MAX),
+    "view-distance": PropertyType("int", 3, 32),
+    "simulation-distance": PropertyType("int", 3, 32),
+    "entity-broadcast-range-percentage": PropertyType("int", 10, 1000),
+    "network-compression-threshold": PropertyType("int", -1, INT_MAX),
+    "max-tick-time": PropertyType("int", -1, INT_MAX),
+    "max-chained-neighbor-updates": PropertyType("int", -INT_MAX - 1, INT_MAX),
+    "max-world-size": PropertyType("int", 1, 29999984),
+    "op-permission-level": PropertyType("int", 0, 4),
+    "function-permission-level": PropertyType("int", 1, 4),
+    "player-idle-timeout": PropertyType("int", 0, INT_MAX),
+    "rate-limit": PropertyType("int", 0, INT_MAX),
+    "spawn-protection": PropertyType("int", 0, INT_MAX),
+    "gamemode": PropertyType("enum", choices=("survival", "creative", "adventure", "spectator")),
+    "difficulty": PropertyType("enum", choices=("peaceful", "easy", "normal", "hard")),
+    "level-type": PropertyType("enum", choices=tuple(f"minecraft{separator}{name}" for name in ("normal", "flat", "large_biomes", "amplified", "single_biome_surface") for separator in ("\\:", ":")) + ("default", "flat", "largebiomes", "amplified")),
+}
+
+
+def to_value(value) -> str:
+    """
+    It returns a value as written in server.properties: booleans in lowercase, the rest as str().
+    """
+    return str(value).lower() if isinstance(value, bool) else str(value)
+
+
+def validate_value(key: str, value) -> PropertyError|None:
+    """
+    It returns the error of a value of a key, None if the value is valid or the key unknown.
+    """
+    value = to_value(value)
+    property_type = SCHEMA.get(key)
+    problem = property_type.check(value) if property_type else None
+    return PropertyError(key, value, problem) if problem else None
+
+
+class ServerProperties:
+    """
+    The lines of a server.properties file, see the module docstring.
+    """
+
+    def __init__(self):
+        self._lines: list[list] = [] # [key, value, text]: key None for a comment or blank line, text None once modified
+        self._index: dict[str, int] = {} # key: its last line, the one Minecraft uses
+
+    @classmethod
+    def parse(cls, content: str) -> "ServerProperties":
+        properties = cls()
+        for text in content.splitlines():
+            stripped = text.lstrip()
+            if not stripped or stripped[0] in "#!":
+                properties._lines.append([None, None, text])
+                continue
+            key, _, value = stripped.partition("=")
+            properties._index[key.rstrip()] = len(properties._lines)
+            properties._lines.append([key.rstrip(), value.lstrip(), text])
+        return properties
+
+    @classmethod
+    def load(cls, path: str) -> "ServerProperties":
+        """
+        It parses the file at path, an empty model if it doesn't exist.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.parse(f.read())
+        except FileNotFoundError:
+            return cls()
+
+    def dumps(self) -> str:
+        return "".join((text if text is not None else f"{key}={value}") + "\n" for key, value, text in self._lines)
+
+    def save(self, path: str) -> bool:
+        """
+        It writes the model to path, unless the file already has this content.
+
+        :return: If the file was written.
+        """
+        content = self.dumps()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                if f.read() == content:
+                    return False
+        except FileNotFoundError:
+            pass
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return True
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __getitem__(self, key: str) -> str:
+        return self._lines[self._index[key]][1]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, key: str, default: str|None = None) -> str|None:
+        return self[key] if key in self._index else default
+
+    def as_dict(self) -> dict[str, str]:
+        return {key: self[key] for key in self._index}
+
+    def set(self, key: str, value) -> bool:
+        """
+        It sets a key, at the end of the file if it isn't there.
+
+        :return: If the value changed.
+        """
+        value = to_value(value)
+        if key in self._index:
+            line = self._lines[self._index[key]]
+            if line[1] == value:
+                return False
+            line[1], line[2] = value, None
+        else:
+            self._index[key] = len(self._lines)
+            self._lines.append([key, value, None])
+        return True
+
+    def diff(self, values: dict) -> dict[str, tuple[str|None, str]]:
+        """
+        It returns the keys of values that differ from the file, with their (current, new) value,
+        the current one None if the key isn't in the file.
+        """
+        return {key: (self.get(key), to_value(value)) for key, value in values.items() if self.get(key) != to_value(value)}
+
+    def patch(self, values: dict) -> dict[str, tuple[str|None, str]]:
+        """
+        It sets the keys of values, see set.
+
+        :return: The changes made, see diff.
+        """
+        changes = self.diff(values)
+        for key, (_, value) in changes.items():
+            self.set(key, value)
+        return changes
+
+    def validate(self, keys=None) -> list[PropertyError]:
+        """
+        It returns the errors of the values of the file (of keys only, if given), see SCHEMA.
+        """
+        errors = [validate_value(key, self[key]) for key in (self._index if keys is None else keys) if key in self._index]
+        return [error for error in errors if error is not None]
+
+
+def validate_values(values: dict) -> list[PropertyError]:
+    """
+    It returns the errors of the values of a dict of keys, e.g. the overrides of a spec.
+    """
+    errors = [validate_value(key, value) for key, value in values.items()]
+    return [error for error in errors if error is not None]
+
@@ -1,13 +1,163 @@
 import os
 import re
+import secrets
 import shutil
-import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
 
-import pythoncom
 import requests
-from win32com.client import Dispatch
 
+import java_runtime
+import jvm_profiles
 import settings
+from downloader import DownloadError, TransferStats, download_file
+from get_papermc import get_build_sha256
+from jar_store import JarStore
+from paperclip_cache import PaperclipCache, WarmupError
+from plugins import PluginError, install_plugins
+from pipeline import Stage, Trace, run_stages
+from progress import BytesProgress, ErrorEvent, Finished, Message, ProgressBus, StageFinished, StageStarted
+from server_properties import ServerProperties, validate_values
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "template", "server.properties")
+EULA_URL = "https://account.mojang.com/documents/minecraft_eula"
+MSM_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "msm.py") # runs the supervisor, see supervisor_command
+
+PAPER_FLAGS = { # ServerSpec attribute: Paper argument
+    "bonus_chest": "--bonusChest",
+    "erase_cache": "--eraseCache",
+    "force_upgrade": "--forceUpgrade",
+    "safe_mode": "--safeMode",
+    "demo": "--demo",
+    "online_authentication": "--online-mode true",
+}
+
+
+class StageError(Exception):
+    """
+    Raised when a stage of the server creation reported a fatal error.
+    """
+
+
+@dataclass
+class ServerSpec:
+    """
+    Everything needed to create a server, independent of the GUI.
+    """
+    name: str
+    folder_path: str
+    version: str
+    build: int|None = None # None is the latest build of the version
+    properties: dict[str, str] = field(default_factory=dict) # overrides of template/server.properties
+    xms: int = 2048
+    xmx: int = 2048
+    players: int|None = None # expected players, used by msm to size the heap and properties (see capacity)
+    java_path: str|None = None
+    jvm_args: str = "" # added after the flags of the JVM profile in the start file
+    jvm_profile: str = jvm_profiles.AUTO_PROFILE # see jvm_profiles
+    large_pages: bool = False
+    active_processor_count: int|None = None
+    gui: bool = False
+    bonus_chest: bool = False
+    erase_cache: bool = False
+    force_upgrade: bool = False
+    safe_mode: bool = False
+    demo: bool = False
+    online_authentication: bool = False
+    auto_restart: bool = False
+    supervisor: bool = True # auto_restart through the supervisor when Python is there, see supervisor
+    pause: bool = True
+    accept_eula: bool = False
+    warmup: bool = False # prepare the first start from the shared Paperclip cache, see paperclip_cache
+    download_segments: int = 1 # HTTP ranges of the jar downloaded in parallel, see downloader.download_file
+    rcon: bool = False # enable RCON with a generated password, see rcon_properties and telemetry
+    plugins: list[str] = field(default_factory=list) # "[provider:]project[@constraint]", see plugins
+
+    @property
+    def dest_folder(self) -> str:
+        return os.path.join(self.folder_path, self.name)
+
+
+class SetupContext:
+    """
+    The state of the creation of one server, what used to be in the global settings.
+
+    The progress is published as typed events on the progress bus (see progress), and reported
+    through notify(event, payload) with the text events "--UPDATE--", "--POPUP-ERROR--" and
+    "--FINISHED--". Errors that leave the server unusable are kept in errors, the others (e.g.
+    Java not found, the start file uses "java") in warnings. The stages run concurrently, so the
+    fatal errors of a stage are also kept apart (stage_errors, by thread) to fail only that stage.
+    """
+
+    def __init__(self, spec: ServerSpec, url: str, notify=None, trace: Trace|None = None, bus: ProgressBus|None = None):
+        self.spec = spec
+        self.bus = bus
+        self.url = url
+        self.filename = url.split("/")[-1].replace(" ", "_") # cleaning filename
+        self.notify = notify or (lambda event, payload: None)
+        self.trace = trace or Trace(spec.name)
+        self.errors: list[str] = []
+        self.warnings: list[str] = []
+        self.changes: list = [] # the changes made by an update, see update_server.Change
+        self.warmup = None # the LinkReport of the first start preparation, see paperclip_cache
+        self.plugins = None # the InstallReport of the plugins, see plugins
+        self._stage = threading.local() # .errors: the fatal errors of the stage running in the thread
+
+    def publish(self, event_type, **kwargs):
+        if self.bus is not None:
+            self.bus.publish(event_type(job=self.spec.name, **kwargs))
+
+    def update(self, text: str):
+        self.notify("--UPDATE--", text)
+        self.publish(Message, text=text)
+
+    def error(self, text: str, title: str = "Error", fatal: bool = True):
+        (self.errors if fatal else self.warnings).append(text)
+        if fatal:
+            self.stage_errors.append(text)
+        self.notify("--POPUP-ERROR--", {"title": title, "text": text})
+        self.publish(ErrorEvent, text=text, title=title, fatal=fatal)
+
+    def finish(self):
+        self.notify("--FINISHED--", "")
+        self.publish(Finished, errors=list(self.errors), warnings=list(self.warnings))
+
+    @property
+    def stage_errors(self) -> list[str]:
+        """
+        The fatal errors reported by the stage running in this thread, a throwaway list outside of
+        a stage.
+        """
+        errors = getattr(self._stage, "errors", None)
+        return errors if errors is not None else []
+
+    @property
+    def timings(self) -> dict[str, float]:
+        return self.trace.durations()
+
+    def stage(self, name: str, text: str, func, deps: tuple[str, ...] = ()) -> Stage:
+        """
+        It returns the Stage running func(results), reporting it with text. A fatal error reported
+        during the stage fails it, so the stages depending on it are skipped.
+        """
+        def run(results: dict):
+            self.notify("--UPDATE--", text)
+            self.publish(StageStarted, stage=name, text=text)
+            start, outer, self._stage.errors = time.perf_counter(), getattr(self._stage, "errors", None), []
+            try:
+                result = func(results)
+                if self._stage.errors:
+                    raise StageError(self._stage.errors[-1])
+            except Exception as e:
+                self.publish(StageFinished, stage=name, outcome="error", duration=time.perf_counter() - start, error=str(e))
+                raise
+            finally:
+                self._stage.errors = outer
+            self.publish(StageFinished, stage=name, outcome="ok", duration=time.perf_counter() - start)
+            return result
+        return Stage(name, run, deps)
 
 
 def write_file(file_path, content):
@@ -39,187 +189,399 @@ def get_element(elements: list[list], key_to_find):
                 return ele
 
 
-def make_folder(dest_folder: str):
+def rcon_properties(spec: ServerSpec, existing: ServerProperties|None = None) -> dict[str, str]:
+    """
+    It returns the keys of server.properties enabling RCON if the spec asks for it, with a random
+    password unless the spec or the existing server.properties already has one (an empty password
+    is none). They are applied after the properties of the spec, which the GUI fills with every key
+    of the template (enable-rcon=false, an empty rcon.password).
+
+    :param spec: The spec of the server
+    :param existing: The current server.properties of the server, if any
+    """
+    if not spec.rcon:
+        return {}
+    password = str(spec.properties.get("rcon.password") or "").strip() or (existing or {}).get("rcon.password", "").strip() or secrets.token_urlsafe(24)
+    return {"enable-rcon": "true", "rcon.password": password}
+
+
+def render_properties(overrides: dict[str, str], template_path: str = TEMPLATE_PATH) -> str:
+    """
+    It returns the content of the server.properties template with the values of overrides.
+    Keys that are not in the template are added at the end, the other lines are kept as they are.
+
+    :param overrides: The keys and values to set
+    :param template_path: The path to the template
+    :return: The content of the server.properties file.
+    """
+    properties = ServerProperties.load(template_path)
+    properties.patch(overrides)
+    return properties.dumps()
+
+
+def check_properties(ctx: SetupContext) -> bool:
+    """
+    It reports the properties of the spec whose values don't match the type of their key (see
+    server_properties.SCHEMA) as one fatal error.
+
+    :return: If they are all valid.
+    """
+    errors = validate_values(ctx.spec.properties)
+    if errors:
+        ctx.error("Invalid server.properties values:\n" + "\n".join(str(error) for error in errors), "server.properties")
+    return not errors
+
+
+def check_eula(ctx: SetupContext) -> bool:
+    """
+    It reports a spec that doesn't accept the Minecraft EULA as a fatal error, so no caller can
+    create a server agreeing to it for the user.
+
+    :return: If the EULA is accepted.
+    """
+    if not ctx.spec.accept_eula:
+        ctx.error(f"The Minecraft EULA must be accepted (accept_eula = true): {EULA_URL}", "EULA")
+    return ctx.spec.accept_eula
+
+
+def make_folder(dest_folder: str, ctx: SetupContext):
     """
     It creates a folder if it doesn't exist, and if it does exist, it deletes it and creates a new one
 
     :param dest_folder: The path to the folder where the server will be
     :type folder_path: str
+    :param ctx: The context of the server creation
     """
     # erase the folder name if it already exists
     try:
         if os.path.exists(dest_folder):
             shutil.rmtree(dest_folder)
-        os.mkdir(dest_folder)
+        os.makedirs(dest_folder)
     except PermissionError as e:
-        window.write_event_value("--POPUP-ERROR--", {"title": "Error", "text": f"Error creating folder: {e}"})
+        ctx.error(f"Error creating folder: {e}")
 
 
-def download(url: str, dest_folder: str):
+def download(url: str, dest_folder: str, ctx: SetupContext, sha256: str|None = None, stage: str = "download", segments: int = 1):
     """
-    It downloads a file from a URL and saves it to a folder
+    It downloads a file from a URL and saves it to a folder.
+
+    If the SHA-256 of the file is known, the file goes through the shared jar store: it is only
+    downloaded if no other server already has it, and it is verified.
 
     :param url: The URL of the file you want to download
     :type url: str
     :param dest_folder: The folder where the file will be downloaded to
     :type dest_folder: str
+    :param ctx: The context of the server creation
+    :param sha256: The expected SHA-256 of the file, defaults to None (no store, no verification)
+    :type sha256: str|None
+    :param stage: The stage of the byte progress events
+    :param segments: How many HTTP ranges are downloaded in parallel, see download_file
+    :return: The number of bytes downloaded, 0 if the jar came from the store.
     """
-    filename = url.split("/")[-1].replace(" ", "_") # cleaning filename
-    file_path = os.path.join(dest_folder, filename)
-    settings.add("filename", filename)
+    file_path = os.path.join(dest_folder, ctx.filename)
 
-    r = requests.get(url, stream=True)
-    if r.status_code != 200:
-        window.write_event_value("--POPUP-ERROR--", {"title": "Error", "text": f"Error downloading {filename}"})
-    with open(file_path, "wb") as f:
-        for chunk in r.iter_content(chunk_size=1024 * 8):
-            if chunk:
-                f.write(chunk)
-                f.flush()
-                os.fsync(f.fileno())
+    last_update, last_stats = 0, None
+    def progress(stats: TransferStats):
+        nonlocal last_update, last_stats
+        last_stats = stats
+        ctx.publish(BytesProgress, stage=stage, done=stats.done, total=stats.total, rate=stats.rate(), eta=stats.eta()) # coalesced by the bus
+        if time.monotonic() - last_update >= 0.5: # notify has no rate limit
+            last_update = time.monotonic()
+            ctx.notify("--UPDATE--", f"Downloading JAR file...\n{stats.summary()}")
 
+    try:
+        if sha256:
+            JarStore().fetch(url, sha256, file_path, progress=progress, segments=segments)
+        else:
+            download_file(url, file_path, progress=progress, segments=segments)
+    except (DownloadError, requests.RequestException) as e:
+        ctx.error(f"Error downloading {ctx.filename}: {e}")
+    return last_stats.done - last_stats.resumed if last_stats else 0
 
-def check_java(minecraft_version: str, custom_java: str|None = None) -> bool:
+
+def check_java(minecraft_version: str, ctx: SetupContext, custom_java: str|None = None) -> java_runtime.JavaRuntime|None:
     """
     It checks if the java version is ok for the minecraft version.
 
+    The Java installations come from the JavaIndex (PATH, JAVA_HOME, the usual installation
+    directories), their versions from their release file, and the requirements of each Minecraft
+    version from java_runtime.JAVA_REQUIREMENTS.
+
     :param minecraft_version: str
     :type minecraft_version: str
-    :param custom_java: str|None = None
+    :param ctx: The context of the server creation
+    :param custom_java: The Java path chosen by the user, defaults to None
     :type custom_java: str|None
-    :return: The path to the java.exe file.
-
-    Paper documentation recommendations:
-    Paper Version	Recommended Java Version
-    1.8 to 1.11	Java 8
-    1.12 to 1.16.4	Java 11
-    1.16.5	Java 16
-    1.17.1-1.18.1+	Java 17
-
-    Test:
-    Java 8 can run up to 1.16.5
-    1.17 needs at least Java 16
-    1.18 needs at least Java 17
-    """
-    #TODO: check the custom java and return it if it's ok
-    where_java = subprocess.run(["where", "java"], capture_output=True, text=True)
-    if where_java.returncode:
-        window.write_event_value("--POPUP-ERROR--", {"title": "Error", "text": "Java is not installed!\nYou must install Java to run your server."})
-        return False
-    pythoncom.CoInitialize()
-    ver_parser = Dispatch("Scripting.FileSystemObject")
-    java_paths = where_java.stdout.split("\n")
-    java_paths.remove("")
-    dict_java_paths = {}
-
-
-    for java_path in java_paths:
-        info = ver_parser.GetFileVersion(java_path)
-
-        if info == "No Version Information Available":
-            continue
+    :return: The Java installation to use, None if none is ok.
+    """
+    if custom_java:
+        runtime, problem = java_runtime.validate(custom_java, minecraft_version)
+        if problem is None:
+            return runtime
+        ctx.error(f"Error with your custom java path:\n{custom_java}\n{problem}\nIt will automatically fallback to the optimal java runtime.", fatal=False)
+    runtime = java_runtime.index.best_for(minecraft_version)
+    if runtime is not None:
+        return runtime
+    newest = java_runtime.index.newest()
+    if newest is None:
+        ctx.error("Java is not installed!\nYou must install Java to run your server.", fatal=False)
+    else:
+        minimum, maximum, _ = java_runtime.minecraft_requirement(minecraft_version)
+        ctx.error(f"Java version is {newest.major} but it needs to be at least {minimum}" + (f" and at most {maximum}" if maximum else ""), fatal=False)
+    return None
 
-        dict_java_paths[java_path] = float(info.split(".")[0] + "." + info.split(".")[1]) if info else None
 
-    max_java_path = max((java_paths), key=lambda x: dict_java_paths[x])
-    max_java_version = dict_java_paths[max_java_path]
+def find_java_runtime(ctx: SetupContext) -> java_runtime.JavaRuntime|None:
+    """
+    It returns the Java runtime the start file should use: the custom one if it works, else the
+    optimal one for the version, else None (the start file uses "java").
 
-    # check if the max java version is ok for the minecraft_version
-    try:
-        minecraft_version = float(minecraft_version)
-    except ValueError:
-        minecraft_version = float(f"{minecraft_version.split('.')[0]}.{minecraft_version.split('.')[1]}")
-
-    if max_java_version >= 17:
-        return max_java_path
-    if minecraft_version <= 1.16:
-        if max_java_version >= 8:
-            return max_java_path
-        else:
-            window.write_event_value("--POPUP-ERROR--", {"title": "Error", "text": f"Java version is {max_java_version} but it needs to be at least 8"})
-            return False
-    if minecraft_version == 1.17:
-        if max_java_version >= 16:
-            return max_java_path
-        else:
-            window.write_event_value("--POPUP-ERROR--", {"title": "Error", "text": f"Java version is {max_java_version} but it needs to be at least 16"})
-            return False
-    if minecraft_version == 1.18:
-        if max_java_version >= 17:
-            return max_java_version
-        else:
-            window.write_event_value("--POPUP-ERROR--", {"title": "Error", "text": f"Java version is {max_java_version} but it needs to be at least 17"})
-            return False
-    window.write_event_value("--POPUP-ERROR--", {"title": "Error", "text": "This error is related to your Java version.\nPlease report it on GitHub:\ngithub.com/TheGeeKing/Minecraft-Server-Maker/issues"})
-    return False
-
-
-def setup_start_file(dest_folder: str):
-    """
-    It creates a start.bat file in the folder of the server.
-
-    :param dest_folder: The path to the directory where the start.bat file will be created
-    """
-    dict_start = {
-    "--ENABLE-GUI--": "--nogui",
-    "--BONUS-CHEST--": "--bonusChest",
-    "--ERASE-CACHE--": "--eraseCache",
-    "--FORCE-UPGRADE--": "--forceUpgrade",
-    "--SAFE-MODE--": "--safeMode",
-    "--DEMO-MODE--": "--demo",
-    "--ONLINE-AUTHENTICATION--": "--online-mode true",
-    }
-    _, values = window.read(timeout=0)
-    user_java_path = f"\"{values['--CUSTOM-JAVA--']}\"" if values['--CUSTOM-JAVA--'] else None # add quotes around the path
-    optimal_java_runtime = check_java(settings.get("minecraft_version"), user_java_path)
-    if user_java_path:
-        java_runtime = user_java_path
-    elif optimal_java_runtime:
-        java_runtime = f"\"{optimal_java_runtime}\""
+    :param ctx: The context of the server creation
+    """
+    return check_java(ctx.spec.version, ctx, ctx.spec.java_path)
+
+
+def java_command(ctx: SetupContext, runtime: java_runtime.JavaRuntime|None) -> list[str]:
+    """
+    It returns the command starting the server: Java, its flags and the Paper arguments.
+
+    The JVM flags come from the JVM profile of the spec, for its heap and the Java version.
+
+    :param ctx: The context of the server creation
+    :param runtime: The Java runtime to start the server with, see find_java_runtime
+    """
+    spec = ctx.spec
+    flags = jvm_profiles.resolve_flags(spec.jvm_profile, int(spec.xmx), runtime.major if runtime else None, spec.large_pages, spec.active_processor_count)
+    command = [f"\"{runtime.executable}\"" if runtime else "java", f"-Xms{int(spec.xms)}M", f"-Xmx{int(spec.xmx)}M"] + flags # add quotes around the path
+    if spec.jvm_args:
+        command.append(spec.jvm_args)
+    command += ["-jar", ctx.filename]
+    if not spec.gui:
+        command.append("--nogui")
+    for attribute, value in PAPER_FLAGS.items():
+        if getattr(spec, attribute):
+            command.append(value)
+    return command
+
+
+def supervisor_command(spec: ServerSpec) -> list[str]|None:
+    """
+    It returns the command running the supervisor with this Python (before the server command),
+    None if the server restarts without it or if the application is packaged without Python.
+    """
+    if not (spec.auto_restart and spec.supervisor) or getattr(sys, "frozen", False):
+        return None
+    return [f"\"{sys.executable}\"", f"\"{MSM_PATH}\"", "supervise", "--"]
+
+
+def render_start_bat(spec: ServerSpec, command: list[str]) -> str:
+    supervisor = supervisor_command(spec)
+    if supervisor:
+        # the restart loop stays as the fallback when Python or Minecraft Server Maker was moved
+        start_content = """if exist {python} if exist {msm} (
+    {supervisor}
+    goto :end
+)
+:start
+{command}
+goto :start
+:end
+{pause}""".format(python=supervisor[0], msm=supervisor[1], supervisor=" ".join(supervisor + command), command=" ".join(command), pause="PAUSE" if spec.pause else "")
+        return start_content
+    start_content = """{auto_restart_1}{command}
+{auto_restart_2}
+{pause}""".format(auto_restart_1=":start\n" if spec.auto_restart else "", command=" ".join(command), auto_restart_2="goto :start\n" if spec.auto_restart else "", pause="PAUSE" if spec.pause else "")
+    return start_content
+
+
+def render_start_sh(spec: ServerSpec, command: list[str]) -> str:
+    lines = ["#!/bin/sh", 'cd "$(dirname "$0")"']
+    restart_loop = ["while true; do", f"    {' '.join(command)}", '    echo "Server stopped, restarting in 5 seconds (Ctrl+C to cancel)..."', "    sleep 5", "done"]
+    supervisor = supervisor_command(spec)
+    if supervisor:
+        lines += [f"if [ -x {supervisor[0]} ] && [ -f {supervisor[1]} ]; then", f"    {' '.join(supervisor + command)}", "else"] + [f"    {line}" for line in restart_loop] + ["fi"]
+    elif spec.auto_restart:
+        lines += restart_loop
     else:
-        java_runtime = "java"
+        lines.append(" ".join(command))
+    if spec.pause:
+        lines.append('printf "Press Enter to continue..."; read -r _')
+    return "\n".join(lines) + "\n"
 
-    if java_runtime not in ["java", optimal_java_runtime]: # skip that if java_runtime is from optimal_java_runtime because it is from `where java`
-        test_java_runtime_provided: bool = os.system(f"{java_runtime} -version") # if no error occurs, it means that the java runtime provided by the user is correct and it's returncode is 0
-        if test_java_runtime_provided: # if java_runtime is incorrect, returncode 1
-            window.write_event_value("--POPUP-ERROR--", {"title": "Error", "text": f"Error running your custom java path:\n{user_java_path}\nPlease check if it's correct!\nIt will automatically fallback to the optimal java runtime."})
-            java_runtime = optimal_java_runtime
-        else:
-            pass #TODO: check if the custom java can run the minecraft version, maybe direclty in check_java function
-    paper_args = ""
-    for key, value in dict_start.items():
-        if key=="--ENABLE-GUI--" and values[key]:
+
+def render_start_files(ctx: SetupContext, runtime: java_runtime.JavaRuntime|None) -> dict[str, str]|None:
+    """
+    It returns the content of the start files by name, None if the JVM profile can't be used
+    (the error is reported in the context).
+
+    :param ctx: The context of the server creation
+    :param runtime: The Java runtime to start the server with, see find_java_runtime
+    """
+    try:
+        command = java_command(ctx, runtime)
+    except jvm_profiles.ProfileError as e:
+        ctx.error(str(e))
+        return None
+    return {"start.bat": render_start_bat(ctx.spec, command), "start.sh": render_start_sh(ctx.spec, command)}
+
+
+def write_start_file(dest_folder: str, ctx: SetupContext, runtime: java_runtime.JavaRuntime|None, names: list[str]|None = None):
+    """
+    It creates the start.bat and start.sh files in the folder of the server.
+
+    :param dest_folder: The path to the directory where the start files will be created
+    :param ctx: The context of the server creation
+    :param runtime: The Java runtime to start the server with, see find_java_runtime
+    :param names: The start files to write, defaults to all of them
+    """
+    start_files = render_start_files(ctx, runtime)
+    if start_files is None:
+        return
+    for name, content in start_files.items():
+        if names is not None and name not in names:
             continue
-        elif values[key]:
-            paper_args += f" {value}"
-    start_content = """{auto_restart_1}{java_runtime} -Xms{xms}M -Xmx{xmx}M -jar {paper_jar}{paper_args}
-{auto_restart_2}
-{pause}""".format(auto_restart_1=":start\n" if values["--AUTO-RESTART--"] else "", java_runtime=java_runtime, xms=int(values["--XMS--"]), xmx=int(values["--XMX--"]), paper_jar=settings.get("filename"), paper_args=paper_args, auto_restart_2="goto :start\n" if values["--AUTO-RESTART--"] else "", pause="PAUSE" if values["--PAUSE--"] else "")
-    write_file(os.path.join(dest_folder, "start.bat"), start_content)
+        path = os.path.join(dest_folder, name)
+        if name.endswith(".sh"):
+            with open(path, "w", encoding="utf-8", newline="\n") as f:
+                f.write(content)
+            os.chmod(path, 0o755)
+        else:
+            write_file(path, content)
+
 
+def setup_start_file(dest_folder: str, ctx: SetupContext):
+    """
+    It creates the start.bat and start.sh files in the folder of the server.
+
+    :param dest_folder: The path to the directory where the start files will be created
+    :param ctx: The context of the server creation
+    """
+    write_start_file(dest_folder, ctx, find_java_runtime(ctx))
 
-def setup_server(url):
+
+def provision(ctx: SetupContext, max_workers: int = 4) -> SetupContext:
+    """
+    It creates the server of the context: makes its folder, downloads the jar, agrees to the EULA,
+    writes server.properties and creates the start file.
+
+    The stages run as a graph: the Java discovery and the rendering of server.properties don't
+    wait for the folder nor the download, everything joins before the start file is written.
+    With spec.warmup, the first start is prepared from the shared Paperclip cache once the jar
+    and Java are there (see paperclip_cache). The plugins of the spec are resolved and installed
+    once the folder exists (see plugins). Nothing is done if the spec doesn't accept the EULA or
+    if its properties are invalid (see check_properties). Each stage is recorded in ctx.trace.
+
+    :param ctx: The context of the server creation
+    :param max_workers: How many stages can run at once
+    :return: The context, with its trace and errors.
+    """
+    spec = ctx.spec
+    dest_folder = spec.dest_folder
+    if not check_eula(ctx) or not check_properties(ctx): # before the folder is made
+        ctx.finish()
+        return ctx
+
+    def fetch_jar(results: dict):
+        try:
+            sha256 = get_build_sha256(spec.version, spec.build)
+        except Exception: # the jar is still downloaded, just not shared nor verified
+            sha256 = None
+        ctx.trace.set_bytes("download", download(ctx.url, dest_folder, ctx, sha256, segments=spec.download_segments))
+        return sha256
+
+    def warmup(results: dict):
+        if not results["download"]:
+            ctx.error("The first start can't be prepared, the hash of the jar is unknown.", "Warmup", fatal=False)
+            return
+        runtime = results["java"]
+        try:
+            report = PaperclipCache().prepare(os.path.join(dest_folder, ctx.filename), spec.version, results["download"], dest_folder, runtime.executable if runtime else "java")
+        except (WarmupError, OSError) as e:
+            ctx.error(f"The first start couldn't be prepared: {e}", "Warmup", fatal=False)
+            return
+        ctx.warmup = report
+        ctx.trace.set_bytes("warmup", report.bytes)
+        ctx.update(report.summary())
+
+    def install(results: dict):
+        try:
+            report = install_plugins(spec.plugins, spec.version, os.path.join(dest_folder, "plugins"))
+        except PluginError as e:
+            ctx.error(f"The plugins couldn't be installed: {e}", "Plugins")
+            return
+        ctx.plugins = report
+        ctx.trace.set_bytes("plugins", report.bytes)
+        ctx.update(report.summary())
+
+    def write_config(results: dict):
+        if spec.accept_eula:
+            write_file(os.path.join(dest_folder, "eula.txt"), "eula=true")
+        write_file(os.path.join(dest_folder, "server.properties"), results["render"])
+
+    stages = [
+        ctx.stage("folder", "Making folder...", lambda results: make_folder(dest_folder, ctx)),
+        ctx.stage("java", "Looking for Java...", lambda results: find_java_runtime(ctx)),
+        ctx.stage("render", "Rendering server.properties...", lambda results: render_properties({**spec.properties, **rcon_properties(spec)})),
+        ctx.stage("download", "Downloading JAR file...", fetch_jar, ("folder",)),
+        ctx.stage("config", "Agreeing to EULA and writing server.properties...", write_config, ("folder", "render")),
+        ctx.stage("start_file", "Creating start file...", lambda results: write_start_file(dest_folder, ctx, results["java"]), ("download", "java", "config")),
+    ]
+    if spec.warmup:
+        stages.append(ctx.stage("warmup", "Preparing the first start...", warmup, ("download", "java")))
+    if spec.plugins:
+        stages.append(ctx.stage("plugins", "Installing plugins...", install, ("folder",)))
+    try:
+        run_stages(stages, ctx.trace, max_workers)
+    except StageError:
+        pass # already in ctx.errors
+    except Exception as e:
+        ctx.error(f"Error creating the server: {e}")
+    ctx.finish()
+    return ctx
+
+
+def spec_from_values(values: dict) -> ServerSpec:
+    """
+    It returns the ServerSpec of the values of the GUI and of the settings.
+
+    :param values: The values of the main window
+    """
+    return ServerSpec(
+        name=settings.get("folder_name"),
+        folder_path=settings.get("folder_path"),
+        version=settings.get("minecraft_version"),
+        build=int(settings.get("build")),
+        properties=settings.get("server_properties"),
+        xms=int(values["--XMS--"]),
+        xmx=int(values["--XMX--"]),
+        java_path=values["--CUSTOM-JAVA--"] or None,
+        jvm_args=values["--OTHER-ARGUMENTS--"],
+        jvm_profile=values["--JVM-PROFILE--"],
+        gui=values["--ENABLE-GUI--"],
+        bonus_chest=values["--BONUS-CHEST--"],
+        erase_cache=values["--ERASE-CACHE--"],
+        force_upgrade=values["--FORCE-UPGRADE--"],
+        safe_mode=values["--SAFE-MODE--"],
+        demo=values["--DEMO-MODE--"],
+        online_authentication=values["--ONLINE-AUTHENTICATION--"],
+        auto_restart=values["--AUTO-RESTART--"],
+        supervisor=values["--SUPERVISOR--"],
+        pause=values["--PAUSE--"],
+        accept_eula=values["--ACCEPT-EULA--"],
+        warmup=values["--WARMUP--"],
+        rcon=values["--RCON--"],
+        plugins=values["--PLUGINS--"].replace(",", " ").split(),
+    )
+
+
+def setup_server(url, values: dict, bus: ProgressBus):
     """
     It downloads a file from a url, writes a file to the server folder, writes a server.properties
     file to the server folder, and creates a start.bat file in the server folder.
 
     :param url: The url of the server file
+    :param values: The values of the main window
+    :param bus: The progress bus of the GUI
     """
-    global window
-    window, folder_path, folder_name = settings.get("window"), settings.get("folder_path"), settings.get("folder_name")
-    dest_folder = os.path.join(folder_path, folder_name)
-    window.write_event_value("--UPDATE--", "Making folder...")
-    make_folder(dest_folder)
-    # download file with url to server folder
-    window.write_event_value("--UPDATE--", "Downloading JAR file...")
-    download(url, dest_folder)
-    # write file to server folder
-    window.write_event_value("--UPDATE--", "Agreeing to EULA...")
-    write_file(os.path.join(dest_folder, "eula.txt"), "eula=true")
-    # write server.properties file
-    window.write_event_value("--UPDATE--", "Writing server.properties...")
-    write_file(os.path.join(dest_folder, "server.properties"), settings.get("server_properties"))
-
-    window.write_event_value("--UPDATE--", "Creating start file...")
-    setup_start_file(dest_folder)
-    window.write_event_value("--FINISHED--", "")
+    provision(SetupContext(spec_from_values(values), url, bus=bus))
@@ -0,0 +1,212 @@
+"""
+Snapshots of provisioned servers, cloned into fleets of near-identical servers.
+
+A snapshot is a copy of a server folder (its world optional) in the snapshot directory, with the
+list of its files in SNAPSHOT_FILE:
+
+snapshots/lobby/snapshot.json
+snapshots/lobby/files/paper-1.20.4-400.jar
+snapshots/lobby/files/server.properties
+snapshots/lobby/files/world/...
+
+A clone is made from the list, without walking the snapshot again. Its files are reflinks of the
+snapshot (copy-on-write) where the filesystem supports them. Otherwise the read-only files (the
+jars, cache/, libraries/ and versions/, which a server never writes) are hardlinked and the others
+copied. server.properties is written with the overrides of the clone (server-port, motd...), so
+cloning a server is mostly metadata operations.
+"""
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+
+from fsutil import link_file
+from paths import cache_dir
+from server_properties import ServerProperties
+from setup_server import write_file
+
+SNAPSHOT_FILE = "snapshot.json"
+FILES_DIR = "files"
+READ_ONLY_DIRS = ("cache", "libraries", "versions") # filled by Paperclip, see paperclip_cache
+EXCLUDED = ("logs", "crash-reports", ".console_history") # at the root of the server
+EXCLUDED_FILES = ("session.lock",) # at any depth, Minecraft locks world/, world_nether/ and world_the_end/
+WORLD_SUFFIXES = ("", "_nether", "_the_end")
+
+
+class SnapshotError(Exception):
+    """
+    Raised when a snapshot can't be made, found or cloned.
+    """
+
+
+@dataclass
+class SnapshotFile:
+    path: str # relative, with /
+    size: int
+    read_only: bool
+
+
+@dataclass
+class Snapshot:
+    name: str
+    source: str
+    created: float
+    world: bool
+    directories: list[str] = field(default_factory=list) # relative, parents first
+    files: list[SnapshotFile] = field(default_factory=list)
+
+    @property
+    def bytes(self) -> int:
+        return sum(file.size for file in self.files)
+
+
+@dataclass
+class CloneReport:
+    dest_folder: str
+    seconds: float = 0.0
+    files: int = 0
+    bytes: int = 0
+    new_bytes: int = 0 # the data actually copied
+    methods: dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        methods = ", ".join(f"{count} {method}" for method, count in sorted(self.methods.items()))
+        return f"{self.files} files ({methods}), {self.bytes / 1024 ** 2:.1f} MB, {self.new_bytes / 1024 ** 2:.1f} MB copied in {self.seconds:.2f}s"
+
+
+def is_read_only(path: str) -> bool:
+    """
+    It returns whether a server never writes the file at path (relative, with /).
+    """
+    return path.endswith(".jar") and "/" not in path or path.split("/", 1)[0] in READ_ONLY_DIRS
+
+
+
+class SnapshotStore:
+    """
+    The directory of the snapshots, see the module docstring.
+    """
+
+    def __init__(self, directory: str|None = None):
+        self.directory = directory or cache_dir("snapshots")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        if not name or os.sep in name or "/" in name or name in (".", ".."):
+            raise SnapshotError(f"Invalid snapshot name {name!r}")
+        return os.path.join(self.directory, name)
+
+    def get(self, name: str) -> Snapshot:
+        try:
+            with open(os.path.join(self.path(name), SNAPSHOT_FILE), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise SnapshotError(f"No snapshot {name!r}") from e
+        return Snapshot(**{**data, "files": [SnapshotFile(**file) for file in data["files"]]})
+
+    def names(self) -> list[str]:
+        return sorted(name for name in os.listdir(self.directory) if os.path.isfile(os.path.join(self.directory, name, SNAPSHOT_FILE)))
+
+    def create(self, name: str, server_folder: str, world: bool = True) -> Snapshot:
+        """
+        It snapshots a server folder. The server should be stopped. The files are reflinked or
+        copied, only the read-only ones can be hardlinked (the server keeps writing the others).
+
+        :param name: The name of the snapshot, an existing snapshot is replaced
+        :param server_folder: The folder of a provisioned server
+        :param world: If the worlds (level-name of server.properties and its nether and end) are included
+        """
+        server_folder = os.path.abspath(server_folder)
+        if not os.path.isfile(os.path.join(server_folder, "server.properties")):
+            raise SnapshotError(f"{server_folder} is not a server folder, it has no server.properties")
+        excluded = set(EXCLUDED)
+        if not world:
+            level_name = ServerProperties.load(os.path.join(server_folder, "server.properties")).get("level-name", "world")
+            excluded.update(level_name + suffix for suffix in WORLD_SUFFIXES)
+
+        path = self.path(name)
+        work = path + ".tmp"
+        shutil.rmtree(work, ignore_errors=True)
+        snapshot = Snapshot(name, server_folder, time.time(), world)
+        for root, dirs, files in os.walk(server_folder):
+            relative = os.path.relpath(root, server_folder).replace(os.sep, "/")
+            relative = "" if relative == "." else relative + "/"
+            if not relative:
+                dirs[:] = [entry for entry in dirs if entry not in excluded]
+                files = [entry for entry in files if entry not in excluded]
+            files = [entry for entry in files if entry not in EXCLUDED_FILES]
+            dirs.sort()
+            os.makedirs(os.path.join(work, FILES_DIR, relative), exist_ok=True)
+            snapshot.directories += [relative + entry for entry in dirs]
+            for file_name in sorted(files):
+                source = os.path.join(root, file_name)
+                if os.path.islink(source) or not os.path.isfile(source):
+                    continue
+                read_only = is_read_only(relative + file_name)
+                link_file(source, os.path.join(work, FILES_DIR, relative, file_name), ("reflink", "hardlink", "copy") if read_only else ("reflink", "copy"))
+                snapshot.files.append(SnapshotFile(relative + file_name, os.path.getsize(source), read_only))
+        with open(os.path.join(work, SNAPSHOT_FILE), "w", encoding="utf-8") as f:
+            json.dump(asdict(snapshot), f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(work, path)
+        return snapshot
+
+    def delete(self, name: str):
+        shutil.rmtree(self.path(name))
+
+    def clone(self, snapshot: Snapshot, dest_folder: str, properties: dict[str, str]|None = None) -> CloneReport:
+        """
+        It makes a server folder from a snapshot, see the module docstring.
+
+        :param snapshot: The snapshot, see get
+        :param dest_folder: The folder of the clone, must not exist
+        :param properties: The keys of server.properties to set in the clone
+        """
+        start = time.perf_counter()
+        if os.path.exists(dest_folder):
+            raise SnapshotError(f"{dest_folder} already exists")
+        source = os.path.join(self.path(snapshot.name), FILES_DIR)
+        report = CloneReport(dest_folder)
+        os.makedirs(dest_folder)
+        try:
+            for directory in snapshot.directories:
+                os.mkdir(os.path.join(dest_folder, directory))
+            for file in snapshot.files:
+                dest = os.path.join(dest_folder, file.path)
+                if file.path == "server.properties":
+                    server_properties = ServerProperties.load(os.path.join(source, file.path))
+                    server_properties.patch(properties or {})
+                    write_file(dest, server_properties.dumps())
+                    method = "rendered"
+                else:
+                    method = link_file(os.path.join(source, file.path), dest, ("reflink", "hardlink", "copy") if file.read_only else ("reflink", "copy"))
+                report.methods[method] = report.methods.get(method, 0) + 1
+                report.files += 1
+                report.bytes += file.size
+                if method in ("copy", "rendered"):
+                    report.new_bytes += file.size
+        except OSError:
+            shutil.rmtree(dest_folder, ignore_errors=True) # no half-made server
+            raise
+        report.seconds = time.perf_counter() - start
+        return report
+
+    def clone_many(self, name: str, clones: list[tuple[str, dict[str, str]]], max_workers: int = 8) -> list[CloneReport|SnapshotError|OSError]:
+        """
+        It makes many clones of a snapshot at once.
+
+        :param name: The name of the snapshot
+        :param clones: The folder and the properties of every clone
+        :param max_workers: How many clones are made at once
+        :return: The report of every clone, or the error that stopped it, in order.
+        """
+        snapshot = self.get(name)
+        def clone(item: tuple[str, dict[str, str]]):
+            try:
+                return self.clone(snapshot, *item)
+            except (SnapshotError, OSError) as e:
+                return e
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(clone, clones))
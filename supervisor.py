@@ -0,0 +1,316 @@
+"""
+Supervisor of a server process, launched by the start files instead of their restart loop (or by
+python -m msm supervise).
+
+It starts the server, forwards the console both ways and copies the output to a rotated log. When
+the server crashes it is restarted after a delay doubling at every crash in a row (reset once the
+server ran for stable_after seconds), and the supervisor gives up when the server crashed
+crash_loop_crashes times in crash_loop_window seconds. On SIGTERM or SIGINT the server gets a
+"stop" command, then is terminated if it doesn't exit in stop_timeout seconds.
+
+On Linux the RSS and CPU usage of the server are read from /proc/<pid>/stat every sample_interval
+seconds (one read of an open file), and written with the starts and exits to a JSON lines file.
+"""
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+EXIT_OK = 0
+EXIT_CRASH_LOOP = 3
+
+
+@dataclass
+class SupervisorConfig:
+    command: list[str]
+    cwd: str = "."
+    min_backoff: float = 1.0 # seconds before the first restart
+    max_backoff: float = 300.0
+    stable_after: float = 60.0 # seconds of uptime after which a crash is not "in a row" anymore
+    crash_loop_crashes: int = 5
+    crash_loop_window: float = 300.0
+    restart_on_exit_zero: bool = False # a server stopped with /stop exits with 0
+    stop_command: str = "stop"
+    stop_timeout: float = 60.0
+    log_file: str = os.path.join("logs", "console.log") # relative to cwd, None to not copy the output
+    max_log_bytes: int = 10 * 1024 ** 2
+    log_backups: int = 5
+    stats_file: str|None = os.path.join("logs", "supervisor.jsonl") # relative to cwd
+    sample_interval: float = 10.0
+
+
+@dataclass
+class Sample:
+    time: float
+    pid: int
+    rss_bytes: int
+    cpu_percent: float # of one core, over the last interval
+
+
+class ProcSampler:
+    """
+    It reads the RSS and the CPU time of a process from /proc/<pid>/stat, keeping the file open.
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self._fd = os.open(f"/proc/{pid}/stat", os.O_RDONLY)
+        self._last: tuple[float, int]|None = None
+
+    @staticmethod
+    def available() -> bool:
+        return os.path.isfile("/proc/self/stat")
+
+    def sample(self) -> Sample:
+        data = os.pread(self._fd, 1024, 0).decode()
+        fields = data[data.rindex(")") + 2:].split() # the name of the process can contain spaces
+        if fields[0] in ("Z", "X"):
+            raise ProcessLookupError(f"The process {self.pid} exited")
+        ticks, rss_pages = int(fields[11]) + int(fields[12]), int(fields[21]) # utime + stime, rss
+        now = time.monotonic()
+        cpu = 0.0
+        if self._last is not None and now > self._last[0]:
+            cpu = (ticks - self._last[1]) / CLOCK_TICKS / (now - self._last[0]) * 100
+        self._last = (now, ticks)
+        return Sample(time.time(), self.pid, rss_pages * PAGE_SIZE, cpu)
+
+    def close(self):
+        os.close(self._fd)
+
+
+class RotatingLog:
+    """
+    A log file renamed to .1, .2... once it is larger than max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backups: int):
+        self.path, self.max_bytes, self.backups = path, max_bytes, backups
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "ab")
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes):
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "wb")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+@dataclass
+class Run:
+    pid: int
+    started: float
+    ended: float = 0.0
+    exit_code: int|None = None
+    peak_rss_bytes: int = 0
+    samples: list[Sample] = field(default_factory=list)
+
+    @property
+    def uptime(self) -> float:
+        return (self.ended or time.monotonic()) - self.started
+
+
+class Supervisor:
+    """
+    See the module docstring. run() returns the exit code of the supervisor.
+    """
+
+    def __init__(self, config: SupervisorConfig, console=None):
+        """
+        :param config: The command and the settings
+        :param console: The binary stream the output of the server is copied to, defaults to stdout
+        """
+        self.config = config
+        self.console = console if console is not None else sys.stdout.buffer
+        self.runs: list[Run] = []
+        self.process: subprocess.Popen|None = None
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._log: RotatingLog|None = None
+
+    def path(self, relative: str) -> str:
+        return os.path.join(self.config.cwd, relative)
+
+    def message(self, text: str):
+        self._output(f"[supervisor] {text}\n".encode())
+
+    def _output(self, data: bytes):
+        try:
+            self.console.write(data)
+            self.console.flush()
+        except (OSError, ValueError):
+            pass
+        if self._log is not None:
+            self._log.write(data)
+
+    def record(self, event: str, **fields):
+        if not self.config.stats_file:
+            return
+        with self._stats_lock, open(self.path(self.config.stats_file), "a", encoding="utf-8") as f:
+            f.write(json.dumps({"event": event, "time": time.time(), **fields}) + "\n")
+
+    def backoff(self, crashes_in_a_row: int) -> float:
+        return min(self.config.max_backoff, self.config.min_backoff * 2 ** (crashes_in_a_row - 1))
+
+    def crash_loop(self, crashes: list[float]) -> bool:
+        recent = [crash for crash in crashes if crash >= time.monotonic() - self.config.crash_loop_window]
+        return len(recent) >= self.config.crash_loop_crashes
+
+    def stop(self):
+        """
+        It stops the server gracefully and ends the supervision, from any thread.
+        """
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        process = self.process
+        if process is None or process.poll() is not None:
+            return
+        self.message(f"Stopping the server (\"{self.config.stop_command}\")...")
+        try:
+            process.stdin.write(f"{self.config.stop_command}\n".encode())
+            process.stdin.flush()
+        except (OSError, ValueError):
+            pass
+        def escalate():
+            try:
+                process.wait(self.config.stop_timeout)
+            except subprocess.TimeoutExpired:
+                self.message(f"The server didn't stop in {self.config.stop_timeout:.0f}s, terminating it.")
+                process.terminate()
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        threading.Thread(target=escalate, daemon=True).start()
+
+    def install_signal_handlers(self):
+        """
+        It makes SIGTERM and SIGINT (Ctrl+C) stop the server gracefully. Main thread only.
+        """
+        for name in ("SIGTERM", "SIGINT", "SIGBREAK"):
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), lambda signum, frame: self.stop())
+
+    def _pump_output(self, process: subprocess.Popen):
+        for line in iter(process.stdout.readline, b""):
+            self._output(line)
+
+    def _forward_input(self):
+        """
+        It forwards the lines typed in the console to the current server.
+        """
+        try:
+            fd = sys.stdin.fileno()
+        except (AttributeError, OSError, ValueError): # no console
+            return
+        while data := os.read(fd, 4096): # unbuffered, so no lock is held by this thread at exit
+            process = self.process
+            if process is None or process.poll() is not None:
+                continue
+            try:
+                process.stdin.write(data)
+                process.stdin.flush()
+            except (OSError, ValueError):
+                pass
+
+    def _sample(self, process: subprocess.Popen, run: Run):
+        try:
+            sampler = ProcSampler(process.pid)
+        except OSError:
+            return
+        try:
+            while process.poll() is None and not self._stopping.wait(self.config.sample_interval):
+                try:
+                    sample = sampler.sample()
+                except (OSError, ValueError, IndexError): # the process just ended
+                    break
+                run.peak_rss_bytes = max(run.peak_rss_bytes, sample.rss_bytes)
+                run.samples = run.samples[-59:] + [sample]
+                self.record("sample", pid=sample.pid, rss_mb=round(sample.rss_bytes / 1024 ** 2, 1), cpu_percent=round(sample.cpu_percent, 1))
+        finally:
+            sampler.close()
+
+    def _start(self) -> tuple[subprocess.Popen, Run]:
+        kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if sys.platform == "win32" else {"start_new_session": True} # the console signals go to the supervisor only
+        process = subprocess.Popen(self.config.command, cwd=self.config.cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs)
+        run = Run(process.pid, time.monotonic())
+        self.process = process
+        self.runs.append(run)
+        self.record("start", pid=process.pid, command=self.config.command)
+        return process, run
+
+    def run(self, forward_input: bool = True) -> int:
+        """
+        It supervises the server until it is stopped, exits with 0 (see restart_on_exit_zero) or
+        crash-loops.
+
+        :param forward_input: If the lines of stdin are sent to the server
+        :return: EXIT_OK, EXIT_CRASH_LOOP, or the exit code of the server if it couldn't start.
+        """
+        config = self.config
+        if config.log_file:
+            self._log = RotatingLog(self.path(config.log_file), config.max_log_bytes, config.log_backups)
+        if config.stats_file:
+            os.makedirs(os.path.dirname(self.path(config.stats_file)) or ".", exist_ok=True)
+        if forward_input:
+            threading.Thread(target=self._forward_input, daemon=True).start()
+        crashes: list[float] = []
+        in_a_row = 0
+        try:
+            while not self._stopping.is_set():
+                try:
+                    process, run = self._start()
+                except OSError as e:
+                    self.message(f"Couldn't start the server: {e}")
+                    return 127
+                pump = threading.Thread(target=self._pump_output, args=(process,), daemon=True)
+                pump.start()
+                if ProcSampler.available() and config.sample_interval > 0:
+                    threading.Thread(target=self._sample, args=(process, run), daemon=True).start()
+                run.exit_code = process.wait()
+                run.ended = time.monotonic()
+                pump.join(5)
+                self.record("exit", pid=run.pid, exit_code=run.exit_code, uptime=round(run.uptime, 1), peak_rss_mb=round(run.peak_rss_bytes / 1024 ** 2, 1))
+                if self._stopping.is_set():
+                    self.message(f"Server stopped (exit code {run.exit_code}).")
+                    break
+                if run.exit_code == 0 and not config.restart_on_exit_zero:
+                    self.message("Server stopped.")
+                    break
+                crashes.append(run.ended)
+                in_a_row = 1 if run.uptime >= config.stable_after else in_a_row + 1
+                if self.crash_loop(crashes):
+                    self.message(f"The server crashed {config.crash_loop_crashes} times in {config.crash_loop_window:.0f}s, giving up.")
+                    self.record("crash_loop", crashes=len(crashes))
+                    return EXIT_CRASH_LOOP
+                delay = self.backoff(in_a_row)
+                self.message(f"Server exited with code {run.exit_code} after {run.uptime:.0f}s, restarting in {delay:g}s (Ctrl+C to cancel)...")
+                self.record("restart", delay=delay, crashes_in_a_row=in_a_row)
+                self._stopping.wait(delay)
+            return EXIT_OK
+        finally:
+            self.process = None
+            if self._log is not None:
+                self._log.close()
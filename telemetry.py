@@ -0,0 +1,341 @@
+"""
+Live telemetry of running servers: TPS and MSPT polled over RCON, and the "Can't keep up!"
+warnings of logs/latest.log.
+
+The RCON connection of a server is kept open between polls and opened again when it breaks, the
+log is read incrementally from where the last read stopped. The samples are written as JSON lines
+and/or served as Prometheus metrics (see MetricsServer):
+
+python -m msm telemetry --server servers/lobby --server servers/survival --interval 10 --jsonl - --prometheus 9225
+
+RCON must be enabled in server.properties (enable-rcon=true and a rcon.password, see
+setup_server.rcon_properties). TPS and MSPT need Paper, the tps and mspt commands.
+"""
+import json
+import os
+import re
+import socket
+import struct
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from server_properties import ServerProperties
+
+RCON_LOGIN, RCON_COMMAND, RCON_RESPONSE = 3, 2, 0
+MAX_PACKET = 4096 + 14 # a response body is at most 4096 bytes
+
+COLOR_CODE = re.compile("§.")
+NUMBER = re.compile(r"\*?(\d+(?:\.\d+)?)")
+LAG_WARNING = re.compile(r"Can't keep up! Is the server overloaded\? Running (\d+)ms or (\d+) ticks behind")
+
+
+class RconError(Exception):
+    """
+    Raised when the RCON server can't be reached or refuses the password.
+    """
+
+
+class RconClient:
+    """
+    A client of the Source RCON protocol used by Minecraft. The connection is opened on the first
+    command, kept open, and opened again once if a command finds it broken.
+    """
+
+    def __init__(self, host: str, port: int, password: str, timeout: float = 5.0):
+        self.host, self.port, self.password, self.timeout = host, port, password, timeout
+        self._socket: socket.socket|None = None
+        self._lock = threading.Lock()
+        self._request_id = 0
+        self.connects = 0 # how many connections were opened, for the tests and benchmarks
+
+    def _send(self, packet_type: int, body: str) -> int:
+        self._request_id = self._request_id % 0x7fffffff + 1
+        payload = struct.pack("<ii", self._request_id, packet_type) + body.encode("utf-8") + b"\0\0"
+        self._socket.sendall(struct.pack("<i", len(payload)) + payload)
+        return self._request_id
+
+    def _recv_exactly(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = self._socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("The RCON connection was closed")
+            data += chunk
+        return data
+
+    def _receive(self) -> tuple[int, int, str]:
+        length, = struct.unpack("<i", self._recv_exactly(4))
+        if not 10 <= length <= MAX_PACKET:
+            raise ConnectionError(f"Invalid RCON packet length {length}")
+        request_id, packet_type = struct.unpack("<ii", self._recv_exactly(8))
+        body = self._recv_exactly(length - 8)
+        return request_id, packet_type, body[:-2].decode("utf-8", "replace")
+
+    def connect(self):
+        self.close()
+        try:
+            self._socket = socket.create_connection((self.host, self.port), self.timeout)
+            self.connects += 1
+            request_id = self._send(RCON_LOGIN, self.password)
+            response_id, _, _ = self._receive()
+        except OSError as e:
+            self.close()
+            raise RconError(f"Can't connect to RCON on {self.host}:{self.port}: {e}") from e
+        if response_id == -1 or response_id != request_id:
+            self.close()
+            raise RconError(f"RCON on {self.host}:{self.port} refused the password")
+
+    def close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+            self._socket = None
+
+    def command(self, command: str) -> str:
+        """
+        It runs a console command and returns its output.
+        """
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._socket is None:
+                        self.connect()
+                    request_id = self._send(RCON_COMMAND, command)
+                    while True:
+                        response_id, _, body = self._receive()
+                        if response_id == request_id:
+                            return body
+                except (OSError, ConnectionError) as e:
+                    self.close()
+                    if attempt:
+                        raise RconError(f"RCON command {command!r} failed: {e}") from e
+            raise RconError(f"RCON command {command!r} failed")
+
+
+def strip_colors(text: str) -> str:
+    return COLOR_CODE.sub("", text)
+
+
+def parse_tps(output: str) -> list[float]:
+    """
+    It returns the TPS over the last 1, 5 and 15 minutes of the output of Paper's tps command
+    ("TPS from last 1m, 5m, 15m: 20.0, 20.0, *20.0").
+    """
+    text = strip_colors(output)
+    return [float(value) for value in NUMBER.findall(text.split(":", 1)[-1])][:3]
+
+
+def parse_mspt(output: str) -> list[tuple[float, float, float]]:
+    """
+    It returns the (avg, min, max) tick times in ms over the last 5s, 10s and 1m of the output of
+    Paper's mspt command.
+    """
+    text = strip_colors(output).split(":", 1)[-1]
+    return [tuple(float(value) for value in triple) for triple in re.findall(r"(\d+(?:\.\d+)?)/(\d+(?:\.\d+)?)/(\d+(?:\.\d+)?)", text)][:3]
+
+
+@dataclass
+class LagWarning:
+    ms: int
+    ticks: int
+
+
+class LogTailer:
+    """
+    It reads the lines added to a log file since the last read, following the file when it is
+    rotated or truncated (the server renames latest.log at startup).
+    """
+
+    def __init__(self, path: str, from_start: bool = False):
+        """
+        :param path: The log file, it may not exist yet
+        :param from_start: If the lines already in the file are read, else only the new ones
+        """
+        self.path = path
+        self._inode = None
+        self._offset = 0
+        self._partial = b""
+        if not from_start:
+            try:
+                st = os.stat(path)
+                self._inode, self._offset = st.st_ino, st.st_size
+            except OSError:
+                pass
+
+    def read_lines(self) -> list[str]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return []
+        if st.st_ino != self._inode or st.st_size < self._offset: # a new file
+            self._inode, self._offset, self._partial = st.st_ino, 0, b""
+        if st.st_size == self._offset:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(st.st_size - self._offset)
+        self._offset += len(data)
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop() # an incomplete line is finished by the next read
+        return [line.decode("utf-8", "replace").rstrip("\r") for line in lines]
+
+    def lag_warnings(self) -> list[LagWarning]:
+        return [LagWarning(int(match[1]), int(match[2])) for line in self.read_lines() if (match := LAG_WARNING.search(line))]
+
+
+@dataclass
+class TelemetrySample:
+    server: str
+    time: float = field(default_factory=time.time)
+    rcon_up: bool = False
+    tps_1m: float|None = None
+    tps_5m: float|None = None
+    tps_15m: float|None = None
+    mspt_avg: float|None = None # over the last 5s
+    mspt_min: float|None = None
+    mspt_max: float|None = None
+    lag_warnings: int = 0 # since the previous sample
+    lag_ticks: int = 0
+    error: str|None = None
+
+
+class ServerTelemetry:
+    """
+    The telemetry of one server folder: RCON settings read from its server.properties.
+    """
+
+    def __init__(self, server_folder: str, name: str|None = None, host: str|None = None):
+        self.folder = server_folder
+        self.name = name or os.path.basename(os.path.abspath(server_folder))
+        properties = ServerProperties.load(os.path.join(server_folder, "server.properties"))
+        self.client = None
+        if properties.get("enable-rcon") == "true" and properties.get("rcon.password"):
+            self.client = RconClient(host or properties.get("server-ip") or "127.0.0.1", int(properties.get("rcon.port") or 25575), properties["rcon.password"])
+        self.tailer = LogTailer(os.path.join(server_folder, "logs", "latest.log"))
+        self.lag_warnings_total = 0
+        self.lag_ticks_total = 0
+
+    def sample(self) -> TelemetrySample:
+        sample = TelemetrySample(self.name)
+        warnings = self.tailer.lag_warnings()
+        sample.lag_warnings, sample.lag_ticks = len(warnings), sum(warning.ticks for warning in warnings)
+        self.lag_warnings_total += sample.lag_warnings
+        self.lag_ticks_total += sample.lag_ticks
+        if self.client is None:
+            sample.error = "RCON is disabled in server.properties"
+            return sample
+        try:
+            tps = parse_tps(self.client.command("tps"))
+            sample.rcon_up = True
+            if len(tps) == 3:
+                sample.tps_1m, sample.tps_5m, sample.tps_15m = tps
+            mspt = parse_mspt(self.client.command("mspt"))
+            if mspt:
+                sample.mspt_avg, sample.mspt_min, sample.mspt_max = mspt[0]
+        except RconError as e:
+            sample.error = str(e)
+        return sample
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """
+    An HTTP server answering /metrics with the latest sample of every server, in the Prometheus
+    text format.
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9225):
+        super().__init__((host, port), MetricsHandler)
+        self.samples: dict[str, TelemetrySample] = {}
+        self.totals: dict[str, tuple[int, int]] = {} # lag warnings and ticks since the start
+        self._lock = threading.Lock()
+
+    def update(self, telemetry: ServerTelemetry, sample: TelemetrySample):
+        with self._lock:
+            self.samples[sample.server] = sample
+            self.totals[sample.server] = (telemetry.lag_warnings_total, telemetry.lag_ticks_total)
+
+    def render(self) -> str:
+        gauges = [
+            ("minecraft_rcon_up", "gauge", "1 if the last RCON poll worked.", lambda s: [({}, int(s.rcon_up))]),
+            ("minecraft_tps", "gauge", "Ticks per second, averaged over the window.", lambda s: [({"window": window}, value) for window, value in (("1m", s.tps_1m), ("5m", s.tps_5m), ("15m", s.tps_15m))]),
+            ("minecraft_mspt_milliseconds", "gauge", "Milliseconds per tick over the last 5 seconds.", lambda s: [({"stat": stat}, value) for stat, value in (("avg", s.mspt_avg), ("min", s.mspt_min), ("max", s.mspt_max))]),
+            ("minecraft_lag_warnings_total", "counter", "\"Can't keep up!\" warnings in the log.", lambda s: [({}, self.totals[s.server][0])]),
+            ("minecraft_lag_ticks_total", "counter", "Ticks skipped according to the \"Can't keep up!\" warnings.", lambda s: [({}, self.totals[s.server][1])]),
+            ("minecraft_telemetry_timestamp_seconds", "gauge", "When the last sample was taken.", lambda s: [({}, round(s.time, 3))]),
+        ]
+        lines = []
+        with self._lock:
+            for name, kind, description, values in gauges:
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+                for sample in self.samples.values():
+                    for labels, value in values(sample):
+                        if value is not None:
+                            label_text = ",".join(f'{key}="{label}"' for key, label in {"server": sample.server, **labels}.items())
+                            lines.append(f"{name}{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def start(self) -> "MetricsServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    server: MetricsServer
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def poll(servers: list[ServerTelemetry], interval: float, sinks: list, stop: threading.Event|None = None, count: int|None = None):
+    """
+    It samples every server every interval seconds and hands the samples to the sinks.
+
+    :param servers: The servers
+    :param interval: Seconds between two rounds of samples
+    :param sinks: Callables receiving (telemetry, sample)
+    :param stop: An event ending the polling, defaults to None (forever)
+    :param count: The number of rounds, defaults to None (until stop)
+    """
+    stop = stop or threading.Event()
+    rounds = 0
+    while not stop.is_set() and (count is None or rounds < count):
+        start = time.monotonic()
+        for server in servers:
+            sample = server.sample()
+            for sink in sinks:
+                sink(server, sample)
+        rounds += 1
+        if count is None or rounds < count:
+            stop.wait(max(0.0, interval - (time.monotonic() - start)))
+
+
+def json_lines_sink(file):
+    """
+    It returns a sink for poll writing every sample as a line of JSON.
+    """
+    lock = threading.Lock()
+    def write(telemetry: ServerTelemetry, sample: TelemetrySample):
+        with lock:
+            file.write(json.dumps(asdict(sample)) + "\n")
+            file.flush()
+    return write
@@ -0,0 +1,15 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT) # the modules are at the root of the repository
+sys.path.insert(1, os.path.join(ROOT, "benchmarks")) # the stand-ins of the APIs
+
+# before any import of the modules, which create their caches at import: the tests never touch
+# the caches and configuration of the user
+TMP = tempfile.mkdtemp(prefix="msm-tests-")
+atexit.register(shutil.rmtree, TMP, ignore_errors=True)
+os.environ.update(MSM_CACHE_DIR=os.path.join(TMP, "cache"), MSM_CONFIG_DIR=os.path.join(TMP, "config"))
@@ -0,0 +1,118 @@
+import os
+import time
+import zlib
+from argparse import Namespace
+
+import pytest
+
+import msm
+import telemetry
+from backup import OBJECTS_DIR, PRUNE_GRACE, SECTOR, BackupStore
+
+
+def region(chunks: dict[int, bytes]) -> bytes:
+    """
+    It returns a region file with the chunks (index: payload) one after the other.
+    """
+    header, body, sector = bytearray(2 * SECTOR), bytearray(), 2
+    for index, payload in sorted(chunks.items()):
+        data = len(payload).to_bytes(4, "big") + payload # the length counts the compression type, the first byte of payload
+        sectors = -(-len(data) // SECTOR)
+        header[index * 4:index * 4 + 4] = (sector << 8 | sectors).to_bytes(4, "big")
+        body += data.ljust(sectors * SECTOR, b"\0")
+        sector += sectors
+    return bytes(header + body)
+
+
+def chunk(text: str) -> bytes:
+    return b"\x02" + zlib.compress(text.encode() * 500)
+
+
+def write(folder, path, data):
+    path = os.path.join(folder, *path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+@pytest.fixture
+def server(tmp_path):
+    folder = str(tmp_path / "lobby")
+    write(folder, "server.properties", b"motd=A Minecraft Server\n")
+    write(folder, "world/level.dat", b"level")
+    write(folder, "world/session.lock", b"lock")
+    write(folder, "world/region/r.0.0.mca", region({0: chunk("a"), 1: chunk("b"), 40: chunk("c")}))
+    write(folder, "logs/latest.log", b"log")
+    return folder
+
+
+def test_round_trip(tmp_path, server):
+    store = BackupStore(str(tmp_path / "backups"))
+    manifest, stats = store.backup(server, max_workers=1)
+    assert stats.chunks == 3
+    assert "world/session.lock" not in manifest.files and "logs/latest.log" not in manifest.files
+
+    restored = str(tmp_path / "restored")
+    assert store.restore(manifest, restored) == len(manifest.files)
+    for relative in manifest.files:
+        with open(os.path.join(server, relative), "rb") as a, open(os.path.join(restored, relative), "rb") as b:
+            assert a.read() == b.read(), relative
+
+
+def test_only_changed_chunks_are_stored(tmp_path, server):
+    store = BackupStore(str(tmp_path / "backups"))
+    store.backup(server, max_workers=1)
+    write(server, "world/region/r.0.0.mca", region({0: chunk("a"), 1: chunk("B"), 40: chunk("c")}))
+    _, stats = store.backup(server, max_workers=1)
+    assert stats.skipped == 2 # server.properties and level.dat are not read again
+    assert stats.new_objects == 2 # the new chunk and the recipe of the region file, its header is the same
+
+
+def test_prune_without_backups(tmp_path):
+    assert BackupStore(str(tmp_path / "backups")).prune("lobby", 1) == (0, 0)
+
+
+def test_prune_keeps_recent_and_in_flight_objects(tmp_path, server):
+    store = BackupStore(str(tmp_path / "backups"))
+    store.backup(server, max_workers=1)
+    objects = os.path.join(store.directory, OBJECTS_DIR, "ff")
+    os.makedirs(objects, exist_ok=True)
+    old, recent, in_flight = (os.path.join(objects, name) for name in ("ff" + "0" * 62, "ff" + "1" * 62, "ff" + "2" * 62 + ".1.tmp"))
+    for path in (old, recent, in_flight):
+        write(objects, os.path.basename(path), b"unused")
+    os.utime(old, (time.time() - 2 * PRUNE_GRACE,) * 2)
+    os.utime(in_flight, (time.time() - 2 * PRUNE_GRACE,) * 2)
+    assert store.prune("lobby", 1) == (0, 1)
+    assert not os.path.exists(old) and os.path.exists(recent) and os.path.exists(in_flight)
+
+
+class FakeRcon:
+    def __init__(self, failing: str|None = None):
+        self.failing, self.commands, self.closed = failing, [], False
+
+    def command(self, command: str) -> str:
+        self.commands.append(command)
+        if command == self.failing:
+            raise telemetry.RconError(f"{command} failed")
+        return ""
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.mark.parametrize("failing, commands", [
+    (None, ["save-off", "save-all flush", "save-on"]),
+    ("save-all flush", ["save-off", "save-all flush", "save-on"]), # saving must not stay off
+    ("save-off", ["save-off"]),
+])
+def test_backup_create_turns_saving_back_on(tmp_path, server, monkeypatch, failing, commands):
+    client = FakeRcon(failing)
+    monkeypatch.setattr(msm, "ServerTelemetry", lambda folder: Namespace(client=client))
+    args = Namespace(server=server, store=str(tmp_path / "backups"), name=None, workers=1, no_save_off=False)
+    assert msm.backup_create(args) == 0
+    assert client.commands == commands and client.closed
+
+
+def test_keep_must_be_positive():
+    with pytest.raises(SystemExit):
+        msm.main(["backup", "prune", "--server", "lobby", "--keep", "0"])
@@ -0,0 +1,75 @@
+import hashlib
+import os
+
+import pytest
+
+from get_papermc import PaperApiClient
+from plugin_standin import PluginStandIn
+from plugins import PluginError, PluginInstaller, PluginResolver
+
+
+@pytest.fixture
+def standin():
+    server = PluginStandIn(jar_size=64 * 1024).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def resolve(standin, plugins, minecraft_version="1.20.4"):
+    resolver = PluginResolver(minecraft_version, standin.modrinth_url, standin.hangar_url)
+    try:
+        return resolver.resolve(plugins)
+    finally:
+        resolver.client.close()
+
+
+def test_modrinth_dependencies(standin):
+    resolved = {plugin.version.name: plugin for plugin in resolve(standin, ["worldguard"])}
+    assert [(name, plugin.version.version) for name, plugin in resolved.items()] == [("worldguard", "7.0.10"), ("worldedit", "7.3.0")] # the release, not the newer beta
+    assert resolved["worldguard"].required_by == [] and resolved["worldedit"].required_by == ["worldguard"]
+
+
+def test_version_constraint(standin):
+    [plugin] = resolve(standin, ["worldedit@<7.3"])
+    assert plugin.version.version == "7.2.15"
+
+
+def test_hangar_dependency_by_project_id(standin):
+    # the dependency is known by its display name "Via Version" and its id, not by its slug
+    resolved = resolve(standin, ["hangar:ViaBackwards"])
+    assert [(plugin.version.project, plugin.required_by) for plugin in resolved] == [("viabackwards", []), ("viaversion", ["ViaBackwards"])]
+    resolved = resolve(standin, ["hangar:ViaBackwards", "hangar:ViaVersion@<5"])
+    assert len(resolved) == 2 # asked and required, ViaVersion is resolved once
+
+
+def test_no_compatible_version(standin):
+    with pytest.raises(PluginError, match="oldplugin"):
+        resolve(standin, ["oldplugin"])
+    with pytest.raises(PluginError, match="nosuchplugin"):
+        resolve(standin, ["nosuchplugin"])
+
+
+def test_install_downloads_once(standin, tmp_path):
+    resolved = resolve(standin, ["worldguard"])
+    standin.reset()
+    installer = PluginInstaller(str(tmp_path / "store"))
+    first = installer.install(resolved, str(tmp_path / "a" / "plugins"))
+    second = installer.install(resolved, str(tmp_path / "b" / "plugins"))
+    installer.session.close()
+    assert (first.downloaded, first.cached) == (2, 0) and (second.downloaded, second.cached) == (0, 2)
+    assert standin.reset()["requests"] == {"download": 2}
+    for folder in ("a", "b"):
+        path = os.path.join(tmp_path, folder, "plugins", "worldedit-7.3.0.jar")
+        with open(path, "rb") as f:
+            assert hashlib.sha512(f.read()).hexdigest() == hashlib.sha512(standin.jar("worldedit-7.3.0.jar")).hexdigest()
+
+
+def test_given_client_is_used_as_is(standin):
+    client = PaperApiClient()
+    user_agent = client.session.headers["User-Agent"]
+    try:
+        PluginResolver("1.20.4", standin.modrinth_url, standin.hangar_url, client=client).resolve(["luckperms"])
+    finally:
+        client.close()
+    assert client.session.headers["User-Agent"] == user_agent
@@ -0,0 +1,57 @@
+import glob
+import hashlib
+import os
+import shutil
+
+import pytest
+
+import get_papermc
+from paper_standin import PaperStandIn
+from paths import cache_dir
+from provision import bench_api, bench_provision
+
+
+@pytest.fixture(scope="module")
+def standin():
+    server = PaperStandIn(jar_size=20 * 1024 ** 2).start() # large enough for 2 segments
+    previous = get_papermc.client.base_url
+    get_papermc.set_api_url(server.url)
+    yield server
+    get_papermc.set_api_url(previous)
+    server.shutdown()
+
+
+@pytest.fixture
+def empty_stores(standin):
+    get_papermc.invalidate_cache()
+    shutil.rmtree(cache_dir("jars"))
+    standin.reset()
+
+
+def jar_hashes(folder: str) -> list[str]:
+    hashes = []
+    for path in sorted(glob.glob(os.path.join(folder, "*", "paper-*.jar"))):
+        with open(path, "rb") as f:
+            hashes.append(hashlib.sha256(f.read()).hexdigest())
+    return hashes
+
+
+def test_api_answers_are_cached(standin, empty_stores):
+    result = bench_api(standin)
+    assert result["cold"]["total_requests"] > 0
+    assert result["warm"]["total_requests"] == 0
+
+
+def test_servers_on_one_build_download_the_jar_once(standin, empty_stores, tmp_path):
+    result = bench_provision(standin, 3, str(tmp_path))
+    assert result["failed"] == []
+    assert result["requests"]["download"] == 1
+    assert jar_hashes(str(tmp_path)) == [standin.sha256] * 3
+    assert set(result["stages"]) >= {"folder", "render", "download", "config", "start_file"}
+
+
+def test_segmented_download(standin, empty_stores, tmp_path):
+    result = bench_provision(standin, 1, str(tmp_path), segments=4)
+    assert result["failed"] == []
+    assert result["requests"].get("download_range", 0) >= 2 and "download" not in result["requests"]
+    assert jar_hashes(str(tmp_path)) == [standin.sha256]
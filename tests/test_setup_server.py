@@ -0,0 +1,10 @@
+import os
+
+from setup_server import ServerSpec, SetupContext, provision
+
+
+def test_provision_refuses_a_spec_without_the_eula(tmp_path):
+    spec = ServerSpec("lobby", str(tmp_path), "1.20.4", 400)
+    ctx = provision(SetupContext(spec, "http://127.0.0.1:9/paper-1.20.4-400.jar"))
+    assert ctx.errors and "EULA" in ctx.errors[0]
+    assert not os.path.exists(spec.dest_folder)
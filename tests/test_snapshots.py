@@ -0,0 +1,70 @@
+import os
+import stat
+import sys
+
+import pytest
+
+import fsutil
+from snapshots import SnapshotStore
+
+
+def make_server(folder):
+    os.makedirs(os.path.join(folder, "world", "region"))
+    os.makedirs(os.path.join(folder, "world_nether"))
+    files = {
+        "server.properties": "server-port=25565\nmotd=A Minecraft Server\n",
+        "paper-1.20.4-400.jar": "jar",
+        "start.sh": "#!/bin/sh\njava -jar paper-1.20.4-400.jar\n",
+        "session.lock": "lock",
+        "world/level.dat": "level",
+        "world/region/r.0.0.mca": "region",
+        "world/session.lock": "lock",
+        "world_nether/session.lock": "lock",
+    }
+    for path, content in files.items():
+        with open(os.path.join(folder, path), "w", encoding="utf-8") as f:
+            f.write(content)
+    os.chmod(os.path.join(folder, "start.sh"), 0o755)
+
+
+@pytest.fixture
+def clone(tmp_path):
+    def make_clone():
+        server = str(tmp_path / "server")
+        make_server(server)
+        store = SnapshotStore(str(tmp_path / "snapshots"))
+        snapshot = store.create("lobby", server)
+        dest = str(tmp_path / "clone")
+        store.clone(snapshot, dest, {"server-port": "25566"})
+        return snapshot, dest
+    return make_clone
+
+
+def test_clone_keeps_start_file_executable(clone):
+    _, dest = clone()
+    assert os.stat(os.path.join(dest, "start.sh")).st_mode & stat.S_IXUSR
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reflinks are only made on Linux")
+def test_reflinked_clone_keeps_start_file_executable(clone, monkeypatch):
+    import fcntl
+    # a filesystem with FICLONE: the clone gets the data but is created with the default mode
+    monkeypatch.setattr(fcntl, "ioctl", lambda fd, request, src_fd: os.write(fd, os.pread(src_fd, 1024 ** 2, 0)))
+    _, dest = clone()
+    assert os.stat(os.path.join(dest, "start.sh")).st_mode & stat.S_IXUSR
+    with open(os.path.join(dest, "start.sh"), encoding="utf-8") as f:
+        assert f.read().startswith("#!/bin/sh")
+
+
+def test_session_locks_are_excluded_at_any_depth(clone):
+    snapshot, dest = clone()
+    paths = {file.path for file in snapshot.files}
+    assert "world/level.dat" in paths and "world/region/r.0.0.mca" in paths
+    assert not [path for path in paths if path.rsplit("/", 1)[-1] == "session.lock"]
+    assert not os.path.exists(os.path.join(dest, "world", "session.lock"))
+
+
+def test_clone_applies_properties(clone):
+    _, dest = clone()
+    with open(os.path.join(dest, "server.properties"), encoding="utf-8") as f:
+        assert "server-port=25566" in f.read()
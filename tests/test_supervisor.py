@@ -0,0 +1,68 @@
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+import stub_server
+from supervisor import EXIT_CRASH_LOOP, EXIT_OK, Supervisor, SupervisorConfig
+
+
+def supervisor(tmp_path, *stub_args: str, **config) -> Supervisor:
+    command = [sys.executable, stub_server.__file__, "--startup", "0", *stub_args]
+    return Supervisor(SupervisorConfig(command, str(tmp_path), sample_interval=0, **config), console=io.BytesIO())
+
+
+def events(tmp_path) -> list[dict]:
+    with open(os.path.join(tmp_path, "logs", "supervisor.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def run_in_thread(supervised: Supervisor) -> tuple[threading.Thread, list[int]]:
+    result = []
+    thread = threading.Thread(target=lambda: result.append(supervised.run(forward_input=False)))
+    thread.start()
+    return thread, result
+
+
+def wait_for_output(supervised: Supervisor, text: bytes, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while text not in supervised.console.getvalue():
+        assert time.monotonic() < deadline, f"{text!r} not printed"
+        time.sleep(0.02)
+
+
+def test_backoff_doubles_up_to_the_maximum(tmp_path):
+    supervised = supervisor(tmp_path, min_backoff=1, max_backoff=10)
+    assert [supervised.backoff(crashes) for crashes in range(1, 7)] == [1, 2, 4, 8, 10, 10]
+
+
+def test_crash_loop_gives_up(tmp_path):
+    supervised = supervisor(tmp_path, "--crash-after", "0", min_backoff=0.01, crash_loop_crashes=3, crash_loop_window=60)
+    assert supervised.run(forward_input=False) == EXIT_CRASH_LOOP
+    assert [run.exit_code for run in supervised.runs] == [1, 1, 1]
+    restarts = [event for event in events(tmp_path) if event["event"] == "restart"]
+    assert [event["delay"] for event in restarts] == [0.01, 0.02]
+    assert [event["event"] for event in events(tmp_path)][-1] == "crash_loop"
+
+
+def test_stop_is_sent_to_the_server(tmp_path):
+    supervised = supervisor(tmp_path)
+    thread, result = run_in_thread(supervised)
+    wait_for_output(supervised, b"Done")
+    supervised.stop()
+    thread.join(10)
+    assert result == [EXIT_OK] and supervised.runs[-1].exit_code == 0
+    with open(os.path.join(tmp_path, "logs", "console.log"), "rb") as f:
+        assert b"Stopping the server" in f.read()
+
+
+def test_hung_server_is_terminated(tmp_path):
+    supervised = supervisor(tmp_path, "--ignore-stop", stop_timeout=0.2)
+    thread, result = run_in_thread(supervised)
+    wait_for_output(supervised, b"Done")
+    supervised.stop()
+    thread.join(15)
+    assert result == [EXIT_OK] and len(supervised.runs) == 1
+    assert b"terminating it" in supervised.console.getvalue()
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from rcon_standin import RconStandIn
+from server_properties import ServerProperties
+from setup_server import ServerSpec, rcon_properties, render_properties
+from telemetry import MetricsServer, ServerTelemetry, parse_mspt, parse_tps
+
+
+@pytest.fixture
+def rcon():
+    server = RconStandIn(tps=19.5, mspt=12.3).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_server(folder, port: int, password: str = "secret"):
+    os.makedirs(os.path.join(folder, "logs"))
+    with open(os.path.join(folder, "server.properties"), "w", encoding="utf-8") as f:
+        f.write(f"enable-rcon=true\nrcon.port={port}\nrcon.password={password}\n")
+    return str(folder)
+
+
+def test_parse_paper_answers(rcon):
+    assert parse_tps(rcon.answer("tps")) == [19.5, 19.5, 19.5]
+    assert parse_mspt(rcon.answer("mspt")) == [(12.3, 6.2, 36.9)] * 3 # 6.15 is written 6.2
+    rcon.tps = 21.3 # Paper prints *20.0 above 20
+    assert parse_tps(rcon.answer("tps")) == [20.0, 21.3, 21.3]
+
+
+def test_sample_over_rcon(rcon, tmp_path):
+    telemetry = ServerTelemetry(make_server(tmp_path, rcon.port))
+    sample = telemetry.sample()
+    telemetry.close()
+    assert sample.rcon_up and sample.error is None
+    assert (sample.tps_1m, sample.mspt_avg, sample.mspt_max) == (19.5, 12.3, 36.9)
+    assert rcon.commands == ["tps", "mspt"]
+
+
+def test_reconnects_after_dropped_connections(rcon, tmp_path):
+    rcon.drop_every = 1
+    telemetry = ServerTelemetry(make_server(tmp_path, rcon.port))
+    samples = [telemetry.sample() for _ in range(3)]
+    telemetry.close()
+    assert all(sample.rcon_up and sample.mspt_avg == 12.3 for sample in samples)
+    assert rcon.connections == 6
+
+
+def test_wrong_password(rcon, tmp_path):
+    telemetry = ServerTelemetry(make_server(tmp_path, rcon.port, "wrong"))
+    sample = telemetry.sample()
+    telemetry.close()
+    assert not sample.rcon_up and sample.error
+
+
+def test_lag_warnings_of_the_log(rcon, tmp_path):
+    telemetry = ServerTelemetry(make_server(tmp_path, rcon.port))
+    with open(os.path.join(tmp_path, "logs", "latest.log"), "w", encoding="utf-8") as f:
+        f.write("[12:00:00 WARN]: Can't keep up! Is the server overloaded? Running 5000ms or 100 ticks behind\n")
+        f.write("[12:00:05 INFO]: Done\n")
+        f.write("[12:00:09 WARN]: Can't keep up! Is the server overloaded? Running 2500ms or 50 ticks behind\n")
+    sample = telemetry.sample()
+    metrics = MetricsServer(port=0)
+    metrics.update(telemetry, sample)
+    telemetry.close()
+    metrics.server_close()
+    assert (sample.lag_warnings, sample.lag_ticks) == (2, 150)
+    assert 'minecraft_lag_warnings_total{server="' + os.path.basename(tmp_path) + '"} 2' in metrics.render()
+    assert 'minecraft_tps{server="' + os.path.basename(tmp_path) + '",window="1m"} 19.5' in metrics.render()
+
+
+def test_rcon_keys_override_the_template(tmp_path):
+    # the GUI passes every key of the template, RCON off and without a password
+    spec = ServerSpec("lobby", str(tmp_path), "1.20.4", properties={"enable-rcon": "false", "rcon.password": ""}, rcon=True)
+    properties = ServerProperties.parse(render_properties({**spec.properties, **rcon_properties(spec)}))
+    assert properties["enable-rcon"] == "true" and len(properties["rcon.password"]) >= 24
+    spec.properties["rcon.password"] = "chosen"
+    assert rcon_properties(spec)["rcon.password"] == "chosen"
@@ -0,0 +1,181 @@
+"""
+In-place update of an existing server: the server folder is reconciled with a ServerSpec instead
+of being erased and created again.
+
+Only the files managed by Minecraft Server Maker are touched: the Paper jar (replaced only if its
+hash differs), server.properties (only the keys of the spec are changed, the other keys and the
+comments are kept), eula.txt and the start files (written only if their content changed). The
+worlds, plugins/ and cache/ are never read nor modified.
+"""
+import difflib
+import os
+import re
+from dataclasses import dataclass
+
+from fsutil import file_sha256
+from get_papermc import get_build_sha256
+from jar_store import JarStore
+from pipeline import run_stages
+from progress import ProgressBus
+from server_properties import ServerProperties
+from setup_server import SetupContext, StageError, check_properties, download, find_java_runtime, rcon_properties, render_start_files, spec_from_values, write_file, write_start_file
+
+PAPER_JAR = re.compile(r"^paper-.+\.jar$")
+
+
+@dataclass
+class Change:
+    """
+    A change an update makes (or would make, in a dry run) to a file of the server.
+    """
+    path: str # relative to the server folder
+    action: str # "create", "modify" or "remove"
+    diff: str = "" # unified diff for text files, a description for the jar
+
+    def __str__(self) -> str:
+        return f"{self.action} {self.path}" + (f"\n{self.diff}" if self.diff else "")
+
+
+def read_text(path: str) -> str|None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def text_change(name: str, old: str|None, new: str) -> Change|None:
+    """
+    It returns the Change from the old content of a file (None if it doesn't exist) to the new
+    one, None if they are the same.
+    """
+    if old == new:
+        return None
+    diff = "".join(difflib.unified_diff((old or "").splitlines(True), new.splitlines(True), f"a/{name}", f"b/{name}"))
+    return Change(name, "create" if old is None else "modify", diff)
+
+
+def jar_matches(path: str, sha256: str|None, store: JarStore) -> bool:
+    """
+    It returns if the jar at path has the hash. A jar linked from the store is recognized without
+    reading it, the others are hashed.
+    """
+    if not os.path.isfile(path):
+        return False
+    if sha256 is None: # unknown hash, only the name (version and build) can be compared
+        return True
+    stored = store.path(sha256)
+    if os.path.isfile(stored):
+        if os.path.samefile(path, stored):
+            return True
+        if os.path.getsize(path) != os.path.getsize(stored):
+            return False
+    return file_sha256(path) == sha256.lower()
+
+
+def plan_jar(ctx: SetupContext, store: JarStore) -> tuple[list[Change], str|None]:
+    """
+    It returns the changes to the jars of the server and the SHA-256 of the wanted jar.
+    """
+    dest_folder = ctx.spec.dest_folder
+    try:
+        sha256 = get_build_sha256(ctx.spec.version, ctx.spec.build)
+    except Exception:
+        sha256 = None
+    changes = []
+    path = os.path.join(dest_folder, ctx.filename)
+    if not jar_matches(path, sha256, store):
+        changes.append(Change(ctx.filename, "modify" if os.path.exists(path) else "create", f"Paper {ctx.spec.version} build {ctx.spec.build}" + (f" (sha256 {sha256})" if sha256 else "")))
+    for name in sorted(os.listdir(dest_folder)):
+        if name != ctx.filename and PAPER_JAR.match(name) and os.path.isfile(os.path.join(dest_folder, name)):
+            changes.append(Change(name, "remove", f"replaced by {ctx.filename}"))
+    return changes, sha256
+
+
+def update(ctx: SetupContext, dry_run: bool = False, max_workers: int = 4) -> SetupContext:
+    """
+    It updates the existing server of the context to its spec, see the module docstring. The
+    changes are listed in ctx.changes.
+
+    :param ctx: The context of the server, its folder must exist
+    :param dry_run: If the changes should only be listed, not made
+    :param max_workers: How many stages can run at once
+    :return: The context, with its trace, errors and changes.
+    """
+    spec = ctx.spec
+    dest_folder = spec.dest_folder
+    store = JarStore()
+    if not check_properties(ctx):
+        ctx.finish()
+        return ctx
+
+    def inspect(results: dict):
+        if not os.path.isdir(dest_folder):
+            ctx.error(f"{dest_folder} doesn't exist, there is no server to update")
+
+    def reconcile_jar(results: dict):
+        changes, sha256 = plan_jar(ctx, store)
+        ctx.changes += changes
+        if dry_run:
+            return
+        if any(change.path == ctx.filename for change in changes):
+            ctx.trace.set_bytes("jar", download(ctx.url, dest_folder, ctx, sha256, "jar", spec.download_segments))
+            if ctx.stage_errors:
+                return # the old jar is kept
+        for change in changes:
+            if change.action == "remove":
+                os.remove(os.path.join(dest_folder, change.path))
+
+    def reconcile_config(results: dict):
+        properties = ServerProperties.parse(read_text(os.path.join(dest_folder, "server.properties")) or "")
+        properties.patch({**spec.properties, **rcon_properties(spec, properties)})
+        files = {"server.properties": properties.dumps()}
+        if spec.accept_eula:
+            files["eula.txt"] = "eula=true"
+        for name, content in files.items():
+            change = text_change(name, read_text(os.path.join(dest_folder, name)), content)
+            if change:
+                ctx.changes.append(change)
+                if not dry_run:
+                    write_file(os.path.join(dest_folder, name), content)
+
+    def reconcile_start_files(results: dict):
+        start_files = render_start_files(ctx, results["java"])
+        if start_files is None:
+            return
+        changed = []
+        for name, content in start_files.items():
+            change = text_change(name, read_text(os.path.join(dest_folder, name)), content)
+            if change:
+                ctx.changes.append(change)
+                changed.append(name)
+        if changed and not dry_run:
+            write_start_file(dest_folder, ctx, results["java"], changed)
+
+    stages = [
+        ctx.stage("inspect", "Reading the server...", inspect),
+        ctx.stage("java", "Looking for Java...", lambda results: find_java_runtime(ctx)),
+        ctx.stage("jar", "Checking the JAR file...", reconcile_jar, ("inspect",)),
+        ctx.stage("config", "Merging server.properties...", reconcile_config, ("inspect",)),
+        ctx.stage("start_file", "Checking the start files...", reconcile_start_files, ("inspect", "java", "jar")),
+    ]
+    try:
+        run_stages(stages, ctx.trace, max_workers)
+    except StageError:
+        pass # already in ctx.errors
+    except Exception as e:
+        ctx.error(f"Error updating the server: {e}")
+    ctx.changes.sort(key=lambda change: change.path)
+    ctx.finish()
+    return ctx
+
+
+def update_server(url, values: dict, bus: ProgressBus):
+    """
+    It updates the existing server chosen in the GUI to the values of the GUI.
+
+    :param url: The url of the server file
+    :param values: The values of the main window
+    :param bus: The progress bus of the GUI
+    """
+    update(SetupContext(spec_from_values(values), url, bus=bus))